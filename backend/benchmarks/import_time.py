@@ -0,0 +1,65 @@
+"""Measures the cold import time of the agent modules.
+
+Each module is imported in a fresh interpreter so that results are not skewed
+by modules cached from a previous import. Run from the ``backend`` directory:
+
+    python benchmarks/import_time.py --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ["agent.database", "agent.tools_and_schemas", "agent.graph", "agent.app"]
+HEAVY_MODULES = ["litellm", "fitz", "langchain_google_genai", "langchain_text_splitters"]
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def measure(module: str, repeat: int) -> tuple[list[float], list[str]]:
+    """Import ``module`` ``repeat`` times in fresh interpreters."""
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    timings, heavy = [], []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip().splitlines()[-1]
+        elapsed, loaded = out.split(" ", 1) if " " in out else (out, "")
+        timings.append(float(elapsed))
+        heavy = [m for m in loaded.split(",") if m]
+    return timings, heavy
+
+
+def main() -> None:
+    """Print median/min import time per module and any heavy modules pulled in."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<28}{'median (s)':>12}{'min (s)':>10}  heavy modules loaded")
+    for module in args.modules:
+        timings, heavy = measure(module, args.repeat)
+        print(
+            f"{module:<28}{statistics.median(timings):>12.3f}{min(timings):>10.3f}  "
+            f"{', '.join(heavy) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
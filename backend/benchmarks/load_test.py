@@ -0,0 +1,231 @@
+"""Drives the LangGraph API with concurrent research sessions and reports capacity numbers.
+
+Each session creates a thread, starts a run of the ``agent`` graph and polls
+it to completion, the way the frontend does. Sessions arrive as a Poisson
+process at ``--rate`` per second (or back to back when the rate is 0) and at
+most ``--concurrency`` are in flight; latencies are measured from the
+scheduled arrival, so time spent waiting for a free slot is not hidden.
+
+Start the API against local stand-ins for every external service first
+(see ``benchmarks/loadtest_stubs.py``), from the repository root::
+
+    docker compose -f docker-compose.yml -f docker-compose.loadtest.yml up -d --build
+
+Then, from the ``backend`` directory::
+
+    python benchmarks/load_test.py --sessions 200 --concurrency 20 --rate 2
+
+The report gives p50/p95/p99 and errors per phase, the agent's SQLAlchemy
+pool usage scraped from ``/metrics`` and, with ``--postgres-uri``, the
+server-wide connection count from ``pg_stat_activity``.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+from langgraph_sdk import get_client
+
+from agent.metrics import quantile
+
+PHASES = ["client_wait", "create_thread", "create_run", "queued", "running", "total"]
+TERMINAL_STATUSES = {"success", "error", "timeout", "interrupted"}
+
+
+@dataclass
+class LoadTestResults:
+    """Latencies and errors per phase plus the resource samples taken during the test."""
+
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    run_statuses: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    pool_samples: List[float] = field(default_factory=list)
+    pool_exhausted: Optional[float] = None
+    pg_connections: List[int] = field(default_factory=list)
+    pg_max_connections: Optional[int] = None
+    duration: float = 0.0
+
+
+async def run_session(client, args, topic: str, arrival: float, results: LoadTestResults) -> None:
+    """Run one research session and record how long each phase took."""
+    start = time.monotonic()
+    results.latencies["client_wait"].append(start - arrival)
+    phase = "create_thread"
+    try:
+        thread = await client.threads.create()
+        results.latencies[phase].append(time.monotonic() - start)
+
+        phase = "create_run"
+        phase_start = time.monotonic()
+        run = await client.runs.create(
+            thread["thread_id"],
+            args.assistant,
+            input={"messages": [{"type": "human", "content": topic}]},
+        )
+        results.latencies[phase].append(time.monotonic() - phase_start)
+
+        phase = "queued"
+        phase_start = time.monotonic()
+        deadline = phase_start + args.run_timeout
+        status = run["status"]
+        while status == "pending":
+            await asyncio.sleep(args.poll_interval)
+            status = (await client.runs.get(thread["thread_id"], run["run_id"]))["status"]
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Run still pending after {args.run_timeout}s")
+        results.latencies[phase].append(time.monotonic() - phase_start)
+
+        phase = "running"
+        phase_start = time.monotonic()
+        while status not in TERMINAL_STATUSES:
+            await asyncio.sleep(args.poll_interval)
+            status = (await client.runs.get(thread["thread_id"], run["run_id"]))["status"]
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Run not finished after {args.run_timeout}s")
+        results.run_statuses[status] += 1
+        if status != "success":
+            results.errors[phase] += 1
+            return
+        results.latencies[phase].append(time.monotonic() - phase_start)
+        results.latencies["total"].append(time.monotonic() - arrival)
+    except Exception as e:
+        results.errors[phase] += 1
+        results.run_statuses[f"client error: {type(e).__name__}"] += 1
+
+
+async def sample_pool(args, results: LoadTestResults, stop: asyncio.Event) -> None:
+    """Scrape the agent's pool gauges from ``/metrics`` until ``stop`` is set."""
+    first_exhausted = None
+    failures = 0
+    async with httpx.AsyncClient(base_url=args.url, timeout=5.0) as http:
+        while not stop.is_set():
+            try:
+                snapshot = (await http.get("/metrics")).json()
+                gauges = snapshot.get("gauges", {})
+                capacity = gauges.get("db_pool_capacity")
+                if capacity:
+                    results.pool_samples.append(gauges.get("db_pool_checked_out", 0) / capacity)
+                exhausted = snapshot.get("counters", {}).get("db_pool_exhausted", 0.0)
+                first_exhausted = exhausted if first_exhausted is None else first_exhausted
+                results.pool_exhausted = exhausted - first_exhausted
+            except Exception as e:
+                failures += 1
+                if failures == 1:
+                    print(f"Metrics scrape failed; pool usage will be incomplete. Error: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), args.sample_interval)
+            except TimeoutError:
+                pass
+
+
+def sample_pg_connections(args, results: LoadTestResults, stop: asyncio.Event) -> None:
+    """Count the server's connections from ``pg_stat_activity`` until ``stop`` is set."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(args.postgres_uri, pool_size=1, max_overflow=0)
+    try:
+        with engine.connect() as conn:
+            results.pg_max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+            while not stop.is_set():
+                count = conn.execute(text("SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend'"))
+                results.pg_connections.append(int(count.scalar()))
+                conn.commit()
+                time.sleep(args.sample_interval)
+    finally:
+        engine.dispose()
+
+
+async def run_load_test(args, topics: List[str]) -> LoadTestResults:
+    """Run ``args.sessions`` sessions and return the measurements."""
+    results = LoadTestResults()
+    client = get_client(url=args.url)
+    slots = asyncio.Semaphore(args.concurrency)
+    rng = random.Random(args.seed)
+    stop = asyncio.Event()
+    samplers = [asyncio.create_task(sample_pool(args, results, stop))]
+    if args.postgres_uri:
+        samplers.append(asyncio.create_task(asyncio.to_thread(sample_pg_connections, args, results, stop)))
+
+    async def session(i: int, arrival: float) -> None:
+        async with slots:
+            await run_session(client, args, topics[i % len(topics)], arrival, results)
+
+    start = time.monotonic()
+    arrival = start
+    tasks = []
+    for i in range(args.sessions):
+        if args.rate > 0:
+            arrival += rng.expovariate(args.rate)
+            await asyncio.sleep(max(0.0, arrival - time.monotonic()))
+        else:
+            arrival = time.monotonic()
+        tasks.append(asyncio.create_task(session(i, arrival)))
+    await asyncio.gather(*tasks)
+    results.duration = time.monotonic() - start
+    stop.set()
+    await asyncio.gather(*samplers, return_exceptions=True)
+    return results
+
+
+def print_report(results: LoadTestResults, sessions: int) -> None:
+    """Print per-phase latency quantiles, error rates and pool saturation."""
+    print(f"{'phase':<14}{'count':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'errors':>8}{'error %':>9}")
+    for phase in PHASES:
+        values = results.latencies.get(phase, [])
+        attempts = len(values) + results.errors.get(phase, 0)
+        row = [quantile(values, q) for q in (0.50, 0.95, 0.99)]
+        cells = "".join(f"{v:>10.3f}" if v is not None else f"{'-':>10}" for v in row)
+        error_rate = 100 * results.errors.get(phase, 0) / attempts if attempts else 0.0
+        print(f"{phase:<14}{len(values):>8}{cells}{results.errors.get(phase, 0):>8}{error_rate:>8.1f}%")
+
+    succeeded = results.run_statuses.get("success", 0)
+    print(f"\n{succeeded}/{sessions} sessions succeeded in {results.duration:.1f}s "
+          f"({succeeded / results.duration if results.duration else 0:.2f} sessions/s)")
+    for status, count in sorted(results.run_statuses.items()):
+        print(f"  {status}: {count}")
+
+    if results.pool_samples:
+        saturated = sum(1 for s in results.pool_samples if s >= 1.0) / len(results.pool_samples)
+        print(
+            f"\nDB pool utilization: mean {100 * sum(results.pool_samples) / len(results.pool_samples):.0f}%, "
+            f"peak {100 * max(results.pool_samples):.0f}%, saturated in {100 * saturated:.0f}% of samples, "
+            f"{results.pool_exhausted or 0:.0f} checkouts took the last free connection"
+        )
+    else:
+        print("\nDB pool utilization: no samples (is /metrics reachable?)")
+    if results.pg_connections:
+        print(f"Postgres client connections: peak {max(results.pg_connections)} of {results.pg_max_connections}")
+
+
+def main() -> None:
+    """Parse arguments, run the load test and print the report."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8123", help="Base URL of the LangGraph API.")
+    parser.add_argument("--assistant", default="agent", help="Assistant or graph id to run.")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of research sessions to start.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Most sessions in flight at once.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Mean arrivals per second; 0 starts sessions back to back.")
+    parser.add_argument("--topics-file", help="File with one research topic per line.")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--run-timeout", type=float, default=600.0)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--postgres-uri", help="Also sample pg_stat_activity through this SQLAlchemy URL.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.topics_file:
+        with open(args.topics_file) as f:
+            topics = [line.strip() for line in f if line.strip()]
+    else:
+        topics = [f"load test topic {i}" for i in range(args.sessions)]
+    results = asyncio.run(run_load_test(args, topics))
+    print_report(results, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
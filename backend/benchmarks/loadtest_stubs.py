@@ -0,0 +1,156 @@
+"""The research graph with every external service replaced by a local stand-in.
+
+Load tests should measure the API container, its workers and its database,
+not Gemini, arXiv or Unpaywall quotas. Importing this module swaps the
+graph's LLM, embedding, search, Unpaywall, Zotero and PDF download clients
+for deterministic stubs that sleep for a lognormal latency around
+``LOADTEST_STUB_LATENCY_MS`` (default 50 ms) and exposes the patched
+``graph``. Point the API at it with::
+
+    LANGSERVE_GRAPHS='{"agent": "/deps/backend/benchmarks/loadtest_stubs.py:graph"}'
+
+as ``docker-compose.loadtest.yml`` does. Client-side rate limits are bypassed
+along with the clients they guard.
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import agent.graph
+from agent.database import EMBEDDING_DIMENSIONS
+
+STUB_LATENCY_MS = float(os.getenv("LOADTEST_STUB_LATENCY_MS", "50"))
+PAPERS_PER_SEARCH = int(os.getenv("LOADTEST_PAPERS_PER_SEARCH", "3"))
+PDF_PAGES = int(os.getenv("LOADTEST_PDF_PAGES", "3"))
+
+
+def stub_latency() -> None:
+    """Sleep like a remote call, with a median of ``STUB_LATENCY_MS``."""
+    if STUB_LATENCY_MS > 0:
+        time.sleep(random.lognormvariate(0.0, 0.5) * STUB_LATENCY_MS / 1000)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic unit vectors derived from a hash of each text."""
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _vector(self, text: str) -> List[float]:
+        rng = np.random.default_rng(int(_digest(text)[:16], 16))
+        vector = rng.standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of documents."""
+        stub_latency()
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query."""
+        stub_latency()
+        return self._vector(text)
+
+
+class StubSearchTool:
+    """A literature source returning ``PAPERS_PER_SEARCH`` distinct papers per query."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def invoke(self, query: str) -> Dict[str, Any]:
+        """Return search hits shaped like the real tools' output."""
+        stub_latency()
+        documents = []
+        for i in range(PAPERS_PER_SEARCH):
+            key = _digest(f"{self.name}:{query}:{i}")[:12]
+            documents.append(
+                Document(
+                    page_content=(
+                        f"Title: Stub paper {key}\n"
+                        f"Abstract {key}: findings on {query} reported by {self.name}, "
+                        f"including measurements {key[:6]} and {key[6:]}. DOI: 10.5555/{key}"
+                    )
+                )
+            )
+        return {"documents": documents}
+
+
+class StubTool:
+    """Any tool exposing ``invoke`` that answers with a fixed function."""
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def invoke(self, arg: Any) -> Any:
+        """Return the stubbed answer."""
+        stub_latency()
+        return self.answer(arg)
+
+
+def stub_completion(**kwargs: Any) -> Any:
+    """Answer the graph's three prompt kinds: queries, reflection and report."""
+    stub_latency()
+    prompt = kwargs["messages"][-1]["content"]
+    response_format = kwargs.get("response_format") or {}
+    properties = response_format.get("schema", {}).get("properties", {})
+    if "query" in properties:
+        seed = _digest(prompt)[:8]
+        content = json.dumps({"query": [f"stub query {seed} {i}" for i in range(3)], "rationale": "stub"})
+    elif "is_sufficient" in properties:
+        content = json.dumps({"is_sufficient": True, "knowledge_gap": "", "follow_up_queries": []})
+    else:
+        content = f"Stub report over {len(prompt)} characters of context."
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _stub_pdf(url: str) -> bytes:
+    import fitz
+
+    doc = fitz.open()
+    for page_number in range(PDF_PAGES):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{url} page {page_number}\n" + "Stub full text. " * 40)
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def stub_get(url: str, *args: Any, **kwargs: Any) -> Any:
+    """Download a small generated PDF."""
+    stub_latency()
+    return SimpleNamespace(content=_stub_pdf(url), status_code=200, raise_for_status=lambda: None)
+
+
+def install_stubs() -> None:
+    """Replace the graph module's external clients with the stubs."""
+    embeddings = StubEmbeddings()
+    agent.graph.completion = stub_completion
+    agent.graph.get_embeddings = lambda: embeddings
+    agent.graph.get_similarity_embeddings = lambda: embeddings
+    agent.graph.get_query_embeddings = lambda: embeddings
+    agent.graph.arxiv_tool = StubSearchTool("arxiv")
+    agent.graph.pubmed_tool = StubSearchTool("pubmed")
+    agent.graph.semantic_scholar_tool = StubSearchTool("semantic_scholar")
+    agent.graph.unpaywall_tool = StubTool(
+        lambda doi: f"Open access version found! Status: gold. URL: http://stub.local/pdf/{doi}.pdf"
+    )
+    agent.graph.zotero_tool = StubTool(lambda paper_info: "Added to Zotero (stub).")
+    agent.graph.requests = SimpleNamespace(get=stub_get)
+
+
+install_stubs()
+graph = agent.graph.graph
@@ -0,0 +1,135 @@
+"""Compares exact, halfvec and binary-quantized vector search.
+
+Inserts ``--documents`` random unit vectors into a scratch collection and
+``--other-documents`` into another, builds each mode's index and runs
+``--queries`` searches filtered to the scratch collection, as the agent
+filters by ``collection_id``. HNSW applies that filter after the index scan,
+so the other collection makes recall depend on how far the scan is widened.
+Recall@k is measured against an exact scan of the scratch collection;
+memory is the on-disk size of each index.
+Needs pgvector >= 0.7 and ``POSTGRES_URI``. Run from the ``backend`` directory:
+
+    python benchmarks/quantization.py --documents 20000 --k 10
+"""
+
+import argparse
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import text
+
+from agent.database import (
+    EMBEDDING_DIMENSIONS,
+    QUANTIZED_INDEXES,
+    Document,
+    SessionLocal,
+    get_engine,
+    init_db,
+    query_documents,
+)
+from agent.metrics import quantile
+
+EXACT_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_documents_embedding_hnsw ON documents "
+    "USING hnsw (embedding vector_cosine_ops)"
+)
+INDEX_NAMES = {
+    None: "ix_documents_embedding_hnsw",
+    "halfvec": "ix_documents_embedding_halfvec",
+    "binary": "ix_documents_embedding_binary",
+}
+
+
+def random_unit_vectors(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Return ``n`` random float32 unit vectors."""
+    vectors = rng.standard_normal((n, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_corpus(vectors: np.ndarray, collection_id: str) -> None:
+    """Bulk-inserts the vectors as documents of ``collection_id``."""
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(
+            Document,
+            [
+                {"content": f"doc {i}", "embedding": vector.tolist(), "collection_id": collection_id}
+                for i, vector in enumerate(vectors)
+            ],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def index_size(name: str) -> int:
+    """Return the on-disk size of an index in bytes."""
+    with get_engine().connect() as connection:
+        return connection.execute(text("SELECT pg_relation_size(CAST(:name AS regclass))"), {"name": name}).scalar()
+
+
+def main() -> None:
+    """Print recall@k, latency percentiles and index size per mode."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument(
+        "--other-documents", type=int, default=None, help="Documents in another collection; 4x --documents by default."
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=None, help="Candidates re-ranked per query.")
+    parser.add_argument("--modes", default="full,halfvec,binary")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus = random_unit_vectors(rng, args.documents)
+    queries = random_unit_vectors(rng, args.queries)
+    modes = [None if mode == "full" else mode for mode in args.modes.split(",")]
+    collection_id = f"benchmark-{uuid.uuid4()}"
+    other_collection_id = f"benchmark-other-{uuid.uuid4()}"
+    other_documents = 4 * args.documents if args.other_documents is None else args.other_documents
+
+    # Ground truth from an exact scan over the in-memory copy
+    contents = np.array([f"doc {i}" for i in range(args.documents)])
+    truth = [set(contents[np.argsort(-(corpus @ q))[: args.k]]) for q in queries]
+
+    init_db()
+    load_corpus(corpus, collection_id)
+    load_corpus(random_unit_vectors(rng, other_documents), other_collection_id)
+    try:
+        with get_engine().connect() as connection:
+            for mode in modes:
+                connection.execute(text(QUANTIZED_INDEXES[mode] if mode else EXACT_INDEX))
+            connection.commit()
+
+        print(f"{'mode':<10}{'recall@k':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'index MB':>10}")
+        for mode in modes:
+            latencies, recalls = [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                results = query_documents(
+                    query.tolist(),
+                    k=args.k,
+                    collection_id=collection_id,
+                    quantization=mode,
+                    candidates=args.candidates,
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected & {r.content for r in results}) / args.k)
+            size_mb = index_size(INDEX_NAMES[mode]) / 2**20
+            print(
+                f"{mode or 'full':<10}{np.mean(recalls):>10.3f}"
+                f"{quantile(latencies, 0.50):>10.1f}{quantile(latencies, 0.95):>10.1f}"
+                f"{quantile(latencies, 0.99):>10.1f}{size_mb:>10.1f}"
+            )
+    finally:
+        db = SessionLocal()
+        db.query(Document).filter(Document.collection_id.in_([collection_id, other_collection_id])).delete()
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compares research-run duration with and without hedged lookups.
+
+A simulated run performs ``--lookups`` sequential idempotent lookups (like the
+per-DOI Unpaywall calls). Each lookup usually takes ~50 ms but, with
+probability ``--slow-rate``, stalls for ``--slow-seconds``. Hedging sends a
+duplicate after the host's observed p95, so a stall only costs that delay.
+Run from the ``backend`` directory:
+
+    python benchmarks/tail_latency.py --runs 200
+"""
+
+import argparse
+import random
+import time
+
+from agent.metrics import metrics, quantile
+from agent.resilience import call_with_resilience
+
+
+def simulated_lookup(rng: random.Random, slow_rate: float, slow_seconds: float) -> str:
+    """Sleep for a long-tailed latency and return."""
+    delay = rng.lognormvariate(-3.0, 0.3)  # median ~50 ms
+    if rng.random() < slow_rate:
+        delay += slow_seconds
+    time.sleep(delay)
+    return "ok"
+
+
+def run_once(host: str, hedge: bool, lookups: int, rng: random.Random, args) -> float:
+    """Return the duration of one simulated run."""
+    start = time.monotonic()
+    for _ in range(lookups):
+        call_with_resilience(host, simulated_lookup, rng, args.slow_rate, args.slow_seconds, hedge=hedge)
+    return time.monotonic() - start
+
+
+def main() -> None:
+    """Print p50/p95/p99 run duration for plain and hedged lookups."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--lookups", type=int, default=10)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'hedges':>10}")
+    for mode, hedge in (("plain", False), ("hedged", True)):
+        host = f"benchmark-{mode}"
+        rng = random.Random(args.seed)
+        durations = [run_once(host, hedge, args.lookups, rng, args) for _ in range(args.runs)]
+        print(
+            f"{mode:<10}{quantile(durations, 0.50):>10.3f}{quantile(durations, 0.95):>10.3f}"
+            f"{quantile(durations, 0.99):>10.3f}{int(metrics.counter('hedges_sent', host=host)):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
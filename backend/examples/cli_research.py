@@ -1,12 +1,38 @@
 import argparse
+import json
 from langchain_core.messages import HumanMessage
-from agent.graph import graph
+
+
+def run_batch(topics_file: str, concurrency: int) -> None:
+    """Run every topic in the file and print per-run results and throughput."""
+    from agent.batch import BatchScheduler
+
+    with open(topics_file) as f:
+        topics = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    status = BatchScheduler(max_concurrency=concurrency).run(topics)
+    for run in status["runs"]:
+        print(json.dumps(run))
+    print(
+        f"{status['completed']} completed, {status['failed']} failed in "
+        f"{status['elapsed_seconds']:.1f}s ({status['runs_per_hour']:.1f} runs/hour)"
+    )
+    print(f"Shared work: {json.dumps(status['shared_work'])}")
 
 
 def main() -> None:
     """Run the research agent from the command line."""
     parser = argparse.ArgumentParser(description="Run the LangGraph research agent")
-    parser.add_argument("question", help="Research question")
+    parser.add_argument("question", nargs="?", help="Research question")
+    parser.add_argument(
+        "--topics-file",
+        help="File with one research topic per line, run as a batch",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent runs in batch mode",
+    )
     parser.add_argument(
         "--initial-queries",
         type=int,
@@ -26,6 +52,14 @@ def main() -> None:
     )
     args = parser.parse_args()
 
+    if args.topics_file:
+        run_batch(args.topics_file, args.concurrency)
+        return
+    if not args.question:
+        parser.error("a research question or --topics-file is required")
+
+    from agent.graph import graph
+
     state = {
         "messages": [HumanMessage(content=args.question)],
         "initial_search_query_count": args.initial_queries,
@@ -1,3 +1,11 @@
-from agent.graph import graph
-
 __all__ = ["graph"]
+
+
+def __getattr__(name: str):
+    # Import the compiled graph on first access so that importing a submodule
+    # (e.g. ``agent.database``) does not build the whole graph.
+    if name == "graph":
+        from agent.graph import graph
+
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
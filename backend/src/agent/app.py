@@ -1,10 +1,98 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import os
 import pathlib
-from fastapi import FastAPI, Response
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Response
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from agent.static_files import PrecompressedStaticFiles
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Optionally warms up the lazy providers when the worker starts."""
+    if os.getenv("AGENT_WARMUP", "").lower() in ("1", "true", "yes"):
+        from agent.providers import warmup
+
+        await run_in_threadpool(warmup)
+    yield
+
 
 # Define the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Return the in-process metrics (circuit breakers, hedging, latencies)."""
+    from agent.metrics import metrics
+
+    return metrics.snapshot()
+
+
+class BatchRequest(BaseModel):
+    """Topics to research as one batch."""
+
+    topics: List[str] = Field(description="Research topics, one run per topic.")
+
+
+@app.post("/batches", status_code=202)
+def submit_batch(request: BatchRequest):
+    """Queues a batch of research runs and returns its id."""
+    from agent.batch import get_batch_scheduler
+
+    scheduler = get_batch_scheduler()
+    try:
+        batch_id = scheduler.submit(request.topics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"batch_id": batch_id, "total": scheduler.status(batch_id)["total"]}
+
+
+@app.get("/batches/{batch_id}")
+def get_batch(batch_id: str):
+    """Return the progress, throughput and per-run results of a batch."""
+    from agent.batch import get_batch_scheduler
+
+    status = get_batch_scheduler().status(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch '{batch_id}'.")
+    return status
+
+
+class JobRequest(BaseModel):
+    """A research run to queue."""
+
+    topic: str = Field(description="Research topic.")
+    tenant: str = Field(default="default", description="Tenant whose concurrency cap applies.")
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(request: JobRequest):
+    """Queues a research run at interactive priority, or rejects it with 429 when the queue is full."""
+    from agent.jobqueue import PRIORITY_INTERACTIVE, QueueFullError, get_job_dispatcher
+
+    try:
+        job = get_job_dispatcher().submit(
+            {"topic": request.topic}, tenant=request.tenant, priority=PRIORITY_INTERACTIVE
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Return the status and, once finished, the result of a queued run."""
+    from agent.jobqueue import get_job_queue
+
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'.")
+    return job.to_dict()
 
 
 def create_frontend_router(build_dir="../frontend/dist"):
@@ -14,7 +102,9 @@ def create_frontend_router(build_dir="../frontend/dist"):
         build_dir: Path to the React build directory relative to this file.
 
     Returns:
-        A Starlette application serving the frontend.
+        A Starlette application serving the frontend, with the ``.br``/``.gz``
+        variants written by ``npm run build`` and cache headers for the
+        hashed assets.
     """
     build_path = pathlib.Path(__file__).parent.parent.parent / build_dir
 
@@ -34,7 +124,7 @@ def create_frontend_router(build_dir="../frontend/dist"):
 
         return Route("/{path:path}", endpoint=dummy_frontend)
 
-    return StaticFiles(directory=build_path, html=True)
+    return PrecompressedStaticFiles(directory=build_path, html=True)
 
 
 # Mount the frontend under /app to not conflict with the LangGraph API routes
@@ -0,0 +1,263 @@
+"""Batch research runs: submission, scheduling and progress through the job queue."""
+
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.jobqueue import (
+    PRIORITY_BATCH,
+    RESULT_KEYS,
+    InMemoryJobQueue,
+    JobDispatcher,
+    QueueFullError,
+    get_job_dispatcher,
+)
+from agent.metrics import metrics
+from agent.work_cache import DEFAULT_MAX_BYTES, WORK_CACHE_KEY, SharedWorkCache
+
+DEFAULT_BATCH_CONCURRENCY = 4
+# Seconds a finished batch's status stays available
+DEFAULT_BATCH_TTL = 3600.0
+# Payload kind and tenant of the jobs batch runs are queued as
+BATCH_JOB_KIND = "batch_run"
+BATCH_TENANT = "batch"
+FINISHED = ("completed", "failed")
+
+
+@dataclass
+class RunResult:
+    """Outcome of one research run in a batch."""
+
+    topic: str
+    status: str = "pending"  # pending, queued, running, completed or failed
+    report: Optional[str] = None
+    error: Optional[str] = None
+    seconds: Optional[float] = None
+    collection_id: Optional[str] = None
+    topic_cache_hit: Optional[bool] = None
+    job_id: Optional[str] = None
+
+
+@dataclass
+class Batch:
+    """Research runs submitted together; they share one work cache.
+
+    The cache is dropped once the last run finishes, keeping only its stats.
+    """
+
+    id: str
+    runs: List[RunResult]
+    cache: Optional[SharedWorkCache] = field(default_factory=SharedWorkCache)
+    shared_work: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+    # Unix time, from which the runs' deadlines count
+    submitted_at: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+def run_research(topic: str, config: RunnableConfig, submitted_at: Optional[float] = None) -> Dict[str, Any]:
+    """Run the research graph for one topic and return its final state.
+
+    ``submitted_at`` is when the run was requested; its deadline counts from then.
+    """
+    from langchain_core.messages import HumanMessage
+
+    from agent.graph import graph
+
+    return graph.invoke({"messages": [HumanMessage(content=topic)], "submitted_at": submitted_at}, config=config)
+
+
+class BatchScheduler:
+    """Runs batches of research topics through the job queue.
+
+    Runs are queued at ``PRIORITY_BATCH`` under the ``batch`` tenant, so
+    queued interactive runs are claimed first and batch runs hold at most the
+    queue's per-tenant share of its slots. At most ``max_concurrency`` runs of
+    all batches are in the queue at once; the rest wait here, so a large
+    batch neither fills the queue nor is rejected by it. Runs of a batch that
+    this process executes share a ``SharedWorkCache``, so overlapping
+    searches, Unpaywall lookups, PDF downloads and embeddings are done once
+    per batch, keeping at most ``cache_bytes`` of results per batch.
+    Finished batches are forgotten ``ttl`` seconds after their last run.
+
+    Without a ``dispatcher`` the scheduler runs its batches on a private
+    in-process queue with ``max_concurrency`` workers.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        run_fn: Callable[[str, RunnableConfig, Optional[float]], Dict[str, Any]] = run_research,
+        ttl: float = DEFAULT_BATCH_TTL,
+        dispatcher: Optional[JobDispatcher] = None,
+        poll_interval: float = 0.5,
+        cache_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.max_concurrency = max_concurrency
+        self.ttl = ttl
+        self.cache_bytes = cache_bytes
+        self._run_fn = run_fn
+        self._poll_interval = poll_interval
+        if dispatcher is None:
+            queue = InMemoryJobQueue(tenant_concurrency=max_concurrency, max_running=max_concurrency)
+            dispatcher = JobDispatcher(queue, self._run_job, workers=max_concurrency, poll_interval=poll_interval)
+        dispatcher.register(BATCH_JOB_KIND, self._run_job)
+        self._dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._batches: Dict[str, Batch] = {}
+        threading.Thread(target=self._poll, name="batch-poll", daemon=True).start()
+
+    def submit(self, topics: List[str]) -> str:
+        """Queue one run per topic and return the batch id."""
+        topics = [t.strip() for t in topics if t and t.strip()]
+        if not topics:
+            raise ValueError("A batch needs at least one topic.")
+        batch = Batch(
+            id=str(uuid.uuid4()), runs=[RunResult(topic=t) for t in topics], cache=SharedWorkCache(self.cache_bytes)
+        )
+        with self._lock:
+            self._expire()
+            self._batches[batch.id] = batch
+            self._update()
+        metrics.inc("batch_runs_submitted", len(batch.runs))
+        print(f"Batch {batch.id}: queued {len(batch.runs)} runs.")
+        return batch.id
+
+    def _run_job(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            batch = self._batches.get(payload.get("batch_id"))
+        configurable = {"job_id": payload.get("job_id")}
+        # Runs claimed by another worker process go without the batch's cache
+        if batch is not None and batch.cache is not None:
+            configurable[WORK_CACHE_KEY] = batch.cache
+        state = self._run_fn(payload["topic"], {"configurable": configurable}, payload.get("submitted_at"))
+        return {key: state.get(key) for key in RESULT_KEYS}
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self._poll_interval)
+            try:
+                with self._lock:
+                    self._update()
+            except Exception as e:
+                print(f"Failed to update batches. Error: {e}")
+
+    def _update(self) -> None:
+        # Called with the lock held: reads finished jobs, then queues waiting runs
+        queue = self._dispatcher.queue
+        in_flight = 0
+        for batch in self._batches.values():
+            for run in batch.runs:
+                if run.job_id is None or run.status in FINISHED:
+                    continue
+                job = queue.get(run.job_id)
+                if job is None:
+                    run.status, run.error = "failed", "The run's job expired from the queue."
+                elif job.status in FINISHED:
+                    run.status, run.error = job.status, job.error
+                    result = job.result or {}
+                    run.report = result.get("report")
+                    run.collection_id = result.get("collection_id")
+                    run.topic_cache_hit = result.get("topic_cache_hit")
+                    run.seconds = job.finished_at - job.started_at
+                else:
+                    run.status = job.status
+                if run.status in FINISHED:
+                    if run.error:
+                        print(f"Batch {batch.id}: run for '{run.topic}' failed. Error: {run.error}")
+                    metrics.inc("batch_runs", status=run.status)
+                    if run.seconds is not None:
+                        metrics.observe("batch_run_seconds", run.seconds)
+                else:
+                    in_flight += 1
+        queue_full = False
+        for batch in self._batches.values():
+            for run in batch.runs:
+                if run.status != "pending" or queue_full or in_flight >= self.max_concurrency:
+                    continue
+                try:
+                    job = self._dispatcher.submit(
+                        {"kind": BATCH_JOB_KIND, "topic": run.topic, "batch_id": batch.id, "submitted_at": batch.submitted_at},
+                        tenant=BATCH_TENANT,
+                        priority=PRIORITY_BATCH,
+                    )
+                except QueueFullError:
+                    # Retried on the next poll
+                    queue_full = True
+                    continue
+                run.job_id, run.status = job.id, "queued"
+                in_flight += 1
+            if batch.finished is None and all(r.status in FINISHED for r in batch.runs):
+                # The cache holds the batch's PDF text and embeddings; only its stats outlive the runs
+                batch.shared_work = batch.cache.stats()
+                batch.cache = None
+                batch.finished = time.monotonic()
+                batch.done.set()
+
+    def _expire(self) -> None:
+        # Called with the lock held
+        now = time.monotonic()
+        expired = [i for i, b in self._batches.items() if b.finished is not None and now - b.finished > self.ttl]
+        for batch_id in expired:
+            del self._batches[batch_id]
+
+    def status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Return progress, throughput and per-run results, or None for an unknown batch."""
+        with self._lock:
+            self._expire()
+            batch = self._batches.get(batch_id)
+        if batch is None:
+            return None
+        cache = batch.cache
+        counts = {s: 0 for s in ("pending", "queued", "running", "completed", "failed")}
+        for run in batch.runs:
+            counts[run.status] += 1
+        elapsed = (batch.finished or time.monotonic()) - batch.started
+        finished_runs = counts["completed"] + counts["failed"]
+        return {
+            "batch_id": batch.id,
+            "done": batch.done.is_set(),
+            "total": len(batch.runs),
+            **counts,
+            "elapsed_seconds": elapsed,
+            "runs_per_hour": finished_runs / elapsed * 3600 if elapsed > 0 else 0.0,
+            "shared_work": cache.stats() if cache is not None else batch.shared_work,
+            "runs": [vars(run).copy() for run in batch.runs],
+        }
+
+    def wait(self, batch_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until the batch has finished (or ``timeout``) and return its status."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is None:
+            return None
+        batch.done.wait(timeout)
+        return self.status(batch_id)
+
+    def run(self, topics: List[str]) -> Dict[str, Any]:
+        """Submit a batch and wait for it to finish."""
+        return self.wait(self.submit(topics))
+
+
+@cache
+def get_batch_scheduler() -> BatchScheduler:
+    """Return the process-wide scheduler, which queues runs on the process-wide dispatcher.
+
+    ``BATCH_MAX_CONCURRENCY`` sets how many batch runs may be queued or
+    running at once, ``BATCH_TTL_SECONDS`` how long finished batches are
+    kept and ``BATCH_CACHE_MAX_BYTES`` how much of its shared work a batch
+    keeps.
+    """
+    return BatchScheduler(
+        int(os.getenv("BATCH_MAX_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY)),
+        ttl=float(os.getenv("BATCH_TTL_SECONDS", DEFAULT_BATCH_TTL)),
+        dispatcher=get_job_dispatcher(),
+        cache_bytes=int(os.getenv("BATCH_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    )
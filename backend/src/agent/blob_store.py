@@ -0,0 +1,304 @@
+"""Content-addressed storage of downloaded PDFs and their page text."""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import cache
+from typing import Iterable, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from agent.metrics import metrics
+
+load_dotenv()
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def sha256_hex(data: bytes) -> str:
+    """Return the hex sha256 of ``data``."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PageWriter:
+    """Writes a document's page text to the store as it is extracted.
+
+    Pages are appended to a temporary file, so no more than the pages passed
+    to one ``write`` are held in memory; readers see the text only after
+    ``commit``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, pages: Iterable[str]) -> None:
+        """Append pages."""
+        for page in pages:
+            self._file.write(json.dumps(page) + "\n")
+
+    def commit(self) -> None:
+        """Move the written text into place."""
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self) -> None:
+        """Drop the written text."""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+class BlobStore:
+    """Content-addressed on-disk store for downloaded PDFs and their page text.
+
+    Layout under ``root``::
+
+        urls/<sha256(url)>     content hash of the PDF last fetched from the URL
+        pdf/<hash>.pdf         raw PDF bytes
+        text/<hash>.jsonl      extracted text, one JSON string per page and line
+
+    Files are written to a temporary name and renamed into place, so worker
+    processes on the same host can read without locks. A read refreshes the
+    entry's mtime; when the store grows beyond ``max_bytes`` the least recently
+    used entries are evicted under an exclusive file lock, together with the
+    URL mappings that point at them.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        for name in ("urls", "pdf", "text"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.root, "urls", sha256_hex(url.encode("utf-8")))
+
+    def _pdf_path(self, content_hash: str) -> str:
+        return os.path.join(self.root, "pdf", f"{content_hash}.pdf")
+
+    def _text_path(self, content_hash: str) -> str:
+        return os.path.join(self.root, "text", f"{content_hash}.jsonl")
+
+    def _write(self, path: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _unlink(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def content_hash(self, url: str) -> Optional[str]:
+        """Return the hash of the PDF stored for ``url``, if any.
+
+        A mapping left pointing at an evicted PDF, e.g. one written while the
+        eviction ran, is deleted.
+        """
+        url_path = self._url_path(url)
+        data = self._read(url_path)
+        if not data:
+            return None
+        content_hash = data.decode()
+        if not os.path.exists(self._pdf_path(content_hash)):
+            self._unlink(url_path)
+            return None
+        return content_hash
+
+    def get_pdf(self, url: str) -> Optional[bytes]:
+        """Return the stored PDF for ``url``, or None."""
+        content_hash = self.content_hash(url)
+        return self._read(self._pdf_path(content_hash)) if content_hash else None
+
+    def get_pdf_path(self, url: str) -> Optional[str]:
+        """Return the path of the stored PDF for ``url``, or None.
+
+        Readers can open the file instead of loading its bytes; eviction may
+        delete it, so open it right away.
+        """
+        content_hash = self.content_hash(url)
+        if not content_hash:
+            return None
+        path = self._pdf_path(content_hash)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temporary_file(self):
+        """Return a binary file on the store's filesystem for ``put_file`` to move into place."""
+        return tempfile.NamedTemporaryFile(dir=os.path.join(self.root, "pdf"), prefix=".tmp-", delete=False)
+
+    def put_file(self, url: str, path: str, content_hash: str) -> str:
+        """Move a PDF already written to ``path`` into the store and map ``url`` to it.
+
+        Unlike ``put``, the PDF is never held in memory. Page text is added
+        separately with ``put_pages``.
+
+        Returns:
+            The content hash.
+        """
+        if os.path.exists(self._pdf_path(content_hash)):
+            os.unlink(path)
+        else:
+            os.replace(path, self._pdf_path(content_hash))
+        self._write(self._url_path(url), content_hash.encode())
+        self.evict()
+        return content_hash
+
+    def page_writer(self, url: str) -> PageWriter:
+        """Return a writer for the per-page text of the PDF already stored for ``url``."""
+        content_hash = self.content_hash(url)
+        if content_hash is None:
+            raise KeyError(f"No PDF stored for {url}")
+        return PageWriter(self._text_path(content_hash))
+
+    def put_pages(self, url: str, pages: Iterable[str]) -> None:
+        """Store the per-page text of the PDF already stored for ``url``."""
+        writer = self.page_writer(url)
+        try:
+            writer.write(pages)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit()
+
+    def iter_pages(self, url: str) -> Optional[Iterator[str]]:
+        """Return the stored per-page text of the PDF for ``url`` as a lazy iterator, or None.
+
+        Pages are read from disk as the iterator advances.
+        """
+        content_hash = self.content_hash(url)
+        try:
+            f = open(self._text_path(content_hash), encoding="utf-8") if content_hash else None
+        except FileNotFoundError:
+            f = None
+        if f is None:
+            metrics.inc("blob_store_lookups", result="miss")
+            return None
+        metrics.inc("blob_store_lookups", result="hit")
+        os.utime(f.fileno())
+
+        def pages() -> Iterator[str]:
+            with f:
+                for line in f:
+                    yield json.loads(line)
+
+        return pages()
+
+    def get_pages(self, url: str) -> Optional[List[str]]:
+        """Return the stored per-page text of the PDF for ``url``, or None."""
+        pages = self.iter_pages(url)
+        return None if pages is None else list(pages)
+
+    def put(self, url: str, content: bytes, pages: List[str]) -> str:
+        """Store a PDF and its page text under its content hash and map ``url`` to it.
+
+        Returns:
+            The content hash.
+        """
+        content_hash = sha256_hex(content)
+        if not os.path.exists(self._pdf_path(content_hash)):
+            self._write(self._pdf_path(content_hash), content)
+        self._write(self._url_path(url), content_hash.encode())
+        self.put_pages(url, pages)
+        self.evict()
+        return content_hash
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(os.path.join(self.root, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def size(self) -> int:
+        """Return the bytes used by stored PDFs and text."""
+        total = 0
+        for name in ("pdf", "text"):
+            with os.scandir(os.path.join(self.root, name)) as entries:
+                total += sum(e.stat().st_size for e in entries if e.is_file())
+        return total
+
+    def evict(self) -> int:
+        """Delete least recently used entries until the store fits ``max_bytes``.
+
+        Returns:
+            The number of entries evicted.
+        """
+        with self._locked():
+            entries = {}
+            for name in ("pdf", "text"):
+                with os.scandir(os.path.join(self.root, name)) as files:
+                    for f in files:
+                        if not f.is_file() or f.name.startswith(".tmp-"):
+                            continue
+                        stat = f.stat()
+                        content_hash = f.name.split(".")[0]
+                        size, last_used, paths = entries.get(content_hash, (0, 0.0, []))
+                        entries[content_hash] = (size + stat.st_size, max(last_used, stat.st_mtime), paths + [f.path])
+            total = sum(size for size, _, _ in entries.values())
+            evicted = set()
+            for content_hash, (size, _, paths) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                # Every file of the entry, including text stored in an earlier format
+                for path in paths:
+                    self._unlink(path)
+                total -= size
+                evicted.add(content_hash)
+            if evicted:
+                self._drop_mappings(evicted)
+        if evicted:
+            metrics.inc("blob_store_evictions", len(evicted))
+        return len(evicted)
+
+    def _drop_mappings(self, content_hashes: Set[str]) -> None:
+        # A mapping rewritten since its PDF was evicted may point at a PDF
+        # stored again by a concurrent put, so only unmap missing PDFs
+        with os.scandir(os.path.join(self.root, "urls")) as mappings:
+            for mapping in mappings:
+                if not mapping.is_file() or mapping.name.startswith(".tmp-"):
+                    continue
+                try:
+                    with open(mapping.path, "rb") as f:
+                        content_hash = f.read().decode()
+                except FileNotFoundError:
+                    continue
+                if content_hash in content_hashes and not os.path.exists(self._pdf_path(content_hash)):
+                    self._unlink(mapping.path)
+
+
+@cache
+def get_blob_store() -> BlobStore:
+    """Return the host-wide blob store.
+
+    ``BLOB_STORE_DIR`` sets its directory (shared by every worker that uses the
+    same path) and ``BLOB_STORE_MAX_BYTES`` its size cap.
+    """
+    root = os.getenv("BLOB_STORE_DIR", os.path.join(tempfile.gettempdir(), "agent-blobs"))
+    return BlobStore(root, int(os.getenv("BLOB_STORE_MAX_BYTES", DEFAULT_MAX_BYTES)))
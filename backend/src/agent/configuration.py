@@ -39,6 +39,193 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    search_sources: str = Field(
+        default="arxiv,pubmed,semantic_scholar",
+        metadata={
+            "description": "Comma-separated literature sources queried in parallel for every search query."
+        },
+    )
+
+    search_source_timeout: float = Field(
+        default=10.0,
+        metadata={
+            "description": "Seconds to wait for each search source before continuing without it."
+        },
+    )
+
+    query_similarity_threshold: float = Field(
+        default=0.92,
+        metadata={
+            "description": "Cosine similarity above which a follow-up query counts as a paraphrase of an executed query and is skipped."
+        },
+    )
+
+    near_duplicate_threshold: float = Field(
+        default=0.6,
+        metadata={
+            "description": "Estimated Jaccard similarity of abstract shingles above which two papers count as near-duplicates."
+        },
+    )
+
+    novelty_similarity_threshold: float = Field(
+        default=0.85,
+        metadata={
+            "description": "Cosine similarity to a collected abstract above which a new abstract does not count as novel."
+        },
+    )
+
+    novelty_floor: float = Field(
+        default=0.2,
+        metadata={
+            "description": "When the novel fraction of a follow-up search falls below this, the loop ends without another reflection call."
+        },
+    )
+
+    topic_cache_enabled: bool = Field(
+        default=True,
+        metadata={
+            "description": "Whether to reuse the corpus of a completed run on a near-identical research topic."
+        },
+    )
+
+    topic_cache_threshold: float = Field(
+        default=0.95,
+        metadata={
+            "description": "Cosine similarity between research topics above which a completed run is reused."
+        },
+    )
+
+    topic_cache_max_age_hours: float = Field(
+        default=72.0,
+        metadata={"description": "Only completed runs younger than this are reused."},
+    )
+
+    topic_cache_delta_search: bool = Field(
+        default=False,
+        metadata={
+            "description": "On a topic cache hit, run one search pass and ingest papers missing from the reused corpus."
+        },
+    )
+
+    retrieval_top_k: int = Field(
+        default=20,
+        metadata={
+            "description": "Number of chunks retrieved for the report by hybrid full-text and vector search."
+        },
+    )
+
+    retrieval_max_queries: int = Field(
+        default=8,
+        metadata={
+            "description": "Maximum number of query texts (the topic, the knowledge gap and the executed search queries) retrieved for together, in one embedding batch and one SQL statement, for the report."
+        },
+    )
+
+    vector_quantization: Optional[str] = Field(
+        default=None,
+        metadata={
+            "description": "Compact index ('halfvec' or 'binary') used for the vector candidate search before exact re-ranking; unset searches full-precision vectors."
+        },
+    )
+
+    vector_index: str = Field(
+        default="fallback",
+        metadata={
+            "description": "Use of the in-process vector index for report retrieval: 'primary' warms it after ingestion and answers from it (vector ranking only; once the collection is hot, Postgres is only asked for its row count every VECTOR_INDEX_CHECK_SECONDS), 'fallback' also warms it after ingestion but uses it only when hybrid retrieval fails, 'off' never builds it."
+        },
+    )
+
+    prefetch_top_k: int = Field(
+        default=0,
+        metadata={
+            "description": "New papers per search, those closest to the topic, whose full text is resolved and downloaded in the background while reflection runs; 0 disables speculative prefetch."
+        },
+    )
+
+    prefetch_max_papers: int = Field(
+        default=10,
+        metadata={"description": "Maximum papers prefetched per run, which bounds the downloads wasted on papers never ingested."},
+    )
+
+    ingestion_pipeline: bool = Field(
+        default=True,
+        metadata={
+            "description": "Whether PDFs are downloaded, embedded and stored as soon as resource management resolves their URLs, instead of after it finishes."
+        },
+    )
+
+    ingestion_queue_size: int = Field(
+        default=4,
+        metadata={"description": "Items each ingestion pipeline stage may hold before the stage feeding it waits."},
+    )
+
+    ingestion_download_workers: int = Field(
+        default=4,
+        metadata={"description": "PDFs the ingestion pipeline downloads and extracts at the same time."},
+    )
+
+    ingestion_memory_budget_mb: Optional[float] = Field(
+        default=None,
+        metadata={
+            "description": "When set, full texts are chunked, embedded and stored a page window at a time, and the window shrinks whenever the process's memory, shared by all runs in it, grows by more than this many MB during ingestion; unset ingests each PDF whole."
+        },
+    )
+
+    ingestion_page_window: int = Field(
+        default=8,
+        metadata={"description": "Pages read per window when ingesting in streaming mode."},
+    )
+
+    run_deadline_seconds: Optional[float] = Field(
+        default=None,
+        metadata={
+            "description": "Seconds from the start of a run by which its report must be produced; nodes degrade (fewer queries, skipped loops, fewer and shorter PDFs, a faster answer model) to meet it. Unset runs without a deadline."
+        },
+    )
+
+    deadline_report_reserve_seconds: float = Field(
+        default=30.0,
+        metadata={"description": "Seconds before the deadline kept free for report generation."},
+    )
+
+    deadline_max_pages: int = Field(
+        default=10,
+        metadata={"description": "Pages read per PDF once the deadline no longer leaves time to ingest full texts."},
+    )
+
+    deadline_answer_model: str = Field(
+        default="gemini-1.5-flash-8b",
+        metadata={
+            "description": "The faster language model that writes the report when the deadline is too close for the usual one."
+        },
+    )
+
+    profile_nodes: Optional[str] = Field(
+        default=None,
+        metadata={
+            "description": "Comma-separated graph nodes to run under the profiler, or '*' for every node; unset disables profiling."
+        },
+    )
+
+    profiler: str = Field(
+        default="sampling",
+        metadata={
+            "description": "'sampling' records wall-clock stacks (collapsed stacks and speedscope JSON); 'cprofile' records every call (pstats)."
+        },
+    )
+
+    profile_memory: bool = Field(
+        default=False,
+        metadata={
+            "description": "Whether profiled nodes also write tracemalloc snapshots of the allocations they make."
+        },
+    )
+
+    profile_dir: str = Field(
+        default="profiles",
+        metadata={"description": "Directory that receives one subdirectory of profiles per run."},
+    )
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
@@ -1,25 +1,158 @@
+import hashlib
 import os
 import uuid
-from sqlalchemy import create_engine, Column, Text, String
-from sqlalchemy.dialects.postgresql import UUID
+from functools import cache
+from sqlalchemy import create_engine, event, bindparam, cast, column, true, values, Column, Computed, DateTime, Index, Integer, LargeBinary, Text, String, func, select, union_all
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID, insert as pg_insert
 from sqlalchemy.orm import sessionmaker, declarative_base
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
 from dotenv import load_dotenv
 from sqlalchemy import text
 
-load_dotenv()
+from agent.metrics import metrics
 
-DATABASE_URL = os.getenv("POSTGRES_URI")
+load_dotenv()
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+EMBEDDING_DIMENSIONS = 1024
+
+
+# SQLAlchemy's QueuePool defaults
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_MAX_OVERFLOW = 10
+
+
+def instrument_pool(engine, capacity: int) -> None:
+    """Publish the engine's connection pool usage as metrics.
+
+    ``db_pool_checked_out`` and ``db_pool_capacity`` are gauges updated on
+    every checkout and checkin; ``db_pool_exhausted`` counts the checkouts that
+    took the last free connection, so saturation shows up even between scrapes.
+    """
+    metrics.set_gauge("db_pool_capacity", capacity)
+    metrics.set_gauge("db_pool_checked_out", 0)
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out = engine.pool.checkedout()
+        metrics.set_gauge("db_pool_checked_out", checked_out)
+        if checked_out >= capacity:
+            metrics.inc("db_pool_exhausted")
+
+    def on_checkin(dbapi_connection, connection_record):
+        # The pool still counts the connection being returned
+        metrics.set_gauge("db_pool_checked_out", max(0, engine.pool.checkedout() - 1))
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+
+@cache
+def get_engine():
+    """Return the shared engine, creating it from POSTGRES_URI on first use.
+
+    ``DB_POOL_SIZE`` and ``DB_POOL_MAX_OVERFLOW`` size its connection pool.
+    """
+    database_url = os.getenv("POSTGRES_URI")
+    if not database_url:
+        raise RuntimeError("POSTGRES_URI environment variable not set.")
+    pool_size = int(os.getenv("DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+    max_overflow = int(os.getenv("DB_POOL_MAX_OVERFLOW", DEFAULT_POOL_MAX_OVERFLOW))
+    engine = create_engine(database_url, pool_size=pool_size, max_overflow=max_overflow)
+    instrument_pool(engine, pool_size + max_overflow)
+    return engine
+
+
+@cache
+def get_sessionmaker():
+    """Return the shared session factory bound to the lazily created engine."""
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+def SessionLocal():
+    """Open a new session; kept callable like the former module-level factory."""
+    return get_sessionmaker()()
+
+
 class Document(Base):
     __tablename__ = "documents"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(1024))
+    embedding = Column(Vector(EMBEDDING_DIMENSIONS))
+    # The research run's corpus this chunk belongs to, and the URL it came from
+    collection_id = Column(String, index=True)
+    source_url = Column(Text)
+    # Maintained by Postgres for lexical (full-text) retrieval
+    content_tsv = Column(TSVECTOR, Computed("to_tsvector('english', content)", persisted=True))
+
+    __table_args__ = (
+        Index("ix_documents_content_tsv", "content_tsv", postgresql_using="gin"),
+    )
+
+
+class ResearchRun(Base):
+    """A completed research run, looked up by topic similarity to reuse its corpus."""
+
+    __tablename__ = "research_runs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    topic = Column(Text, nullable=False)
+    topic_embedding = Column(Vector())
+    collection_id = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class Abstract(Base):
+    """A search result rendered as text, stored once and referenced by id from the graph state."""
+
+    __tablename__ = "abstracts"
+    # sha256 of the content, so the same abstract found by several runs is stored once
+    id = Column(String(64), primary_key=True)
+    content = Column(Text, nullable=False)
+    # Dedupe keys, readable without loading the content
+    title_key = Column(Text)
+    doi = Column(Text)
+    # MinHash signature for near-duplicate detection
+    signature = Column(LargeBinary)
+    # Similarity embedding for the novelty of later search results
+    embedding = Column(Vector())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+# create_all does not alter existing tables, so columns added after a table was
+# first created are added here.
+MIGRATIONS = [
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS collection_id VARCHAR",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS source_url TEXT",
+    "CREATE INDEX IF NOT EXISTS ix_documents_collection_id ON documents (collection_id)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_documents_content_tsv ON documents USING gin (content_tsv)",
+    "ALTER TABLE abstracts ADD COLUMN IF NOT EXISTS signature BYTEA",
+    "ALTER TABLE abstracts ADD COLUMN IF NOT EXISTS embedding vector",
+]
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+
+# Compact indexes over the full-precision column (pgvector >= 0.7). Candidate
+# search orders by the same expression so that Postgres can use the index.
+QUANTIZED_INDEXES = {
+    "halfvec": (
+        "CREATE INDEX IF NOT EXISTS ix_documents_embedding_halfvec ON documents USING hnsw "
+        f"((embedding::halfvec({EMBEDDING_DIMENSIONS})) halfvec_cosine_ops)"
+    ),
+    "binary": (
+        "CREATE INDEX IF NOT EXISTS ix_documents_embedding_binary ON documents USING hnsw "
+        f"((binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS})) bit_hamming_ops)"
+    ),
+}
+# Candidates fetched from a quantized index per requested result
+QUANTIZED_OVERSAMPLE = {"halfvec": 2, "binary": 10}
+# pgvector's default and largest hnsw.ef_search, and the version that can resume a filtered scan
+HNSW_EF_SEARCH_DEFAULT = 40
+HNSW_EF_SEARCH_MAX = 1000
+ITERATIVE_SCAN_VERSION = (0, 8)
 
 def get_db_connection():
     db = SessionLocal()
@@ -29,16 +162,37 @@ def get_db_connection():
         db.close()
 
 def init_db():
+    engine = get_engine()
     with engine.connect() as connection:
         connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
         connection.commit()
     Base.metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        for statement in MIGRATIONS:
+            connection.execute(text(statement))
+        connection.commit()
+    quantization = os.getenv("VECTOR_QUANTIZATION")
+    if quantization:
+        create_quantized_index(quantization)
+
+def create_quantized_index(quantization: str):
+    """Create the compact index used for candidate search in ``quantization`` mode."""
+    if quantization not in QUANTIZED_INDEXES:
+        raise ValueError(f"Unknown vector quantization '{quantization}'. Expected one of {sorted(QUANTIZED_INDEXES)}.")
+    with get_engine().connect() as connection:
+        connection.execute(text(QUANTIZED_INDEXES[quantization]))
+        connection.commit()
 
-def insert_documents(documents: list):
+def insert_documents(documents: list, collection_id: str = None):
     db = SessionLocal()
     try:
         for doc_data in documents:
-            doc_obj = Document(content=doc_data["text"], embedding=doc_data["embedding"])
+            doc_obj = Document(
+                content=doc_data["text"],
+                embedding=doc_data["embedding"],
+                collection_id=collection_id,
+                source_url=doc_data.get("source_url"),
+            )
             db.add(doc_obj)
         db.commit()
     except Exception as e:
@@ -47,10 +201,280 @@ def insert_documents(documents: list):
     finally:
         db.close()
 
-def query_documents(query_embedding: list, k: int = 5):
+def abstract_id(content: str) -> str:
+    """Return the content-addressed id of an abstract."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def store_abstracts(abstracts: list) -> list:
+    """Store abstracts and return their ids in the same order.
+
+    Args:
+        abstracts: Dicts with ``content`` and optional ``title_key``, ``doi``,
+            ``signature`` and ``embedding``.
+    """
+    rows = {}
+    for abstract in abstracts:
+        content = abstract["content"]
+        rows[abstract_id(content)] = {
+            "id": abstract_id(content),
+            "content": content,
+            "title_key": abstract.get("title_key"),
+            "doi": abstract.get("doi"),
+            "signature": abstract.get("signature"),
+            "embedding": abstract.get("embedding"),
+        }
+    if rows:
+        db = SessionLocal()
+        try:
+            db.execute(pg_insert(Abstract).values(list(rows.values())).on_conflict_do_nothing(index_elements=["id"]))
+            db.commit()
+        finally:
+            db.close()
+    return [abstract_id(a["content"]) for a in abstracts]
+
+def load_abstracts(ids: list) -> list:
+    """Return the content of the abstracts with ``ids``, in order, in one query."""
+    if not ids:
+        return []
+    db = SessionLocal()
+    try:
+        contents = dict(db.query(Abstract.id, Abstract.content).filter(Abstract.id.in_(set(ids))).all())
+    finally:
+        db.close()
+    return [contents[i] for i in ids if i in contents]
+
+def load_abstract_keys(ids: list) -> set:
+    """Return the ``("title", key)`` and ``("doi", doi)`` dedupe keys of the abstracts with ``ids``."""
+    if not ids:
+        return set()
+    db = SessionLocal()
+    try:
+        rows = db.query(Abstract.title_key, Abstract.doi).filter(Abstract.id.in_(set(ids))).all()
+    finally:
+        db.close()
+    keys = set()
+    for title_key, doi in rows:
+        if title_key is not None:
+            keys.add(("title", title_key))
+        if doi:
+            keys.add(("doi", doi))
+    return keys
+
+def load_abstract_signatures(ids: list) -> list:
+    """Return the stored MinHash signatures (raw bytes) of the abstracts with ``ids``."""
+    if not ids:
+        return []
+    db = SessionLocal()
+    try:
+        rows = db.query(Abstract.signature).filter(Abstract.id.in_(set(ids)), Abstract.signature.isnot(None)).all()
+    finally:
+        db.close()
+    return [bytes(row.signature) for row in rows]
+
+def load_abstract_embeddings(ids: list) -> list:
+    """Return the stored similarity embeddings of the abstracts with ``ids``."""
+    if not ids:
+        return []
+    db = SessionLocal()
+    try:
+        rows = db.query(Abstract.embedding).filter(Abstract.id.in_(set(ids)), Abstract.embedding.isnot(None)).all()
+    finally:
+        db.close()
+    return [row.embedding for row in rows]
+
+@cache
+def pgvector_version() -> tuple:
+    """Return the installed pgvector version as a tuple of ints, or ``()`` if it is not installed."""
+    with get_engine().connect() as connection:
+        version = connection.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(part) for part in version.split(".")) if version else ()
+
+def widen_hnsw_search(db, candidates: int) -> None:
+    """Lets HNSW scans in the session's transaction return ``candidates`` rows after filtering.
+
+    HNSW applies ``WHERE`` filters such as ``collection_id`` after the index
+    scan, and the scan yields at most ``hnsw.ef_search`` rows (40 by
+    default). When the table holds several collections, most of those rows
+    may belong to other collections and the search silently returns fewer
+    candidates. ``ef_search`` is raised to ``candidates`` for the transaction.
+    On pgvector 0.8 and later, the scan also continues until enough rows
+    pass the filter.
+    """
+    ef_search = min(max(candidates, HNSW_EF_SEARCH_DEFAULT), HNSW_EF_SEARCH_MAX)
+    db.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"), {"value": str(ef_search)})
+    if pgvector_version() >= ITERATIVE_SCAN_VERSION:
+        db.execute(text("SELECT set_config('hnsw.iterative_scan', 'strict_order', true)"))
+
+def _quantized_distance(quantization: str, query_embedding):
+    query = query_embedding
+    if not isinstance(query_embedding, ColumnElement):
+        query = bindparam(None, query_embedding, type_=Vector(EMBEDDING_DIMENSIONS))
+    if quantization == "halfvec":
+        halfvec = HALFVEC(EMBEDDING_DIMENSIONS)
+        return cast(Document.embedding, halfvec).cosine_distance(cast(query, halfvec))
+    if quantization == "binary":
+        bit = BIT(EMBEDDING_DIMENSIONS)
+        return cast(func.binary_quantize(Document.embedding), bit).hamming_distance(
+            cast(func.binary_quantize(cast(query, Vector(EMBEDDING_DIMENSIONS))), bit)
+        )
+    raise ValueError(f"Unknown vector quantization '{quantization}'. Expected one of {sorted(QUANTIZED_INDEXES)}.")
+
+
+def nearest_documents(
+    query_embedding,
+    k: int,
+    filters: list = (),
+    quantization: str = None,
+    candidates: int = None,
+):
+    """Build a select of ``(id, distance)`` for the ``k`` nearest documents.
+
+    Without ``quantization`` this is an exact cosine search. With ``"halfvec"``
+    or ``"binary"``, ``candidates`` documents are first taken from the compact
+    index and then re-ranked by exact cosine distance against the
+    full-precision vectors, in the same statement. ``query_embedding`` may
+    also be a column, e.g. of a ``LATERAL`` subquery's outer query.
+    """
+    if quantization is None:
+        distance = Document.embedding.cosine_distance(query_embedding)
+        return select(Document.id, distance.label("distance")).where(*filters).order_by(distance).limit(k)
+    approximate = _quantized_distance(quantization, query_embedding)
+    candidates = candidates or k * QUANTIZED_OVERSAMPLE[quantization]
+    shortlist = (
+        select(Document.id, Document.embedding)
+        .where(*filters)
+        .order_by(approximate)
+        .limit(candidates)
+    )
+    # A column query embedding must stay correlated to the statement it comes from
+    shortlist = shortlist.lateral("shortlist") if isinstance(query_embedding, ColumnElement) else shortlist.subquery("shortlist")
+    distance = shortlist.c.embedding.cosine_distance(query_embedding)
+    return select(shortlist.c.id, distance.label("distance")).order_by(distance).limit(k)
+
+
+def query_documents(
+    query_embedding: list,
+    k: int = 5,
+    collection_id: str = None,
+    quantization: str = None,
+    candidates: int = None,
+):
+    db = SessionLocal()
+    try:
+        filters = [] if collection_id is None else [Document.collection_id == collection_id]
+        widen_hnsw_search(db, candidates or k * QUANTIZED_OVERSAMPLE.get(quantization, 1))
+        nearest = nearest_documents(query_embedding, k, filters, quantization, candidates).subquery("nearest")
+        return (
+            db.query(Document)
+            .join(nearest, Document.id == nearest.c.id)
+            .order_by(nearest.c.distance)
+            .all()
+        )
+    finally:
+        db.close()
+
+
+def hybrid_query_documents(
+    query_text: str,
+    query_embedding: list,
+    k: int = 5,
+    collection_id: str = None,
+    candidates: int = None,
+    rrf_k: int = RRF_K,
+    quantization: str = None,
+):
+    """Retrieve documents by fusing full-text and vector rankings.
+
+    The top ``candidates`` documents by cosine distance and by full-text rank
+    (``websearch_to_tsquery`` over ``content_tsv``) are fused with reciprocal
+    rank fusion, ``score = sum(1 / (rrf_k + rank))``, in a single SQL statement.
+    Exact terms such as gene or dataset names that embeddings miss are still
+    found by the lexical ranking. ``quantization`` selects the vector
+    candidate search as in ``nearest_documents``.
+
+    Returns:
+        Up to ``k`` ``(Document, score)`` pairs, best first.
+    """
+    return multi_query_documents(
+        [query_text], [query_embedding], k, collection_id, candidates, rrf_k, quantization
+    )
+
+
+def multi_query_documents(
+    query_texts: list,
+    query_embeddings: list,
+    k: int = 5,
+    collection_id: str = None,
+    candidates: int = None,
+    rrf_k: int = RRF_K,
+    quantization: str = None,
+):
+    """Retrieve documents for several queries in one statement, fusing all their rankings.
+
+    The queries are a ``VALUES`` list; for each one, ``LATERAL`` subqueries
+    take the top ``candidates`` documents by cosine distance and by full-text
+    rank, so every query still searches the vector and GIN indexes. The
+    rankings of all queries are fused with reciprocal rank fusion and
+    deduplicated by document before the top ``k`` are returned, in a single
+    round trip however many queries there are.
+
+    Returns:
+        Up to ``k`` ``(Document, score)`` pairs, best first.
+    """
+    if not query_texts:
+        return []
+    candidates = candidates or max(k * 4, 20)
+    filters = [] if collection_id is None else [Document.collection_id == collection_id]
+    queries = (
+        values(
+            column("query_id", Integer),
+            column("query_text", Text),
+            column("query_embedding", Vector(EMBEDDING_DIMENSIONS)),
+            name="queries",
+        )
+        .data([(i, text_, list(embedding)) for i, (text_, embedding) in enumerate(zip(query_texts, query_embeddings))])
+    )
+    # Both rankings read the queries; a CTE sends their embeddings once
+    queries = select(queries).cte("queries")
+
+    # VALUES leaves the embeddings untyped, so cast them for the distance operator
+    query_embedding = cast(queries.c.query_embedding, Vector(EMBEDDING_DIMENSIONS))
+    nearest = nearest_documents(query_embedding, candidates, filters, quantization).lateral("nearest")
+    tsquery = func.websearch_to_tsquery("english", queries.c.query_text)
+    lexical_rank = func.ts_rank_cd(Document.content_tsv, tsquery)
+    lexical = (
+        select(Document.id, lexical_rank.label("score"))
+        .where(Document.content_tsv.op("@@")(tsquery), *filters)
+        .order_by(lexical_rank.desc())
+        .limit(candidates)
+        .lateral("lexical")
+    )
+    hits = union_all(
+        select(
+            nearest.c.id,
+            func.row_number().over(partition_by=queries.c.query_id, order_by=nearest.c.distance).label("rank"),
+        ).select_from(queries.join(nearest, true())),
+        select(
+            lexical.c.id,
+            func.row_number().over(partition_by=queries.c.query_id, order_by=lexical.c.score.desc()).label("rank"),
+        ).select_from(queries.join(lexical, true())),
+    ).subquery("hits")
+    fused = (
+        select(hits.c.id, func.sum(1.0 / (rrf_k + hits.c.rank)).label("score"))
+        .group_by(hits.c.id)
+        .subquery("fused")
+    )
+    statement = (
+        select(Document, fused.c.score)
+        .join(fused, Document.id == fused.c.id)
+        .order_by(fused.c.score.desc())
+        .limit(k)
+    )
+
     db = SessionLocal()
     try:
-        results = db.query(Document).order_by(Document.embedding.cosine_distance(query_embedding)).limit(k).all()
-        return results
+        # Each query's vector search shortlists ``candidates`` documents, oversampled when quantized
+        widen_hnsw_search(db, candidates * QUANTIZED_OVERSAMPLE.get(quantization, 1))
+        return [(row[0], float(row[1])) for row in db.execute(statement).all()]
     finally:
         db.close()
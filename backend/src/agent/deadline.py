@@ -0,0 +1,82 @@
+"""Per-run deadlines and the record of what a run skipped to meet them."""
+
+import time
+from typing import Optional
+
+from agent.metrics import metrics
+
+# Typical node durations, used until enough runs have been observed
+DEFAULT_NODE_SECONDS = {
+    "check_topic_cache": 1.0,
+    "generate_initial_queries": 5.0,
+    "execute_searches": 15.0,
+    "reflection_and_refinement": 15.0,
+    "automated_resource_management": 30.0,
+    "rag_based_knowledge_synthesis": 30.0,
+    "automated_report_generation": 30.0,
+}
+# Typical time to download, embed and store one PDF
+DEFAULT_PDF_SECONDS = 10.0
+# Observed durations needed before they replace the defaults
+MIN_HISTORY = 3
+
+
+def deadline_from(configurable, start: Optional[float] = None) -> Optional[float]:
+    """Return the run's deadline as a Unix time, or None if it has none.
+
+    The deadline counts from ``start``, the Unix time the run was submitted,
+    or from now.
+    """
+    if configurable.run_deadline_seconds is None:
+        return None
+    return (time.time() if start is None else start) + configurable.run_deadline_seconds
+
+
+def remaining(state) -> Optional[float]:
+    """Return the seconds left until the run's deadline, or None without one."""
+    deadline = state.get("deadline")
+    return None if deadline is None else deadline - time.time()
+
+
+def available(state, configurable) -> Optional[float]:
+    """Return the seconds left for work other than the report, or None without a deadline."""
+    left = remaining(state)
+    return None if left is None else left - configurable.deadline_report_reserve_seconds
+
+
+def expected_seconds(*nodes: str) -> float:
+    """Estimate how long the nodes take together.
+
+    Each node counts with the 90th percentile of its recent durations
+    (``node_seconds``), or its default until ``MIN_HISTORY`` runs are seen.
+    """
+    total = 0.0
+    for node in nodes:
+        observed = metrics.quantile("node_seconds", 0.9, min_count=MIN_HISTORY, node=node)
+        total += DEFAULT_NODE_SECONDS.get(node, 0.0) if observed is None else observed
+    return total
+
+
+def affords(state, configurable, *nodes: str) -> bool:
+    """Whether the nodes are expected to finish before the time reserved for the report."""
+    left = available(state, configurable)
+    return left is None or left >= expected_seconds(*nodes)
+
+
+def pdf_budget(state, configurable):
+    """Return how many PDFs may still be ingested and the pages read from each.
+
+    Both are None (no limit) unless the expected resource management and
+    ingestion time no longer fits before the deadline.
+    """
+    if affords(state, configurable, "automated_resource_management", "rag_based_knowledge_synthesis"):
+        return None, None
+    left = max(0.0, available(state, configurable))
+    return int(left // DEFAULT_PDF_SECONDS), configurable.deadline_max_pages
+
+
+def degrade(action: str, detail: str) -> str:
+    """Count and print a degradation and return its record for the state's ``degradations``."""
+    metrics.inc("deadline_degradations", action=action)
+    print(f"Deadline: {detail}")
+    return f"{action}: {detail}"
@@ -1,16 +1,15 @@
 import os
 import re
+import uuid
+import numpy as np
 import requests
-import fitz  # PyMuPDF
+from itertools import islice
 from typing import List
-from agent.tools_and_schemas import SearchQueryList, Reflection, arxiv_tool, unpaywall_tool, zotero_tool
+from agent.tools_and_schemas import UNPAYWALL_ERROR_PREFIXES, SearchQueryList, SearchSourceError, Reflection, arxiv_tool, pubmed_tool, semantic_scholar_tool, unpaywall_tool, zotero_tool
 from dotenv import load_dotenv
 from langchain_core.messages import AIMessage
 from langgraph.graph import StateGraph, END, START
 from langchain_core.runnables import RunnableConfig
-from litellm import completion
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 
 from agent.prompts import (
@@ -19,62 +18,360 @@ from agent.prompts import (
     reflection_instructions,
     answer_instructions,
 )
+from agent.configuration import Configuration
+from agent.deadline import affords, available, deadline_from, degrade, expected_seconds, pdf_budget, remaining
+from agent.search import collapse_near_duplicates, federated_search, normalize_title, signature_text, text_dedupe_keys
+from agent.similarity import as_matrix, cosine_similarity_matrix, novelty, select_novel
 from agent.state import AgentState
-from agent.database import get_db_connection, Document
+from agent.topic_cache import find_cached_run, record_run
+from agent.blob_store import get_blob_store
+from agent.database import get_db_connection, multi_query_documents, load_abstract_embeddings, load_abstract_keys, load_abstract_signatures, load_abstracts, store_abstracts, Document
+from agent.ingestion import MemoryBudget, ingest_pdf_streaming
+from agent.metrics import metrics
+from agent.pipeline import Pipeline
+from agent.prefetch import get_prefetcher
+from agent.ratelimit import RateLimitTimeout
+from agent.profiling import profiled
+from agent.providers import completion, get_embeddings, get_query_embeddings, get_similarity_embeddings, get_text_splitter
+from agent.resilience import HTTP_TIMEOUT, call_with_resilience, host_of
+from agent.singleflight import CoalescedTool
+from agent.vector_index import get_vector_index_cache
+from agent.work_cache import CachedTool, cached_call, get_work_cache, texts_key
 
 load_dotenv()
 
 # Configuration
 MAX_RESEARCH_LOOPS = 3
-GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+# Nodes one more research loop runs, and those that ingest full text after the loop
+LOOP_NODES = ("execute_searches", "reflection_and_refinement")
+INGESTION_NODES = ("automated_resource_management", "rag_based_knowledge_synthesis")
+# Excerpts a report written without the language model quotes
+FALLBACK_EXCERPTS = 5
+# Seconds resource management waits for a prefetched DOI resolution before resolving it itself
+PREFETCH_WAIT_SECONDS = 5.0
 
-# Initialize tools and services
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-embeddings = GoogleGenerativeAIEmbeddings(model=GEMINI_EMBEDDING_MODEL, api_key=GEMINI_API_KEY)
 
 # Nodes
+def check_topic_cache(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Look for a completed run on a near-identical topic whose corpus can be reused."""
+    print("---NODE: check_topic_cache---")
+    configurable = Configuration.from_runnable_config(config)
+    research_topic = state['messages'][-1].content
+    update = {
+        "research_topic": research_topic,
+        "run_id": str(uuid.uuid4()),
+        "collection_id": str(uuid.uuid4()),
+        "topic_embedding": [],
+        "topic_cache_hit": False,
+        "delta_search": False,
+        # The clock starts when the run was submitted, so time spent queued counts
+        "deadline": deadline_from(configurable, state.get("submitted_at")),
+    }
+    if not configurable.topic_cache_enabled:
+        return update
+    try:
+        topic_embedding = [float(x) for x in get_similarity_embeddings().embed_documents([research_topic])[0]]
+        update["topic_embedding"] = topic_embedding
+        cached = find_cached_run(
+            topic_embedding,
+            configurable.topic_cache_threshold,
+            configurable.topic_cache_max_age_hours,
+        )
+    except Exception as e:
+        print(f"Topic cache lookup failed, researching from scratch. Error: {e}")
+        return update
+    if cached is None:
+        print("Topic cache miss.")
+        return update
+    print(f"Topic cache hit ({cached.similarity:.3f}): reusing corpus of '{cached.topic}'")
+    update.update(
+        collection_id=cached.collection_id,
+        topic_cache_hit=True,
+        delta_search=configurable.topic_cache_delta_search,
+    )
+    return update
+
+def route_after_topic_cache(state: AgentState) -> str:
+    """Conditional edge: go straight to the report on a cache hit without delta search."""
+    if state.get("topic_cache_hit") and not state.get("delta_search"):
+        return "automated_report_generation"
+    return "generate_initial_queries"
+
 def generate_initial_queries(state: AgentState, config: RunnableConfig) -> AgentState:
     """Generates the initial set of search queries based on the research topic."""
     print("---NODE: generate_initial_queries---")
+    configurable = Configuration.from_runnable_config(config)
     research_topic = state['messages'][-1].content
+    number_queries = configurable.number_of_initial_queries
+    degradations = []
+    if number_queries > 1 and not affords(state, configurable, "generate_initial_queries", "execute_searches", *INGESTION_NODES):
+        number_queries = 1
+        degradations.append(degrade("initial_queries", f"generating 1 search query instead of {configurable.number_of_initial_queries}"))
     prompt = query_writer_instructions.format(
         current_date=get_current_date(),
         research_topic=research_topic,
-        number_queries=3,
+        number_queries=number_queries,
     )
-    response = completion(
-        model="gemini/gemini-1.5-flash",
-        messages=[{"content": prompt, "role": "user"}],
-        response_format={"type": "json_object", "schema": SearchQueryList.model_json_schema()},
-        api_key=GEMINI_API_KEY
-    )
-    search_queries = SearchQueryList.model_validate_json(response.choices[0].message.content).query
+    try:
+        response = completion(
+            model="gemini/gemini-1.5-flash",
+            messages=[{"content": prompt, "role": "user"}],
+            response_format={"type": "json_object", "schema": SearchQueryList.model_json_schema()},
+            api_key=GEMINI_API_KEY
+        )
+        search_queries = SearchQueryList.model_validate_json(response.choices[0].message.content).query
+    except RateLimitTimeout as e:
+        print(f"Query generation was rate limited, searching for the topic itself. Error: {e}")
+        metrics.inc("rate_limit_fallbacks", node="generate_initial_queries")
+        search_queries = [research_topic]
+    if degradations:
+        search_queries = search_queries[:number_queries]
     print(f"Generated initial queries: {search_queries}")
     return {
         "research_topic": research_topic,
         "search_queries": search_queries,
         "research_loop_count": 0,
         "literature_abstracts": [],
+        "degradations": degradations,
+    }
+
+def _search_sources(names: str) -> dict:
+    """Map the configured source names to their search tools."""
+    tools = {
+        "arxiv": arxiv_tool,
+        "pubmed": pubmed_tool,
+        "semantic_scholar": semantic_scholar_tool,
     }
+    return {name: tools[name] for name in (n.strip() for n in names.split(",")) if name in tools}
+
+def _drop_paraphrased_queries(queries, executed, executed_embeddings, threshold):
+    """Drop queries that repeat or paraphrase an executed query.
+
+    All queries are embedded in one batch and compared to the executed ones in
+    one vectorized pass. If embedding fails, only exact repeats are dropped.
+
+    Returns:
+        The queries to run, their embeddings and the number of queries dropped.
+    """
+    unique = list(dict.fromkeys(q for q in queries if q not in executed))
+    kept, kept_embeddings = unique, []
+    if unique:
+        try:
+            query_embeddings = get_similarity_embeddings().embed_documents(unique)
+            if len(query_embeddings) != len(unique):
+                raise ValueError(f"Got {len(query_embeddings)} embeddings for {len(unique)} queries.")
+            novel, _ = select_novel(query_embeddings, executed_embeddings, threshold)
+            kept = [unique[i] for i in novel]
+            kept_embeddings = [[float(x) for x in query_embeddings[i]] for i in novel]
+        except Exception as e:
+            print(f"Query embedding failed, deduplicating by exact match only. Error: {e}")
+    return kept, kept_embeddings, len(queries) - len(kept)
+
+def _abstract_texts(state: AgentState) -> List[str]:
+    """Resolve the run's abstract ids in one batch, followed by any inline abstracts."""
+    return load_abstracts(state.get("abstract_ids", [])) + [str(a) for a in state.get("literature_abstracts", [])]
+
+def _measure_novelty(papers, prior_ids, threshold):
+    """Embeds new abstracts in one batch and scores their novelty against the collected ones.
+
+    Returns:
+        The novelty (None if it could not be computed) and one embedding per paper.
+    """
+    if not papers:
+        return 0.0, []
+    try:
+        embeddings = get_similarity_embeddings().embed_documents([signature_text(p) for p in papers])
+        if len(embeddings) != len(papers):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(papers)} abstracts.")
+        embeddings = [[float(x) for x in e] for e in embeddings]
+        return novelty(embeddings, load_abstract_embeddings(prior_ids), threshold), embeddings
+    except Exception as e:
+        print(f"Abstract embedding failed, novelty not measured. Error: {e}")
+        return None, [None] * len(papers)
+
+DOI_PATTERN = re.compile(r'10.\d{4,9}/[-._;()/:A-Z0-9]+', re.IGNORECASE)
+
+def _find_doi(text: str):
+    """Return the first DOI in ``text``, or None."""
+    match = DOI_PATTERN.search(text)
+    return match.group(0) if match else None
+
+def _unpaywall_lookup(doi: str) -> str:
+    """Run the Unpaywall tool and raise on a failed lookup, so that it is not cached as an answer."""
+    result = unpaywall_tool.invoke(doi)
+    if result.startswith(UNPAYWALL_ERROR_PREFIXES):
+        raise SearchSourceError(result)
+    return result
+
+def _resolve_pdf_url(config: RunnableConfig, doi: str):
+    """Return the open-access PDF URL Unpaywall knows for ``doi``, or None."""
+    try:
+        pdf_url_info = cached_call(config, "unpaywall", doi.lower(), _unpaywall_lookup, doi)
+    except SearchSourceError as e:
+        print(f"Unpaywall lookup for {doi} failed. Error: {e}")
+        return None
+    if "URL:" in pdf_url_info:
+        return pdf_url_info.split("URL: ")[1]
+    return None
+
+def _run_key(state: AgentState):
+    """Return the key of the run's background work: its run id, or its collection for states without one."""
+    return state.get("run_id") or state.get("collection_id")
+
+def _prefetched_url(config: RunnableConfig, doi: str, job):
+    """Return the PDF URL a prefetch resolved, and whether the prefetch was used.
+
+    A job still queued is cancelled, and one that has not finished within
+    ``PREFETCH_WAIT_SECONDS`` is left behind; either way the DOI is resolved
+    here, joining the prefetch's lookup if it is in flight.
+    """
+    if not job.cancel():
+        try:
+            return job.result(timeout=PREFETCH_WAIT_SECONDS), True
+        except Exception as e:
+            print(f"Prefetch of {doi} failed or is too slow, resolving it again. Error: {e!r}")
+    return _resolve_pdf_url(config, doi), False
+
+def _schedule_prefetch(state: AgentState, config: RunnableConfig, configurable: Configuration, papers, abstract_embeddings) -> int:
+    """Start fetching the full text of the new papers closest to the topic, while reflection runs.
+
+    Papers are ranked by the cosine similarity of their abstract to the
+    topic, or by search rank when either embedding is missing.
+
+    Returns:
+        The number of prefetches scheduled.
+    """
+    candidates = []
+    for rank, (paper, embedding) in enumerate(zip(papers, abstract_embeddings)):
+        doi = _find_doi(paper.to_text())
+        if doi:
+            candidates.append((rank, doi, embedding))
+    if not candidates:
+        return 0
+    topic = state.get("topic_embedding")
+    if topic and all(embedding is not None for _, _, embedding in candidates):
+        scores = cosine_similarity_matrix(as_matrix([e for _, _, e in candidates]), as_matrix([topic]))[:, 0]
+        order = np.argsort(-scores, kind="stable")
+    else:
+        order = range(len(candidates))
+    prefetcher = get_prefetcher()
+    scheduled = 0
+    for i in list(order)[: configurable.prefetch_top_k]:
+        doi = candidates[i][1]
+        scheduled += prefetcher.schedule(
+            _run_key(state),
+            doi,
+            lambda doi: _resolve_pdf_url(config, doi),
+            # Same key as ingestion, which joins a download still in flight
+            lambda url: cached_call(config, "pdf_text", url, _download_pdf_text, url),
+            configurable.prefetch_max_papers,
+        )
+    if scheduled:
+        print(f"Prefetching full text of {scheduled} papers in the background.")
+    return scheduled
 
 def execute_searches(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Executes parallel searches for the given queries and aggregates results."""
+    """Execute federated searches for the given queries and aggregate new results."""
     print(f"---NODE: execute_searches (Loop {state.get('research_loop_count', 0) + 1})---")
-    search_queries = state["search_queries"]
-    all_abstract_contents = state.get("literature_abstracts", [])
-    for query in search_queries:
-        print(f"---TOOL: Running search for query: '{query}'---")
-        # arxiv_tool.invoke returns a dictionary like {"documents": [doc1, doc2]}
-        arxiv_response = arxiv_tool.invoke(query)
-        # Ensure arxiv_response is a dictionary and has 'documents' key
-        if isinstance(arxiv_response, dict) and "documents" in arxiv_response:
-            for doc in arxiv_response["documents"]:
-                all_abstract_contents.append(doc.page_content)
-        else:
-            all_abstract_contents.append(str(arxiv_response))
-
-    return {"literature_abstracts": all_abstract_contents}
+    configurable = Configuration.from_runnable_config(config)
+    search_queries, query_embeddings, saved = _drop_paraphrased_queries(
+        state["search_queries"],
+        state.get("executed_queries", []),
+        state.get("executed_query_embeddings", []),
+        configurable.query_similarity_threshold,
+    )
+    if saved:
+        print(f"Skipped {saved} queries that repeat executed ones; running {len(search_queries)}.")
+        metrics.inc("searches_saved", saved)
+    seen = load_abstract_keys(state.get("abstract_ids", []))
+    seen = seen.union(*(text_dedupe_keys(str(a)) for a in state.get("literature_abstracts", [])))
+    sources = {name: CoalescedTool(tool, name) for name, tool in _search_sources(configurable.search_sources).items()}
+    work_cache = get_work_cache(config)
+    if work_cache is not None:
+        sources = {name: CachedTool(tool, work_cache, name) for name, tool in sources.items()}
+    degradations = []
+    timeout = configurable.search_source_timeout
+    left = available(state, configurable)
+    if left is not None and left < timeout:
+        timeout = max(1.0, left)
+        degradations.append(degrade("search_timeout", f"waiting {timeout:.0f}s instead of {configurable.search_source_timeout:.0f}s for each search source"))
+    print(f"---TOOL: Running federated search for queries: {search_queries}---")
+    result = federated_search(
+        search_queries,
+        sources,
+        timeouts=timeout,
+        seen=seen,
+    )
+    for name, stats in result.sources.items():
+        print(f"Source {name}: {stats.results} results, {stats.timeouts} timeouts, {stats.errors} errors, {stats.skipped} skipped in {stats.seconds:.2f}s")
+    print(f"Found {len(result.papers)} new papers ({result.duplicates} duplicates removed)")
+    try:
+        prior_signatures = np.array(
+            [np.frombuffer(sig, dtype=np.uint32) for sig in load_abstract_signatures(state.get("abstract_ids", []))]
+        )
+    except Exception as e:
+        print(f"Failed to load abstract signatures, comparing new papers with each other only. Error: {e}")
+        prior_signatures = None
+    papers, signatures, clusters = collapse_near_duplicates(
+        result.papers, prior_signatures, configurable.near_duplicate_threshold
+    )
+    if clusters:
+        print(f"Collapsed {clusters} clusters of near-duplicate abstracts; keeping {len(papers)} papers.")
+        metrics.inc("near_duplicate_clusters", clusters)
+        metrics.inc("near_duplicates_removed", len(result.papers) - len(papers))
+    novelty_score, abstract_embeddings = _measure_novelty(
+        papers, state.get("abstract_ids", []), configurable.novelty_similarity_threshold
+    )
+    loop = state.get("research_loop_count", 0)
+    novelty_exhausted = novelty_score is not None and loop > 0 and novelty_score < configurable.novelty_floor
+    if novelty_score is not None:
+        print(f"Novelty of this search: {novelty_score:.2f}")
+        metrics.observe("search_novelty", novelty_score)
+    if novelty_exhausted:
+        loops_saved = max(0, MAX_RESEARCH_LOOPS - loop)
+        print(
+            f"Novelty {novelty_score:.2f} is below {configurable.novelty_floor}; ending the research loop "
+            f"without reflection. Saved 1 reflection call and up to {loops_saved} research loops."
+        )
+        metrics.inc("reflection_calls_saved")
+        metrics.inc("research_loops_saved", loops_saved)
+    out_of_time = not affords(state, configurable, *LOOP_NODES, *INGESTION_NODES)
+    if out_of_time and not (state.get("topic_cache_hit") or novelty_exhausted):
+        degradations.append(degrade("research_loops", "no time for reflection; ending the research loop"))
+    if configurable.prefetch_top_k > 0 and _run_key(state):
+        try:
+            _schedule_prefetch(state, config, configurable, papers, abstract_embeddings)
+        except Exception as e:
+            print(f"Failed to schedule full-text prefetch. Error: {e}")
+    # Both lists are reduced with operator.add, so only return new abstracts
+    new_abstracts = {"abstract_ids": [], "literature_abstracts": []}
+    try:
+        new_abstracts["abstract_ids"] = store_abstracts([
+            {
+                "content": paper.to_text(),
+                "title_key": normalize_title(paper.title),
+                "doi": paper.doi.lower().rstrip(".") if paper.doi else None,
+                "signature": signature.tobytes(),
+                "embedding": embedding,
+            }
+            for paper, signature, embedding in zip(papers, signatures, abstract_embeddings)
+        ])
+    except Exception as e:
+        print(f"Failed to store abstracts, keeping them in the state. Error: {e}")
+        new_abstracts["literature_abstracts"] = [paper.to_text() for paper in papers]
+    return {
+        **new_abstracts,
+        "near_duplicate_clusters": clusters,
+        "novelty": novelty_score,
+        "novelty_exhausted": novelty_exhausted,
+        "reflection_calls_saved": int(novelty_exhausted),
+        "out_of_time": out_of_time,
+        "degradations": degradations,
+        "executed_queries": state.get("executed_queries", []) + search_queries,
+        "executed_query_embeddings": state.get("executed_query_embeddings", []) + query_embeddings,
+        "searches_saved": saved,
+    }
 
 def run_single_search(state: AgentState, config: RunnableConfig):
     """Runs a single academic search and returns the results."""
@@ -86,33 +383,67 @@ def run_single_search(state: AgentState, config: RunnableConfig):
 def reflection_and_refinement(state: AgentState, config: RunnableConfig) -> AgentState:
     """Reflects on the gathered abstracts and decides if more research is needed."""
     print("---NODE: reflection_and_refinement---")
-    print(f"Type of state['literature_abstracts']: {type(state['literature_abstracts'])}")
-    print(f"Content of state['literature_abstracts']: {state['literature_abstracts']}")
+    configurable = Configuration.from_runnable_config(config)
+    abstracts = _abstract_texts(state)
+    print(f"Reflecting on {len(abstracts)} abstracts")
 
-    all_abstracts = "\n---\n".join([str(a) for a in state["literature_abstracts"]])
+    all_abstracts = "\n---\n".join(abstracts)
     prompt = reflection_instructions.format(
         current_date=get_current_date(),
         research_topic=state["research_topic"],
         summaries=all_abstracts,
     )
-    response = completion(
-        model="gemini/gemini-1.5-pro",
-        messages=[{"content": prompt, "role": "user"}],
-        response_format={"type": "json_object", "schema": Reflection.model_json_schema()},
-        api_key=GEMINI_API_KEY
-    )
-    reflection_result = Reflection.model_validate_json(response.choices[0].message.content)
+    try:
+        response = completion(
+            model="gemini/gemini-1.5-pro",
+            messages=[{"content": prompt, "role": "user"}],
+            response_format={"type": "json_object", "schema": Reflection.model_json_schema()},
+            api_key=GEMINI_API_KEY
+        )
+        reflection_result = Reflection.model_validate_json(response.choices[0].message.content)
+    except RateLimitTimeout as e:
+        # Without a reflection there are no follow-up queries, so the loop ends with what was found
+        print(f"Reflection was rate limited, ending the research loop. Error: {e}")
+        metrics.inc("rate_limit_fallbacks", node="reflection_and_refinement")
+        reflection_result = Reflection(is_sufficient=True, knowledge_gap="", follow_up_queries=[])
     print(f"Reflection: Sufficient? {reflection_result.is_sufficient}. Gap: {reflection_result.knowledge_gap}")
+    follow_up_queries = reflection_result.follow_up_queries or []
+    loop = state.get("research_loop_count", 0) + 1
+    degradations = []
+    # The loop ends anyway when the research is sufficient or the last loop has run
+    continuing = not reflection_result.is_sufficient and loop < MAX_RESEARCH_LOOPS
+    out_of_time = not affords(state, configurable, "execute_searches", *INGESTION_NODES)
+    if continuing and out_of_time:
+        degradations.append(degrade("research_loops", f"skipping research loops {loop + 1} to {MAX_RESEARCH_LOOPS}"))
+    elif continuing and len(follow_up_queries) > 1 and not affords(state, configurable, *LOOP_NODES, "execute_searches", *INGESTION_NODES):
+        degradations.append(degrade("follow_up_queries", f"running 1 follow-up query instead of {len(follow_up_queries)}"))
+        follow_up_queries = follow_up_queries[:1]
     return {
         "is_sufficient": reflection_result.is_sufficient,
         "knowledge_gap": reflection_result.knowledge_gap,
-        "search_queries": reflection_result.follow_up_queries or [],
-        "research_loop_count": state.get("research_loop_count", 0) + 1,
+        "search_queries": follow_up_queries,
+        "research_loop_count": loop,
+        "out_of_time": out_of_time,
+        "degradations": degradations,
     }
 
+def route_after_search(state: AgentState) -> str:
+    """Route a search either to reflection or out of the research loop.
+
+    A delta search on a reused corpus makes a single pass, and a follow-up
+    search that found too little new, or a search that left no time before
+    the deadline, ends the loop without reflection.
+    """
+    if state.get("topic_cache_hit") or state.get("novelty_exhausted") or state.get("out_of_time"):
+        return "automated_resource_management"
+    return "reflection_and_refinement"
+
 def should_continue_searching(state: AgentState) -> str:
     """Conditional edge to decide whether to continue the research loop."""
     print("---EDGE: should_continue_searching---")
+    if state.get("out_of_time"):
+        print("Conclusion: No time left for another loop before the deadline.")
+        return "automated_resource_management"
     if state["is_sufficient"] or state.get("research_loop_count", 0) >= MAX_RESEARCH_LOOPS:
         print("Conclusion: Research is sufficient or max loops reached.")
         return "automated_resource_management"
@@ -120,103 +451,454 @@ def should_continue_searching(state: AgentState) -> str:
         print("Conclusion: Research is insufficient. Looping back.")
         return "execute_searches"
 
+def _ingested_urls(collection_id: str, urls=None) -> set:
+    """Return the source URLs already stored in the collection, optionally only among ``urls``."""
+    if not collection_id:
+        return set()
+    db = get_db_connection()
+    try:
+        query = db.query(Document.source_url).filter(Document.collection_id == collection_id)
+        if urls is not None:
+            query = query.filter(Document.source_url.in_(urls))
+        return {row.source_url for row in query.distinct()}
+    finally:
+        db.close()
+
+def _embed_text(config: RunnableConfig, text: str):
+    """Chunks a document's text and embeds the chunks."""
+    chunks = get_text_splitter().split_text(text)
+    chunk_embeddings = cached_call(
+        config, "embeddings", texts_key(chunks), get_embeddings().embed_documents, chunks
+    )
+    return chunks, chunk_embeddings
+
+def _pdf_text(config: RunnableConfig, url: str, max_pages=None) -> str:
+    """Return a PDF's text, or only that of its first ``max_pages`` pages."""
+    key = url if max_pages is None else f"{url}#pages={max_pages}"
+    return cached_call(config, "pdf_text", key, _download_pdf_text, url, max_pages)
+
+def _store_chunks(db, collection_id: str, url: str, chunks, chunk_embeddings, index_cache) -> None:
+    """Commit a document's chunks and add them to the in-process vector index."""
+    ids = [uuid.uuid4() for _ in chunks]
+    for id_, chunk, embedding in zip(ids, chunks, chunk_embeddings):
+        document = Document(id=id_, content=chunk, embedding=embedding, collection_id=collection_id, source_url=url)
+        db.add(document)
+    db.commit()
+    if index_cache is not None:
+        index_cache.add(collection_id, ids, chunks, [url] * len(chunks), chunk_embeddings)
+    print(f"Successfully processed and stored {len(chunks)} chunks for {url}")
+
+def _ingestion_pipeline(state: AgentState, config: RunnableConfig, configurable: Configuration, max_pages=None):
+    """Build the pipeline that downloads, embeds and stores PDFs as their URLs are resolved.
+
+    ``max_pages`` ingests only the first pages of each PDF.
+
+    Stages skip the PDFs that reach them once the deadline leaves no time
+    but that for the report.
+
+    Returns:
+        The pipeline, the list that collects streaming ingestion stats and
+        the list that collects the URLs skipped for the deadline.
+    """
+    collection_id = state.get("collection_id")
+    index_cache = get_vector_index_cache() if configurable.vector_index != "off" else None
+    try:
+        ingested = _ingested_urls(collection_id)
+    except Exception as e:
+        print(f"Failed to list the PDFs already in the corpus. Error: {e}")
+        ingested = set()
+    ingestion_stats = []
+    skipped = []
+
+    def out_of_time(url):
+        left = available(state, configurable)
+        if left is not None and left <= 0:
+            skipped.append(url)
+            return True
+        return False
+
+    def fetch(url):
+        if url in ingested:
+            print(f"Skipping {url}, already in the corpus.")
+            return None
+        if out_of_time(url):
+            return None
+        return url, _pdf_text(config, url, max_pages)
+
+    def embed(item):
+        url, text = item
+        if out_of_time(url):
+            return None
+        return (url,) + _embed_text(config, text)
+
+    def store(item):
+        db = get_db_connection()
+        try:
+            _store_chunks(db, collection_id, *item, index_cache)
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return item[0]
+
+    if configurable.ingestion_memory_budget_mb is None:
+        stages = [("fetch", fetch, configurable.ingestion_download_workers), ("embed", embed, 1), ("store", store, 1)]
+    else:
+        budget = MemoryBudget(configurable.ingestion_memory_budget_mb, configurable.ingestion_page_window)
+
+        def stream(url):
+            if url in ingested or out_of_time(url):
+                return None
+            db = get_db_connection()
+            try:
+                stats = ingest_pdf_streaming(
+                    db, url, collection_id, get_embeddings(), get_text_splitter(), get_blob_store(), budget, max_pages
+                )
+            finally:
+                db.close()
+            ingestion_stats.append(stats.as_dict())
+            return url
+
+        # Streaming ingestion sizes its windows to the budget, so it runs one document at a time
+        stages = [("stream", stream, 1)]
+    return Pipeline(stages, configurable.ingestion_queue_size), ingestion_stats, skipped
+
 def automated_resource_management(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Stage 2: Fetches full-text resources and adds them to Zotero."""
+    """Stage 2: Fetches full-text resources and adds them to Zotero.
+
+    With ``ingestion_pipeline`` on, every PDF URL is handed to a pipeline that
+    downloads, embeds and stores it while the remaining DOIs are resolved;
+    ``rag_based_knowledge_synthesis`` then skips the URLs it handled.
+    """
     print("---NODE: automated_resource_management---")
+    configurable = Configuration.from_runnable_config(config)
+    max_pdfs, max_pages = pdf_budget(state, configurable)
+    degradations = []
+    if max_pages is not None and configurable.ingestion_pipeline:
+        degradations.append(degrade("pdf_pages", f"ingesting at most {max_pages} pages per PDF"))
+    pipeline = ingestion_stats = skipped = None
+    if configurable.ingestion_pipeline:
+        pipeline, ingestion_stats, skipped = _ingestion_pipeline(state, config, configurable, max_pages)
+        pipeline.start()
+    prefetch = configurable.prefetch_top_k > 0 and bool(_run_key(state))
+    prefetched = get_prefetcher().take(_run_key(state)) if prefetch else {}
+    hits = misses = 0
     literature_full_text_urls = []
-    for abstract in state["literature_abstracts"]:
-        doi_match = re.search(r'10.\d{4,9}/[-._;()/:A-Z0-9]+', abstract, re.IGNORECASE)
-        if doi_match:
-            doi = doi_match.group(0)
-            print(f"Found DOI: {doi}")
-            pdf_url_info = unpaywall_tool.invoke(doi)
-            if "URL:" in pdf_url_info:
-                pdf_url = pdf_url_info.split("URL: ")[1]
-                literature_full_text_urls.append(pdf_url)
-                print(f"Found PDF URL: {pdf_url}")
-                # Simplified paper_info for Zotero
-                paper_info = {"title": abstract.split('\n')[0], "doi": doi}
-                zotero_result = zotero_tool.invoke(paper_info)
-                print(f"Zotero result: {zotero_result}")
-        else:
-            print("No DOI found in abstract.")
-    return {"literature_full_text": literature_full_text_urls} # Pass URLs to next step
+    try:
+        abstracts = _abstract_texts(state)
+        for position, abstract in enumerate(abstracts):
+            if max_pdfs is not None and len(set(literature_full_text_urls)) >= max_pdfs:
+                degradations.append(degrade("pdf_count", f"fetching {max_pdfs} PDFs; skipped {len(abstracts) - position} remaining papers"))
+                break
+            left = available(state, configurable)
+            if left is not None and left <= 0:
+                degradations.append(degrade("pdf_count", f"deadline reached; skipped {len(abstracts) - position} remaining papers"))
+                break
+            doi = _find_doi(abstract)
+            if doi:
+                print(f"Found DOI: {doi}")
+                job = prefetched.pop(doi.lower(), None)
+                if job is None:
+                    pdf_url, hit = _resolve_pdf_url(config, doi), False
+                else:
+                    pdf_url, hit = _prefetched_url(config, doi, job)
+                hits += hit
+                misses += not hit
+                if pdf_url:
+                    if pipeline is not None and pdf_url not in literature_full_text_urls:
+                        pipeline.put(pdf_url)
+                    literature_full_text_urls.append(pdf_url)
+                    print(f"Found PDF URL: {pdf_url}")
+                    # Simplified paper_info for Zotero
+                    paper_info = {"title": abstract.split('\n')[0], "doi": doi}
+                    zotero_result = zotero_tool.invoke(paper_info)
+                    print(f"Zotero result: {zotero_result}")
+            else:
+                print("No DOI found in abstract.")
+    finally:
+        if pipeline is not None:
+            # Without a deadline this waits for every PDF; with one, only for the time left
+            left = available(state, configurable)
+            pipeline.close(None if left is None else max(0.0, left))
+            if configurable.vector_index != "off":
+                get_vector_index_cache().flush()
+        wasted = get_prefetcher().discard(prefetched) if prefetch else 0
+    update = {"literature_full_text": literature_full_text_urls, "degradations": degradations} # Pass URLs to next step
+    if prefetch:
+        metrics.inc("prefetch_hits", hits)
+        metrics.inc("prefetch_misses", misses)
+        print(f"Prefetch: {hits} hits, {misses} misses, {wasted} wasted")
+        update["prefetch_stats"] = {"hits": hits, "misses": misses, "wasted": wasted}
+    if pipeline is not None:
+        if skipped:
+            degradations.append(degrade("pdf_count", f"deadline reached; skipped {len(skipped)} PDFs"))
+        if pipeline.abandoned:
+            degradations.append(degrade("pdf_count", "deadline reached; stopped waiting for the PDFs still being ingested"))
+        update["pipelined_urls"] = list(literature_full_text_urls)
+        update["ingestion_stats"] = ingestion_stats
+    return update
+
+def _download_pdf_text(url: str, max_pages=None) -> str:
+    """Return the text of a PDF's pages, from the blob store or by downloading it.
+
+    With ``max_pages`` only the first pages are extracted, and a download is
+    not stored, since its text is incomplete.
+    """
+    try:
+        pages = get_blob_store().iter_pages(url)
+    except Exception as e:
+        print(f"Blob store lookup failed for {url}. Error: {e}")
+        pages = None
+    if pages is not None:
+        print(f"Using stored text for {url}")
+        try:
+            return "".join(pages if max_pages is None else islice(pages, max_pages))
+        finally:
+            pages.close()
+
+    import fitz  # PyMuPDF, imported lazily to keep module import cheap
+
+    response = call_with_resilience(host_of(url), requests.get, url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    # Open PDF from memory
+    doc = fitz.open(stream=response.content, filetype="pdf")
+    page_count = doc.page_count if max_pages is None else min(max_pages, doc.page_count)
+    pages = [doc[number].get_text() for number in range(page_count)]
+    doc.close()
+    if max_pages is None:
+        try:
+            get_blob_store().put(url, response.content, pages)
+        except Exception as e:
+            print(f"Failed to store {url} in the blob store. Error: {e}")
+    return "".join(pages)
 
 def rag_based_knowledge_synthesis(state: AgentState, config: RunnableConfig) -> AgentState:
     """Stage 3: Chunks, embeds, and stores knowledge in a vector DB."""
     print("---NODE: rag_based_knowledge_synthesis---")
+    configurable = Configuration.from_runnable_config(config)
+    collection_id = state.get("collection_id")
+    budget = None
+    if configurable.ingestion_memory_budget_mb is not None:
+        budget = MemoryBudget(configurable.ingestion_memory_budget_mb, configurable.ingestion_page_window)
+    ingestion_stats = []
+    degradations = []
+    index_cache = get_vector_index_cache() if configurable.vector_index != "off" else None
     db = get_db_connection()
     try:
-        pdf_urls = state.get("literature_full_text", [])
-        for url in pdf_urls:
+        pipelined = set(state.get("pipelined_urls") or [])
+        pdf_urls = [url for url in state.get("literature_full_text", []) if url not in pipelined]
+        if collection_id and pdf_urls:
+            ingested = _ingested_urls(collection_id, pdf_urls)
+            if ingested:
+                print(f"Skipping {len(ingested)} PDFs already in the corpus.")
+            pdf_urls = [url for url in pdf_urls if url not in ingested]
+        max_pdfs, max_pages = pdf_budget(state, configurable)
+        if max_pdfs is not None and len(pdf_urls) > max_pdfs:
+            degradations.append(degrade("pdf_count", f"ingesting {max_pdfs} of {len(pdf_urls)} PDFs"))
+            pdf_urls = pdf_urls[:max_pdfs]
+        if max_pages is not None and pdf_urls:
+            degradations.append(degrade("pdf_pages", f"ingesting at most {max_pages} pages per PDF"))
+        for position, url in enumerate(pdf_urls):
+            left = available(state, configurable)
+            if left is not None and left <= 0:
+                degradations.append(degrade("pdf_count", f"deadline reached; skipped {len(pdf_urls) - position} PDFs"))
+                break
             try:
                 print(f"Processing PDF: {url}")
-                response = requests.get(url)
-                response.raise_for_status()
-                # Open PDF from memory
-                doc = fitz.open(stream=response.content, filetype="pdf")
-                full_text = ""
-                for page in doc:
-                    full_text += page.get_text()
-                doc.close()
-                
-                # 2. Chunk the text
-                chunks = text_splitter.split_text(full_text)
-                
-                # 3. Generate embeddings
-                chunk_embeddings = embeddings.embed_documents(chunks)
-                
-                # 4. Store in DB
-                for chunk, embedding in zip(chunks, chunk_embeddings):
-                    document = Document(content=chunk, embedding=embedding)
-                    db.add(document)
-                db.commit()
-                print(f"Successfully processed and stored {len(chunks)} chunks for {url}")
+                if budget is not None:
+                    stats = ingest_pdf_streaming(
+                        db, url, collection_id, get_embeddings(), get_text_splitter(), get_blob_store(), budget, max_pages
+                    )
+                    ingestion_stats.append(stats.as_dict())
+                    continue
+                full_text = _pdf_text(config, url, max_pages)
+                chunks, chunk_embeddings = _embed_text(config, full_text)
+                _store_chunks(db, collection_id, url, chunks, chunk_embeddings, index_cache)
 
             except Exception as e:
                 print(f"Failed to process PDF at {url}. Error: {e}")
     finally:
         db.close()
-    return {}
+    if index_cache is not None and collection_id:
+        try:
+            if ingestion_stats or state.get("ingestion_stats"):
+                # Streamed rows are not tracked one by one; reload the collection instead
+                index_cache.invalidate(collection_id)
+            index_cache.flush()
+            # Warm the index while Postgres is known to answer: 'primary' reports
+            # from it, 'fallback' needs it if Postgres fails before the report
+            index_cache.get(collection_id)
+        except Exception as e:
+            print(f"Failed to load the vector index for {collection_id}. Error: {e}")
+    return {"ingestion_stats": ingestion_stats, "degradations": degradations}
+
+def _retrieval_queries(state: AgentState, limit: int) -> List[str]:
+    """Return the topic, the knowledge gap and the executed queries, deduplicated, up to ``limit``."""
+    texts = [state.get("research_topic"), state.get("knowledge_gap")] + list(state.get("executed_queries") or [])
+    queries = []
+    for text in texts:
+        if text and text.strip() and text not in queries:
+            queries.append(text)
+    return queries[: max(1, limit)]
+
+def _fallback_report(research_topic: str, rag_context: str) -> str:
+    """Write a report from the most relevant excerpts, for when the language model cannot answer in time.
+
+    That is when the deadline passes or the Gemini rate limit has no token
+    within ``RATE_LIMIT_MAX_WAIT``, or when no stored chunks can be read.
+    """
+    excerpts = [chunk.strip() for chunk in (rag_context or "").split("\n---\n") if chunk.strip()]
+    if not excerpts:
+        return "\n".join([f"# {research_topic}", "", "The full report could not be written: no stored excerpts could be read."])
+    lines = [
+        f"# {research_topic}",
+        "",
+        "The full report could not be written in time. These are the most relevant excerpts found:",
+        "",
+    ]
+    lines += [f"- {excerpt[:1000]}" for excerpt in excerpts[:FALLBACK_EXCERPTS]]
+    return "\n".join(lines)
 
 def automated_report_generation(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Stage 4: Generates the final report based on the synthesized knowledge."""
+    """Stage 4: Generates the final report based on the synthesized knowledge.
+
+    When the run's deadline is closer than a report usually takes, a faster
+    model writes it from fewer chunks; if even that fails or times out, or the
+    Gemini rate limit cannot be met, the report lists the most relevant
+    excerpts instead. If neither Postgres nor the in-process index can be
+    read, it says so rather than failing the run.
+    """
     print("---NODE: automated_report_generation---")
-    # This is a simplified RAG retrieval. A real implementation would be more sophisticated.
-    db = get_db_connection()
+    configurable = Configuration.from_runnable_config(config)
+    collection_id = state.get("collection_id")
+    model = "gemini/gemini-1.5-flash"
+    top_k = configurable.retrieval_top_k
+    degradations = []
+    left = remaining(state)
+    if left is not None and left < expected_seconds("automated_report_generation"):
+        model = f"gemini/{configurable.deadline_answer_model}"
+        top_k = max(1, top_k // 2)
+        degradations.append(degrade("answer_model", f"{max(0.0, left):.0f}s left; writing the report with {configurable.deadline_answer_model} from {top_k} chunks"))
+    queries = _retrieval_queries(state, configurable.retrieval_max_queries)
+    query_embeddings = None
+    rag_context = None
     try:
-        all_docs = db.query(Document).all()
-        rag_context = "\n---\n".join([doc.content for doc in all_docs])
-    finally:
-        db.close()
+        # One embedding request and one SQL statement for every query
+        query_embeddings = cached_call(
+            config, "query_embeddings", texts_key(queries), get_query_embeddings().embed_documents, queries
+        )
+        if configurable.vector_index == "primary":
+            results = get_vector_index_cache().multi_query_documents(
+                query_embeddings, k=top_k, collection_id=collection_id
+            )
+        else:
+            results = multi_query_documents(
+                queries,
+                query_embeddings,
+                k=top_k,
+                collection_id=collection_id,
+                quantization=configurable.vector_quantization,
+            )
+        rag_context = "\n---\n".join([doc.content for doc, _ in results])
+    except Exception as e:
+        print(f"Retrieval failed. Error: {e}")
+    if rag_context is None and query_embeddings is not None and configurable.vector_index == "fallback":
+        try:
+            results = get_vector_index_cache().multi_query_documents(
+                query_embeddings, k=top_k, collection_id=collection_id
+            )
+            rag_context = "\n---\n".join([doc.content for doc, _ in results])
+            metrics.inc("vector_index_fallbacks")
+        except Exception as e:
+            print(f"In-memory vector index unavailable. Error: {e}")
+    if rag_context is None:
+        print("Using every stored chunk as the report context.")
+        try:
+            db = get_db_connection()
+            try:
+                query = db.query(Document)
+                if collection_id:
+                    query = query.filter(Document.collection_id == collection_id)
+                rag_context = "\n---\n".join([doc.content for doc in query.all()])
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"No stored chunks could be read for the report. Error: {e}")
+    if rag_context is None:
+        metrics.inc("retrieval_failures")
+        report = _fallback_report(state["research_topic"], "")
+        return {"report": report, "messages": [AIMessage(content=report)], "degradations": degradations}
 
     prompt = answer_instructions.format(
         current_date=get_current_date(),
         research_topic=state["research_topic"],
         summaries=rag_context, # Use the context from the DB
     )
-    response = completion(
-        model="gemini/gemini-1.5-flash",
-        messages=[{"content": prompt, "role": "user"}],
-        api_key=GEMINI_API_KEY
-    )
-    report = response.choices[0].message.content
-    return {"report": report, "messages": [AIMessage(content=report)]}
+    kwargs = {}
+    if left is not None:
+        # Recomputed, as retrieval took part of the time
+        kwargs["timeout"] = max(1.0, remaining(state))
+    try:
+        response = completion(
+            model=model,
+            messages=[{"content": prompt, "role": "user"}],
+            api_key=GEMINI_API_KEY,
+            **kwargs
+        )
+        report = response.choices[0].message.content
+        complete = True
+    except RateLimitTimeout as e:
+        print(f"Report generation was rate limited, answering with the retrieved excerpts. Error: {e}")
+        metrics.inc("rate_limit_fallbacks", node="automated_report_generation")
+        report = _fallback_report(state["research_topic"], rag_context)
+        complete = False
+    except Exception as e:
+        if left is None:
+            raise
+        print(f"Report generation failed. Error: {e}")
+        degradations.append(degrade("report", "answering with the retrieved excerpts"))
+        report = _fallback_report(state["research_topic"], rag_context)
+        complete = False
+    # Only a full run over a non-empty corpus is worth reusing for similar topics
+    complete = complete and bool(rag_context) and not degradations and not state.get("degradations")
+    if complete and collection_id and state.get("topic_embedding") and not state.get("topic_cache_hit"):
+        try:
+            record_run(state["research_topic"], state["topic_embedding"], collection_id)
+        except Exception as e:
+            print(f"Failed to record run in the topic cache. Error: {e}")
+    return {"report": report, "messages": [AIMessage(content=report)], "degradations": degradations}
 
 # Define the graph
 builder = StateGraph(AgentState)
 
-builder.add_node("generate_initial_queries", generate_initial_queries)
-builder.add_node("execute_searches", execute_searches)
-builder.add_node("reflection_and_refinement", reflection_and_refinement)
-builder.add_node("automated_resource_management", automated_resource_management)
-builder.add_node("rag_based_knowledge_synthesis", rag_based_knowledge_synthesis)
-builder.add_node("automated_report_generation", automated_report_generation)
+builder.add_node("check_topic_cache", profiled("check_topic_cache", check_topic_cache))
+builder.add_node("generate_initial_queries", profiled("generate_initial_queries", generate_initial_queries))
+builder.add_node("execute_searches", profiled("execute_searches", execute_searches))
+builder.add_node("reflection_and_refinement", profiled("reflection_and_refinement", reflection_and_refinement))
+builder.add_node("automated_resource_management", profiled("automated_resource_management", automated_resource_management))
+builder.add_node("rag_based_knowledge_synthesis", profiled("rag_based_knowledge_synthesis", rag_based_knowledge_synthesis))
+builder.add_node("automated_report_generation", profiled("automated_report_generation", automated_report_generation))
 
 # Build the graph edges
-builder.add_edge(START, "generate_initial_queries")
+builder.add_edge(START, "check_topic_cache")
+builder.add_conditional_edges(
+    "check_topic_cache",
+    route_after_topic_cache,
+    {
+        "generate_initial_queries": "generate_initial_queries",
+        "automated_report_generation": "automated_report_generation",
+    },
+)
 builder.add_edge("generate_initial_queries", "execute_searches")
-builder.add_edge("execute_searches", "reflection_and_refinement")
+builder.add_conditional_edges(
+    "execute_searches",
+    route_after_search,
+    {
+        "reflection_and_refinement": "reflection_and_refinement",
+        "automated_resource_management": "automated_resource_management",
+    },
+)
 
 builder.add_conditional_edges(
     "reflection_and_refinement",
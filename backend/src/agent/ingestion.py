@@ -0,0 +1,234 @@
+"""Memory-bounded, page-windowed ingestion of full-text PDFs."""
+
+import gc
+import hashlib
+import os
+import resource
+from dataclasses import asdict, dataclass
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+
+import requests
+from sqlalchemy import insert
+
+from agent.database import Document
+from agent.metrics import metrics
+from agent.resilience import HTTP_TIMEOUT, call_with_resilience, host_of
+from agent.singleflight import coalesced
+from agent.work_cache import texts_key
+
+DEFAULT_PAGE_WINDOW = 8
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+MB = 1024 * 1024
+
+
+def current_rss() -> int:
+    """Return the resident set size of this process in bytes.
+
+    Reads ``/proc/self/statm`` where available and otherwise falls back to the
+    process's peak RSS, which never decreases.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass
+class IngestionStats:
+    """What streaming one document cost."""
+
+    url: str
+    pages: int = 0
+    chunks: int = 0
+    windows: int = 0
+    page_window: int = DEFAULT_PAGE_WINDOW
+    peak_rss_mb: float = 0.0
+
+    def as_dict(self) -> dict:
+        """Return the stats as a plain dict for the graph state."""
+        return asdict(self)
+
+
+class MemoryBudget:
+    """Tracks the process's memory growth against a budget and sizes page windows to fit.
+
+    Growth is the process-wide RSS minus the RSS when the budget is created,
+    so concurrent runs and pipeline workers in the same process count against
+    each other's budgets: it bounds how far ingestion lets the process grow,
+    not what one run allocates. Whenever growth exceeds ``budget_mb`` after a
+    window, the next window is halved, down to a single page.
+    """
+
+    def __init__(self, budget_mb: float, page_window: int = DEFAULT_PAGE_WINDOW):
+        self.budget_bytes = budget_mb * MB
+        self.page_window = max(1, page_window)
+        self.baseline = current_rss()
+
+    def check(self, stats: IngestionStats) -> None:
+        """Record the current RSS in ``stats`` and shrink the window when over budget."""
+        rss = current_rss()
+        stats.peak_rss_mb = max(stats.peak_rss_mb, rss / MB)
+        if rss - self.baseline <= self.budget_bytes:
+            return
+        gc.collect()
+        if self.page_window > 1:
+            self.page_window //= 2
+            print(f"Memory {(rss - self.baseline) / MB:.0f} MB over baseline; page window now {self.page_window}")
+        else:
+            metrics.inc("ingestion_budget_exceeded")
+
+
+def download_to_store(url: str, store) -> str:
+    """Stream a PDF to disk and return the path to open it from.
+
+    The body is written in ``DOWNLOAD_CHUNK_BYTES`` pieces and moved into the
+    blob store, so the PDF is never held in memory as a whole.
+    """
+    response = call_with_resilience(host_of(url), requests.get, url, stream=True, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    digest = hashlib.sha256()
+    f = store.temporary_file()
+    try:
+        with f:
+            for block in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                digest.update(block)
+                f.write(block)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    finally:
+        response.close()
+    store.put_file(url, f.name, digest.hexdigest())
+    return store.get_pdf_path(url)
+
+
+def _stored_windows(pages: Iterator[str], budget: MemoryBudget, stats: IngestionStats) -> Iterator[Tuple[str, bool]]:
+    # Reads one page ahead to tell whether a window is the last
+    following = next(pages, None)
+    while following is not None:
+        window = [following, *islice(pages, budget.page_window - 1)]
+        following = next(pages, None)
+        stats.pages += len(window)
+        yield "".join(window), following is None
+
+
+def page_windows(
+    url: str, store, budget: MemoryBudget, stats: IngestionStats, max_pages: Optional[int] = None
+) -> Iterator[Tuple[str, bool]]:
+    """Yield the document's text a page window at a time, with whether it is the last window.
+
+    Text stored by an earlier run is read back from disk a window at a time;
+    otherwise the PDF is opened from disk and each window's text is appended
+    to the store as it is read, becoming visible once the last page is in.
+    With ``max_pages`` only the first pages are read, and nothing is stored.
+    """
+    stored = store.iter_pages(url)
+    if stored is not None:
+        yield from _stored_windows(stored if max_pages is None else islice(stored, max_pages), budget, stats)
+        return
+
+    import fitz  # PyMuPDF, imported lazily to keep module import cheap
+
+    path = store.get_pdf_path(url)
+    if path is None:
+        # A concurrent download of the same URL fills the store for everyone on this host
+        coalesced("pdf_download", url, download_to_store, url, store)
+        path = store.get_pdf_path(url) or download_to_store(url, store)
+    doc = fitz.open(path)
+    writer = None
+    try:
+        page_count = doc.page_count if max_pages is None else min(max_pages, doc.page_count)
+        stats.pages = page_count
+        if page_count == doc.page_count:
+            try:
+                writer = store.page_writer(url)
+            except Exception as e:
+                print(f"Failed to store the text of {url} in the blob store. Error: {e}")
+        start = 0
+        while start < page_count:
+            end = min(start + budget.page_window, page_count)
+            window = [doc.load_page(number).get_text() for number in range(start, end)]
+            if writer is not None:
+                try:
+                    writer.write(window)
+                except Exception as e:
+                    print(f"Failed to store the text of {url} in the blob store. Error: {e}")
+                    writer.discard()
+                    writer = None
+            yield "".join(window), end >= page_count
+            del window
+            start = end
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    finally:
+        doc.close()
+    if writer is None:
+        return
+    try:
+        writer.commit()
+    except Exception as e:
+        print(f"Failed to store the text of {url} in the blob store. Error: {e}")
+        writer.discard()
+
+
+def ingest_pdf_streaming(
+    db,
+    url: str,
+    collection_id: Optional[str],
+    embeddings,
+    splitter,
+    store,
+    budget: MemoryBudget,
+    max_pages: Optional[int] = None,
+) -> IngestionStats:
+    """Chunk, embed and insert a PDF one page window at a time.
+
+    Only one window's text, chunks and embeddings are alive at once, since
+    page text is stored and read back a window at a time. The last
+    chunk of a window is carried into the next so chunks still span page
+    boundaries. Rows are flushed per window and committed once the whole
+    document is in, so a failure leaves no partial document behind.
+    ``max_pages`` ingests only the first pages.
+    """
+    stats = IngestionStats(url=url, page_window=budget.page_window)
+    carry = ""
+    try:
+        for text, last in page_windows(url, store, budget, stats, max_pages):
+            text = carry + text
+            chunks = splitter.split_text(text)
+            carry = ""
+            if chunks and not last:
+                # Carry the raw text from the start of the last chunk, whitespace included
+                tail = chunks.pop()
+                start = text.rfind(tail)
+                carry = text[start:] if start >= 0 else tail
+            if chunks:
+                vectors = coalesced("embeddings", texts_key(chunks), embeddings.embed_documents, chunks)
+                db.execute(
+                    insert(Document),
+                    [
+                        {"content": chunk, "embedding": vector, "collection_id": collection_id, "source_url": url}
+                        for chunk, vector in zip(chunks, vectors)
+                    ],
+                )
+                db.flush()
+                stats.chunks += len(chunks)
+                del vectors
+            del chunks, text
+            stats.windows += 1
+            budget.check(stats)
+        db.commit()
+        stats.page_window = budget.page_window
+    except BaseException:
+        db.rollback()
+        raise
+    metrics.observe("ingestion_peak_rss_mb", stats.peak_rss_mb)
+    print(
+        f"Streamed {stats.pages} pages of {url} in {stats.windows} windows into {stats.chunks} chunks; "
+        f"peak RSS {stats.peak_rss_mb:.0f} MB"
+    )
+    return stats
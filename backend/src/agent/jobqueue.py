@@ -0,0 +1,616 @@
+"""Priority job queue with per-tenant fairness, leases and worker dispatch."""
+
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field, replace
+from functools import cache
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from agent.metrics import metrics
+
+load_dotenv()
+
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BATCH = 0
+DEFAULT_MAX_DEPTH = 100
+DEFAULT_TENANT_CONCURRENCY = 2
+# Jobs running at once across all tenants
+DEFAULT_MAX_RUNNING = 4
+DEFAULT_WORKERS = 4
+DEFAULT_TENANT = "default"
+# Seconds a claim stays valid without a heartbeat before the job is requeued
+DEFAULT_LEASE_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds finished jobs stay readable, and how many the in-process queue keeps
+DEFAULT_JOB_TTL = 86400
+DEFAULT_MAX_FINISHED = 1000
+LEASE_EXPIRED_ERROR = "The job's lease expired before it finished."
+# State keys kept as a research job's result
+RESULT_KEYS = ("report", "collection_id", "topic_cache_hit")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a queue that is at its maximum depth."""
+
+
+@dataclass
+class Job:
+    """A queued research run."""
+
+    id: str
+    tenant: str
+    priority: int
+    payload: Dict[str, Any]
+    status: str = "queued"  # queued, running, completed or failed
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Claims so far; a claim whose lease expired is requeued until max_attempts
+    attempts: int = 0
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    lease_until: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the job as a JSON-serializable dict."""
+        return dict(vars(self))
+
+
+class JobQueue(ABC):
+    """Priority queue of jobs with bounded depth and per-tenant concurrency.
+
+    Higher priorities are claimed first and jobs of equal priority in
+    submission order. A job is only claimed while its tenant has fewer than
+    ``tenant_concurrency`` and all tenants together fewer than
+    ``max_running`` running jobs, so one tenant's burst cannot occupy every
+    slot and queued interactive work overtakes batch work. Submissions
+    beyond ``max_depth`` queued jobs are rejected instead of piling up.
+
+    A claim is a lease of ``lease_seconds``: the claimer renews it with
+    ``heartbeat``, and a job whose lease expires (its worker crashed) frees
+    its slot and is queued again, or fails after ``max_attempts`` claims.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        tenant_concurrency: int = DEFAULT_TENANT_CONCURRENCY,
+        max_running: int = DEFAULT_MAX_RUNNING,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        job_ttl: int = DEFAULT_JOB_TTL,
+    ):
+        self.max_depth = max_depth
+        self.tenant_concurrency = tenant_concurrency
+        self.max_running = max_running
+        self.lease_seconds = lease_seconds
+        self.job_ttl = job_ttl
+
+    @abstractmethod
+    def enqueue(self, job: Job) -> None:
+        """Add a job.
+
+        Raises:
+            QueueFullError: If ``max_depth`` jobs are already queued.
+        """
+
+    @abstractmethod
+    def claim(self) -> Optional[Job]:
+        """Requeue expired claims, then lease the best eligible job and return it, or None."""
+
+    @abstractmethod
+    def heartbeat(self, job: Job) -> bool:
+        """Renew a claimed job's lease; False if the claim expired and the job moved on."""
+
+    @abstractmethod
+    def finish(self, job: Job) -> bool:
+        """Store a claimed job's outcome and free its slots.
+
+        Returns False, storing nothing, if the claim had already expired.
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id."""
+
+    @abstractmethod
+    def depth(self) -> int:
+        """Return the number of queued jobs."""
+
+
+class InMemoryJobQueue(JobQueue):
+    """Job queue shared by the threads of a single process.
+
+    Finished jobs are forgotten after ``job_ttl`` seconds, or sooner once
+    more than ``max_finished`` have accumulated.
+    """
+
+    def __init__(self, *args, max_finished: int = DEFAULT_MAX_FINISHED, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._pending: List[Job] = []
+        self._jobs: Dict[str, Job] = {}
+        self._running: Dict[str, int] = {}
+        # Claimed jobs by id; workers get copies, so a stale worker cannot change a requeued job
+        self._claims: Dict[str, Job] = {}
+        self._finished: Deque[str] = deque()
+
+    def _queue(self, job: Job) -> None:
+        # Stable sort keeps submission order within a priority
+        self._pending.append(job)
+        self._pending.sort(key=lambda j: -j.priority)
+
+    def enqueue(self, job: Job) -> None:
+        """Add a job (see ``JobQueue.enqueue``)."""
+        with self._lock:
+            if len(self._pending) >= self.max_depth:
+                raise QueueFullError(f"Job queue is full ({self.max_depth} jobs queued).")
+            self._queue(job)
+            self._jobs[job.id] = job
+
+    def _release(self, job: Job) -> None:
+        del self._claims[job.id]
+        self._running[job.tenant] = max(0, self._running.get(job.tenant, 0) - 1)
+
+    def _expire_claims(self, now: float) -> None:
+        for job in [j for j in self._claims.values() if j.lease_until < now]:
+            self._release(job)
+            job.lease_until = None
+            if job.attempts < job.max_attempts:
+                job.status = "queued"
+                job.started_at = None
+                self._queue(job)
+                metrics.inc("jobs_requeued")
+            else:
+                job.status = "failed"
+                job.error = LEASE_EXPIRED_ERROR
+                job.finished_at = now
+                self._finished.append(job.id)
+                metrics.inc("jobs_finished", status="failed")
+            print(f"Job {job.id}: lease expired after attempt {job.attempts}, now {job.status}.")
+
+    def _evict(self, now: float) -> None:
+        while self._finished:
+            job = self._jobs.get(self._finished[0])
+            if job is not None and len(self._finished) <= self.max_finished and (job.finished_at or now) > now - self.job_ttl:
+                break
+            self._finished.popleft()
+            if job is not None and job.status in ("completed", "failed"):
+                del self._jobs[job.id]
+
+    def claim(self) -> Optional[Job]:
+        """Claim a job (see ``JobQueue.claim``)."""
+        now = time.time()
+        with self._lock:
+            self._expire_claims(now)
+            self._evict(now)
+            if len(self._claims) >= self.max_running:
+                return None
+            for i, job in enumerate(self._pending):
+                if self._running.get(job.tenant, 0) < self.tenant_concurrency:
+                    del self._pending[i]
+                    self._running[job.tenant] = self._running.get(job.tenant, 0) + 1
+                    job.status = "running"
+                    job.started_at = now
+                    job.attempts += 1
+                    job.lease_until = now + self.lease_seconds
+                    self._claims[job.id] = job
+                    return replace(job)
+        return None
+
+    def _holds(self, job: Job) -> bool:
+        claim = self._claims.get(job.id)
+        return claim is not None and claim.attempts == job.attempts
+
+    def heartbeat(self, job: Job) -> bool:
+        """Renew the lease (see ``JobQueue.heartbeat``)."""
+        with self._lock:
+            if not self._holds(job):
+                return False
+            job.lease_until = self._claims[job.id].lease_until = time.time() + self.lease_seconds
+            return True
+
+    def finish(self, job: Job) -> bool:
+        """Store the outcome and free the slots (see ``JobQueue.finish``)."""
+        with self._lock:
+            if not self._holds(job):
+                return False
+            self._release(job)
+            job.lease_until = None
+            self._jobs[job.id] = job
+            self._finished.append(job.id)
+            self._evict(time.time())
+            return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        """Return the number of queued jobs."""
+        with self._lock:
+            return len(self._pending)
+
+
+# Depth check, sequence number and insert in one step, so concurrent
+# submitters from different workers cannot overshoot the maximum depth.
+_ENQUEUE_SCRIPT = """
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+  return 0
+end
+local seq = redis.call('INCR', KEYS[2])
+redis.call('HSET', KEYS[3], 'job', ARGV[4], 'status', 'queued')
+redis.call('ZADD', KEYS[1], -tonumber(ARGV[2]) * 1e10 + seq, ARGV[3])
+return 1
+"""
+
+# Requeues (or fails) the jobs whose lease expired, then leases the first
+# queued job whose tenant is below its cap. Leases are members ``id:attempt``
+# of a sorted set scored by expiry, described in the claims hash. Queued ids
+# whose job hash expired are dropped instead of decoded.
+_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[4])
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)) do
+  redis.call('ZREM', KEYS[3], member)
+  local raw = redis.call('HGET', KEYS[4], member)
+  redis.call('HDEL', KEYS[4], member)
+  if raw then
+    local claim = cjson.decode(raw)
+    redis.call('HINCRBY', KEYS[2], claim['tenant'], -1)
+    local key = ARGV[3] .. claim['id']
+    if redis.call('EXISTS', key) == 1 then
+      if claim['attempt'] < claim['max_attempts'] then
+        local seq = redis.call('INCR', KEYS[5])
+        redis.call('ZADD', KEYS[1], -claim['priority'] * 1e10 + seq, claim['id'])
+        redis.call('HSET', key, 'status', 'queued')
+      else
+        redis.call('HSET', key, 'status', 'failed')
+      end
+    end
+  end
+end
+if redis.call('ZCARD', KEYS[3]) >= tonumber(ARGV[6]) then
+  return false
+end
+local ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+for _, id in ipairs(ids) do
+  local key = ARGV[3] .. id
+  local raw = redis.call('HGET', key, 'job')
+  if not raw then
+    redis.call('ZREM', KEYS[1], id)
+  else
+    local job = cjson.decode(raw)
+    local running = tonumber(redis.call('HGET', KEYS[2], job['tenant']) or '0')
+    if running < tonumber(ARGV[1]) then
+      redis.call('ZREM', KEYS[1], id)
+      redis.call('HINCRBY', KEYS[2], job['tenant'], 1)
+      local attempt = redis.call('HINCRBY', key, 'attempts', 1)
+      redis.call('HSET', key, 'status', 'running')
+      local member = id .. ':' .. attempt
+      redis.call('ZADD', KEYS[3], now + tonumber(ARGV[5]), member)
+      redis.call('HSET', KEYS[4], member, cjson.encode({
+        id = id, tenant = job['tenant'], attempt = attempt,
+        priority = job['priority'], max_attempts = job['max_attempts'] or 1,
+      }))
+      return {id, job['tenant'], attempt}
+    end
+  end
+end
+return false
+"""
+
+_RENEW_SCRIPT = """
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+  redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+  return 1
+end
+return 0
+"""
+
+# Frees the slots and stores the outcome only while the lease is still held
+_FINISH_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+  return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HINCRBY', KEYS[3], ARGV[2], -1)
+if ARGV[3] ~= '' then
+  redis.call('HSET', KEYS[4], 'job', ARGV[3], 'status', ARGV[4])
+  redis.call('EXPIRE', KEYS[4], ARGV[5])
+end
+return 1
+"""
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+class RedisJobQueue(JobQueue):
+    """Job queue stored in Redis and shared by every API worker.
+
+    A job's hash holds its JSON (``job``) next to the ``status`` and
+    ``attempts`` fields the server-side scripts update.
+    """
+
+    def __init__(self, client, *args, key_prefix: str = "jobqueue:", scan_limit: int = 100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = client
+        self._prefix = key_prefix
+        self._scan_limit = scan_limit
+        self._enqueue = client.register_script(_ENQUEUE_SCRIPT)
+        self._claim = client.register_script(_CLAIM_SCRIPT)
+        self._renew = client.register_script(_RENEW_SCRIPT)
+        self._finish = client.register_script(_FINISH_SCRIPT)
+
+    def _key(self, name: str) -> str:
+        return self._prefix + name
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self._prefix}job:{job_id}"
+
+    def _save(self, job: Job) -> None:
+        key = self._job_key(job.id)
+        self._client.hset(key, mapping={"job": json.dumps(job.to_dict()), "status": job.status})
+        self._client.expire(key, self.job_ttl)
+
+    def _release(self, job_id: str, tenant: str, attempt: int, job: Optional[Job] = None) -> bool:
+        released = self._finish(
+            keys=[self._key("leases"), self._key("claims"), self._key("running"), self._job_key(job_id)],
+            args=[
+                f"{job_id}:{attempt}",
+                tenant,
+                json.dumps(job.to_dict()) if job else "",
+                job.status if job else "",
+                self.job_ttl,
+            ],
+        )
+        return bool(int(released))
+
+    def enqueue(self, job: Job) -> None:
+        """Add a job (see ``JobQueue.enqueue``)."""
+        added = self._enqueue(
+            keys=[self._key("pending"), self._key("seq"), self._job_key(job.id)],
+            args=[self.max_depth, job.priority, job.id, json.dumps(job.to_dict())],
+        )
+        if not int(added):
+            raise QueueFullError(f"Job queue is full ({self.max_depth} jobs queued).")
+        self._client.expire(self._job_key(job.id), self.job_ttl)
+
+    def claim(self) -> Optional[Job]:
+        """Claim a job (see ``JobQueue.claim``)."""
+        now = time.time()
+        claimed = self._claim(
+            keys=[self._key("pending"), self._key("running"), self._key("leases"), self._key("claims"), self._key("seq")],
+            args=[self.tenant_concurrency, self._scan_limit, self._job_key(""), now, self.lease_seconds, self.max_running],
+        )
+        if not claimed:
+            return None
+        job_id, tenant, attempt = _text(claimed[0]), _text(claimed[1]), int(claimed[2])
+        job = self.get(job_id)
+        if job is None:
+            # The job's hash expired between the claim and this read
+            self._release(job_id, tenant, attempt)
+            return None
+        job.status = "running"
+        job.started_at = now
+        job.attempts = attempt
+        job.lease_until = now + self.lease_seconds
+        self._save(job)
+        return job
+
+    def heartbeat(self, job: Job) -> bool:
+        """Renew the lease (see ``JobQueue.heartbeat``)."""
+        lease_until = time.time() + self.lease_seconds
+        if not int(self._renew(keys=[self._key("leases")], args=[f"{job.id}:{job.attempts}", lease_until])):
+            return False
+        job.lease_until = lease_until
+        return True
+
+    def finish(self, job: Job) -> bool:
+        """Store the outcome and free the slots (see ``JobQueue.finish``)."""
+        job.lease_until = None
+        return self._release(job.id, job.tenant, job.attempts, job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id."""
+        raw, status, attempts = self._client.hmget(self._job_key(job_id), ["job", "status", "attempts"])
+        if not raw:
+            return None
+        job = Job(**json.loads(raw))
+        if status:
+            job.status = _text(status)
+        if attempts:
+            job.attempts = int(attempts)
+        if job.status == "failed" and job.error is None:
+            job.error = LEASE_EXPIRED_ERROR
+        return job
+
+    def depth(self) -> int:
+        """Return the number of queued jobs."""
+        return int(self._client.zcard(self._key("pending")))
+
+
+class JobDispatcher:
+    """Runs queued jobs on a fixed pool of worker threads.
+
+    Workers claim jobs from the queue, so ordering, depth and tenant caps are
+    whatever the queue enforces; with ``RedisJobQueue`` they hold across all
+    API workers. A heartbeat thread renews the leases of the jobs this
+    process runs. A job's slot is given back when it finishes, fails or is
+    interrupted.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        run_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+        workers: int = DEFAULT_WORKERS,
+        poll_interval: float = 0.1,
+    ):
+        self.queue = queue
+        self._run_fn = run_fn
+        self._poll_interval = poll_interval
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+        self._held_lock = threading.Lock()
+        # Jobs whose leases this process renews
+        self._held: Dict[str, Job] = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"jobs-{i}", daemon=True) for i in range(workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="jobs-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def register(self, kind: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]]) -> None:
+        """Run jobs whose payload has this ``kind`` with ``fn`` instead of the default function."""
+        self._handlers[kind] = fn
+
+    def _enqueue(self, job: Job) -> None:
+        try:
+            self.queue.enqueue(job)
+        except QueueFullError:
+            metrics.inc("jobs_rejected", reason="queue_full")
+            raise
+        metrics.inc("jobs_submitted", priority=job.priority)
+        metrics.set_gauge("job_queue_depth", self.queue.depth())
+        self._wakeup.set()
+
+    def submit(self, payload: Dict[str, Any], tenant: str = DEFAULT_TENANT, priority: int = PRIORITY_INTERACTIVE) -> Job:
+        """Queue a job.
+
+        Raises:
+            QueueFullError: If the queue is at its maximum depth.
+        """
+        job = Job(id=str(uuid.uuid4()), tenant=tenant, priority=priority, payload=payload)
+        self._enqueue(job)
+        return job
+
+    def _hold(self, job: Job) -> None:
+        with self._held_lock:
+            self._held[job.id] = job
+
+    def _forget(self, job_id: str) -> Optional[Job]:
+        with self._held_lock:
+            return self._held.pop(job_id, None)
+
+    def _heartbeat(self) -> None:
+        while not self._stopped.wait(self.queue.lease_seconds / 3):
+            with self._held_lock:
+                held = list(self._held.values())
+            for job in held:
+                try:
+                    if not self.queue.heartbeat(job):
+                        print(f"Job {job.id} lost its lease and was requeued.")
+                        self._forget(job.id)
+                except Exception as e:
+                    print(f"Failed to renew the lease of job {job.id}. Error: {e}")
+
+    def _work(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                print(f"Failed to claim a job. Error: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self._poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: Job) -> None:
+        wait = job.started_at - job.enqueued_at
+        metrics.observe("job_queue_wait_seconds", wait, priority=job.priority)
+        metrics.set_gauge("job_queue_depth", self.queue.depth())
+        kind = job.payload.get("kind")
+        payload = {"submitted_at": job.enqueued_at, **job.payload, "job_id": job.id}
+        self._hold(job)
+        try:
+            job.result = self._handlers.get(kind, self._run_fn)(payload)
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            print(f"Job {job.id} for tenant '{job.tenant}' failed. Error: {e}")
+        except BaseException as e:
+            # A cancelled or interrupted run gives its slot back before the interruption propagates
+            job.error = f"Interrupted: {type(e).__name__}"
+            job.status = "failed"
+            self._finish(job)
+            raise
+        self._finish(job)
+
+    def _finish(self, job: Job) -> None:
+        job.finished_at = time.time()
+        self._forget(job.id)
+        metrics.inc("jobs_finished", status=job.status)
+        metrics.observe("job_run_seconds", job.finished_at - job.started_at)
+        if not self.queue.finish(job):
+            print(f"Job {job.id} finished after its lease expired; the outcome was dropped.")
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        """Stop the workers after their current job."""
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def run_research_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the research graph for a job and keep the JSON-serializable results."""
+    from agent.batch import run_research
+
+    configurable = {**payload.get("configurable", {}), "job_id": payload.get("job_id")}
+    state = run_research(payload["topic"], {"configurable": configurable}, payload.get("submitted_at"))
+    return {key: state.get(key) for key in RESULT_KEYS}
+
+
+@cache
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue.
+
+    Uses Redis when ``REDIS_URI`` is set (unless ``JOB_QUEUE_BACKEND=memory``)
+    and falls back to an in-process queue if Redis is not reachable.
+    ``JOB_QUEUE_MAX_DEPTH``, ``JOB_TENANT_CONCURRENCY``, ``JOB_MAX_RUNNING``
+    and ``JOB_LEASE_SECONDS`` set the limits.
+    """
+    limits = (
+        int(os.getenv("JOB_QUEUE_MAX_DEPTH", DEFAULT_MAX_DEPTH)),
+        int(os.getenv("JOB_TENANT_CONCURRENCY", DEFAULT_TENANT_CONCURRENCY)),
+        int(os.getenv("JOB_MAX_RUNNING", DEFAULT_MAX_RUNNING)),
+        float(os.getenv("JOB_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)),
+    )
+    backend = os.getenv("JOB_QUEUE_BACKEND", "auto").lower()
+    redis_uri = os.getenv("REDIS_URI")
+    if backend != "memory" and redis_uri:
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_uri)
+            client.ping()
+            return RedisJobQueue(client, *limits)
+        except Exception as e:
+            print(f"Redis job queue unavailable, using an in-process queue. Error: {e}")
+    return InMemoryJobQueue(*limits)
+
+
+@cache
+def get_job_dispatcher() -> JobDispatcher:
+    """Return the process-wide dispatcher.
+
+    ``JOB_WORKERS`` sets its size.
+    """
+    return JobDispatcher(get_job_queue(), run_research_job, int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS)))
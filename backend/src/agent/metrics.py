@@ -0,0 +1,105 @@
+"""Process-wide counters, gauges and latency histograms in Prometheus text format."""
+
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+HISTOGRAM_WINDOW = 1024
+
+
+def _series(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+def quantile(values, q: float) -> Optional[float]:
+    """Return the ``q`` quantile (0..1) of ``values`` by nearest rank."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and windowed histograms.
+
+    Series are identified by a name plus optional labels, rendered the way
+    Prometheus does (``hedges_sent{host="arxiv"}``). Histograms keep the last
+    ``HISTOGRAM_WINDOW`` observations so quantiles track recent behaviour.
+    """
+
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Deque[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """Add ``value`` to a counter."""
+        with self._lock:
+            self._counters[_series(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Set a gauge to ``value``."""
+        with self._lock:
+            self._gauges[_series(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record one observation in a histogram."""
+        series = _series(name, labels)
+        with self._lock:
+            if series not in self._histograms:
+                self._histograms[series] = deque(maxlen=self._window)
+            self._histograms[series].append(value)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        """Return the current value of a counter."""
+        with self._lock:
+            return self._counters.get(_series(name, labels), 0.0)
+
+    def gauge(self, name: str, **labels: Any) -> Optional[float]:
+        """Return the current value of a gauge, if it was ever set."""
+        with self._lock:
+            return self._gauges.get(_series(name, labels))
+
+    def quantile(self, name: str, q: float, min_count: int = 1, **labels: Any) -> Optional[float]:
+        """Return a histogram quantile, or None with fewer than ``min_count`` samples."""
+        with self._lock:
+            values = list(self._histograms.get(_series(name, labels), ()))
+        if len(values) < min_count:
+            return None
+        return quantile(values, q)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every series, with histograms summarized as count/p50/p95/p99."""
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            snapshot: Dict[str, Any] = {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+        snapshot["histograms"] = {
+            series: {
+                "count": len(values),
+                "p50": quantile(values, 0.50),
+                "p95": quantile(values, 0.95),
+                "p99": quantile(values, 0.99),
+            }
+            for series, values in histograms.items()
+        }
+        return snapshot
+
+    def reset(self) -> None:
+        """Clear every series."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,112 @@
+"""MinHash signatures and LSH banding for near-duplicate text detection."""
+
+import re
+import zlib
+from functools import cache
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+NUM_PERM = 128
+LSH_BANDS = 32  # 32 bands of 4 rows: pairs above ~0.42 Jaccard become candidates
+SHINGLE_SIZE = 3
+NEAR_DUPLICATE_THRESHOLD = 0.6
+# Largest prime below 2**32; with 32-bit inputs a * x + b stays below 2**64
+_PRIME = np.uint64(4294967291)
+
+
+@cache
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Return the 32-bit hashes of the word ``size``-grams of a text.
+
+    Case and punctuation are ignored. A text shorter than ``size`` words is a
+    single shingle, so every text has at least one.
+    """
+    words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    grams = {" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signatures(texts: Sequence[str], num_perm: int = NUM_PERM) -> np.ndarray:
+    """Return the ``(len(texts), num_perm)`` MinHash signatures of the texts.
+
+    The shingles of all texts are hashed by every permutation in one array
+    operation, and each text's minimum is taken with ``np.minimum.reduceat``.
+    """
+    if len(texts) == 0:
+        return np.zeros((0, num_perm), dtype=np.uint32)
+    hashes = [shingle_hashes(text) for text in texts]
+    offsets = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+    a, b = _permutations(num_perm)
+    permuted = (a[:, None] * np.concatenate(hashes)[None, :] + b[:, None]) % _PRIME
+    return np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+
+
+def estimated_jaccard(signatures: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Estimate the Jaccard similarity of each ``(i, j)`` row pair."""
+    return (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+
+
+def lsh_candidate_pairs(signatures: np.ndarray, bands: int = LSH_BANDS) -> np.ndarray:
+    """Return the ``(i, j)`` pairs, ``i < j``, that share an LSH bucket in any band."""
+    n, num_perm = signatures.shape
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    rows = num_perm // bands
+    pairs = set()
+    for band in range(bands):
+        chunk = np.ascontiguousarray(signatures[:, band * rows : (band + 1) * rows])
+        _, buckets = np.unique(chunk.view(np.dtype((np.void, chunk.dtype.itemsize * rows))), return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind="stable")
+        sorted_buckets = buckets[order]
+        # Pair every member of a bucket with the bucket's first member
+        starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+        first = np.repeat(order[starts], np.diff(np.r_[starts, n]))
+        members = first != order
+        pairs.update(zip(first[members].tolist(), order[members].tolist()))
+    return np.array(sorted((min(p), max(p)) for p in pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def cluster_near_duplicates(
+    signatures: np.ndarray,
+    threshold: float = NEAR_DUPLICATE_THRESHOLD,
+    bands: int = LSH_BANDS,
+) -> List[List[int]]:
+    """Group rows whose estimated Jaccard similarity exceeds ``threshold``.
+
+    LSH banding proposes candidate pairs and the signatures confirm them, so
+    the cost grows with the number of near-duplicates rather than with every
+    pair of rows.
+
+    Returns:
+        Every cluster, including singletons, as sorted row indices ordered by
+        their first row.
+    """
+    n = len(signatures)
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = lsh_candidate_pairs(signatures, bands)
+    if len(pairs):
+        for i, j in pairs[estimated_jaccard(signatures, pairs) >= threshold].tolist():
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
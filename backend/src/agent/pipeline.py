@@ -0,0 +1,188 @@
+"""Staged pipelines of worker threads connected by bounded queues."""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from agent.metrics import metrics
+
+DEFAULT_QUEUE_SIZE = 4
+# Seconds between a waiting worker's checks for cancellation
+POLL_INTERVAL = 0.1
+
+# Tells a worker that its stage's input is exhausted
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """What one pipeline stage did."""
+
+    name: str
+    workers: int
+    items: int = 0
+    failures: int = 0
+    # Items left unprocessed because the pipeline was abandoned
+    dropped: int = 0
+    busy_seconds: float = 0.0
+    # Time spent waiting for room in the next stage's queue
+    blocked_seconds: float = 0.0
+
+
+class Pipeline:
+    """Runs items through stages connected by bounded queues.
+
+    Each stage is ``(name, fn, workers)``: ``workers`` threads take items
+    from the stage's queue and pass ``fn(item)`` on to the next stage, or
+    collect it if the stage is the last. ``fn`` returning ``None`` drops the
+    item, and an exception is printed and drops only that item. Queues hold
+    at most ``queue_size`` items, so a slow stage holds back the ones before
+    it instead of letting work pile up in memory; the total time approaches
+    that of the slowest stage rather than the sum of all of them.
+
+    Use it as a context manager: ``put`` feeds the first stage and leaving
+    the block waits for every item to come out. ``close`` with a timeout
+    abandons what has not come out in time: workers drop their remaining
+    items and exit once their current call returns.
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Callable[[Any], Any], int]], queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.stages = [(name, fn, max(1, workers)) for name, fn, workers in stages]
+        self.stats = [StageStats(name, workers) for name, _, workers in self.stages]
+        self.results: List[Any] = []
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in self.stages]
+        self._remaining = [workers for _, _, workers in self.stages]
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._started = 0.0
+        self._closed = False
+        self._abandoned = threading.Event()
+
+    def __enter__(self) -> "Pipeline":
+        """Start the stages."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the pipeline, waiting for every item to pass through."""
+        self.close()
+
+    def start(self) -> None:
+        """Start every stage's workers."""
+        self._started = time.monotonic()
+        for index, (name, _, workers) in enumerate(self.stages):
+            for number in range(workers):
+                thread = threading.Thread(
+                    target=self._work, args=(index,), name=f"pipeline-{name}-{number}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    @property
+    def abandoned(self) -> bool:
+        """Whether ``close`` timed out with items still in flight."""
+        return self._abandoned.is_set()
+
+    def put(self, item: Any) -> None:
+        """Feed ``item`` to the first stage, waiting while its queue is full."""
+        self._queues[0].put(item)
+
+    def _put(self, inbox: queue.Queue, item: Any, deadline: Optional[float] = None) -> bool:
+        # Waits for room until the pipeline is abandoned or the deadline passes
+        while not self._abandoned.is_set():
+            wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if wait <= 0:
+                try:
+                    inbox.put_nowait(item)
+                    return True
+                except queue.Full:
+                    return False
+            try:
+                inbox.put(item, timeout=wait)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self, timeout: Optional[float] = None) -> List[Any]:
+        """Wait for every item to pass through and return the last stage's outputs.
+
+        With ``timeout``, waits at most that many seconds; the pipeline is
+        then abandoned and the outputs collected so far are returned.
+        """
+        if self._closed:
+            return self.results
+        self._closed = True
+        deadline = None if timeout is None else time.monotonic() + max(0.0, timeout)
+        for _ in range(self.stages[0][2]):
+            if not self._put(self._queues[0], _DONE, deadline):
+                break
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in self._threads):
+            self._abandoned.set()
+            metrics.inc("pipeline_abandoned")
+            print(f"Pipeline abandoned after {timeout:.1f}s with items still in flight.")
+        elapsed = time.monotonic() - self._started
+        metrics.observe("pipeline_seconds", elapsed)
+        with self._lock:
+            results = list(self.results)
+            for stats in self.stats:
+                metrics.observe("pipeline_stage_busy_seconds", stats.busy_seconds / stats.workers, stage=stats.name)
+            summary = ", ".join(
+                f"{s.name} {s.items} items ({s.failures} failed) busy {s.busy_seconds / s.workers:.1f}s"
+                for s in self.stats
+            )
+        print(f"Pipeline finished in {elapsed:.1f}s: {summary}")
+        return results
+
+    def _work(self, index: int) -> None:
+        name, fn, _ = self.stages[index]
+        stats = self.stats[index]
+        inbox = self._queues[index]
+        last = index == len(self.stages) - 1
+        while True:
+            try:
+                item = inbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self._abandoned.is_set():
+                    break
+                continue
+            if item is _DONE:
+                break
+            if self._abandoned.is_set():
+                with self._lock:
+                    stats.dropped += 1
+                continue
+            start = time.monotonic()
+            try:
+                result = fn(item)
+            except Exception as e:
+                result = None
+                with self._lock:
+                    stats.failures += 1
+                metrics.inc("pipeline_failures", stage=name)
+                print(f"Pipeline stage {name} failed for {repr(item)[:200]}. Error: {e}")
+            busy = time.monotonic() - start
+            with self._lock:
+                stats.items += 1
+                stats.busy_seconds += busy
+            if result is None:
+                continue
+            if last:
+                with self._lock:
+                    self.results.append(result)
+                continue
+            start = time.monotonic()
+            self._put(self._queues[index + 1], result)
+            with self._lock:
+                stats.blocked_seconds += time.monotonic() - start
+        with self._lock:
+            self._remaining[index] -= 1
+            finished = self._remaining[index] == 0
+        if finished and not last:
+            # The stage's last worker tells every worker of the next stage
+            for _ in range(self.stages[index + 1][2]):
+                self._put(self._queues[index + 1], _DONE)
@@ -0,0 +1,117 @@
+"""Background prefetch of full texts for papers likely to be ingested."""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from agent.metrics import metrics
+
+load_dotenv()
+
+DEFAULT_WORKERS = 4
+DEFAULT_DOWNLOAD_WORKERS = 4
+# Runs whose prefetches are kept for the ingestion stage; older ones are dropped
+DEFAULT_MAX_RUNS = 64
+
+
+class Prefetcher:
+    """Fetches full text for promising papers in the background, ahead of ingestion.
+
+    ``schedule`` queues a job that resolves a DOI to a PDF URL and then
+    queues the URL's download as a second job; ``take`` hands a run's
+    resolution jobs to the stage that needs them. Downloads run on their own
+    pool, so slow PDFs never delay the resolutions of later runs, which
+    ingestion waits for. Jobs are keyed by run, not by collection, since
+    runs that reuse a cached corpus share its collection. Downloads only warm shared
+    caches (the work cache and blob store), so a prefetch that is never used
+    costs its download and nothing else. ``limit`` caps the jobs per run,
+    which bounds that waste; jobs of runs beyond ``max_runs``, or left over
+    after ``take``, are cancelled if they have not started.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_runs: int = DEFAULT_MAX_RUNS,
+        download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._downloads = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="prefetch-download")
+        self._lock = threading.Lock()
+        self._runs: OrderedDict[str, Dict[str, Future]] = OrderedDict()
+        self.max_runs = max_runs
+
+    def schedule(
+        self,
+        run_key: str,
+        doi: str,
+        resolve: Callable[[str], Optional[str]],
+        download: Callable[[str], object],
+        limit: int,
+    ) -> bool:
+        """Queue a prefetch of ``doi`` for the run unless it is queued already or the run is at ``limit``."""
+        key = doi.lower()
+        with self._lock:
+            jobs = self._runs.setdefault(run_key, {})
+            self._runs.move_to_end(run_key)
+            if key in jobs or len(jobs) >= limit:
+                return False
+            jobs[key] = self._executor.submit(self._resolve, doi, resolve, download)
+            evicted = []
+            while len(self._runs) > self.max_runs:
+                evicted.append(self._runs.popitem(last=False)[1])
+        metrics.inc("prefetch_scheduled")
+        for stale in evicted:
+            self.discard(stale)
+        return True
+
+    def _resolve(self, doi: str, resolve: Callable[[str], Optional[str]], download: Callable[[str], object]) -> Optional[str]:
+        # The job completes once the URL is known, so a waiting caller need not wait for the download too
+        url = resolve(doi)
+        if url:
+            self._downloads.submit(self._download, download, url)
+        return url
+
+    @staticmethod
+    def _download(download: Callable[[str], object], url: str) -> None:
+        try:
+            download(url)
+        except Exception as e:
+            metrics.inc("prefetch_failures")
+            print(f"Prefetch download of {url} failed. Error: {e}")
+
+    def take(self, run_key: str) -> Dict[str, Future]:
+        """Remove and return the run's jobs, keyed by lowercased DOI."""
+        with self._lock:
+            return self._runs.pop(run_key, {})
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop both pools, by default after their queued jobs."""
+        self._executor.shutdown(wait=wait)
+        self._downloads.shutdown(wait=wait)
+
+    def discard(self, jobs: Dict[str, Future]) -> int:
+        """Cancel the jobs that have not started and count them all as wasted."""
+        for future in jobs.values():
+            future.cancel()
+        if jobs:
+            metrics.inc("prefetch_wasted", len(jobs))
+        return len(jobs)
+
+
+@cache
+def get_prefetcher() -> Prefetcher:
+    """Return the process-wide prefetcher.
+
+    ``PREFETCH_WORKERS`` sets how many DOIs it resolves at once and
+    ``PREFETCH_DOWNLOAD_WORKERS`` how many PDFs it downloads.
+    """
+    return Prefetcher(
+        int(os.getenv("PREFETCH_WORKERS", DEFAULT_WORKERS)),
+        download_workers=int(os.getenv("PREFETCH_DOWNLOAD_WORKERS", DEFAULT_DOWNLOAD_WORKERS)),
+    )
@@ -0,0 +1,245 @@
+"""Wall-clock stack sampling and memory profiling of research runs."""
+
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.configuration import Configuration
+from agent.metrics import metrics
+
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+TOP_ALLOCATIONS = 50
+PROFILERS = ("sampling", "cprofile")
+
+Frame = Tuple[str, str, int]
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed wall-clock interval.
+
+    Because samples are taken whether the thread computes or blocks, time
+    spent waiting on sockets, locks or futures shows up under the frames that
+    wait, next to the time spent in Python code. Frames that were already on
+    the stack when sampling started are left out, so stacks begin at the
+    profiled code.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.weights: Dict[Tuple[Frame, ...], float] = {}
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling the calling thread."""
+        target = threading.get_ident()
+        outer = []
+        frame = sys._getframe(1)
+        while frame is not None:
+            outer.append(frame)
+            frame = frame.f_back
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, args=(target, outer), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self, target: int, outer: list) -> None:
+        # ``outer`` keeps the frames alive, so their ids cannot be reused
+        outer_ids = {id(frame) for frame in outer}
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            now = time.perf_counter()
+            stack: List[Frame] = []
+            while frame is not None and id(frame) not in outer_ids:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.samples[key] += 1
+                self.weights[key] = self.weights.get(key, 0.0) + now - last
+            last = now
+
+    def collapsed(self) -> str:
+        """Return the samples as collapsed stacks (``root;...;leaf count`` per line)."""
+        lines = [
+            ";".join(_frame_name(frame) for frame in stack) + f" {count}"
+            for stack, count in self.samples.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """Return the samples in speedscope's sampled-profile format, weighted in seconds."""
+        frame_index: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, weight in self.weights.items():
+            samples.append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+            weights.append(weight)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "agent.profiling",
+            "shared": {
+                "frames": [
+                    {"name": function, "file": filename, "line": line}
+                    for (filename, function, line) in frame_index
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def _frame_name(frame: Frame) -> str:
+    filename, function, line = frame
+    return f"{function} ({os.path.basename(filename)}:{line})".replace(";", ":")
+
+
+def should_profile(node: str, configurable: Configuration) -> bool:
+    """Return whether ``profile_nodes`` selects ``node``."""
+    if not configurable.profile_nodes:
+        return False
+    selected = {name.strip() for name in configurable.profile_nodes.split(",")}
+    return "*" in selected or node in selected
+
+
+def profile_path(config: Optional[RunnableConfig], configurable: Configuration, node: str) -> str:
+    """Return the file path prefix, without extension, for one profiled node execution.
+
+    Profiles are grouped in a directory per run (or thread) so the nodes of a
+    run can be compared; the prefix starts with a timestamp so executions of
+    a looping node sort in order.
+    """
+    config = config or {}
+    run_id = (
+        config.get("configurable", {}).get("run_id")
+        or config.get("metadata", {}).get("run_id")
+        or config.get("configurable", {}).get("thread_id")
+        or "local"
+    )
+    run_dir = os.path.join(configurable.profile_dir, str(run_id))
+    os.makedirs(run_dir, exist_ok=True)
+    return os.path.join(run_dir, f"{time.time_ns()}-{node}")
+
+
+@contextmanager
+def _allocations(prefix: str) -> Iterator[None]:
+    """Write the allocations made in the block as a tracemalloc snapshot and a top list."""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        with _tracemalloc_lock:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0:
+                tracemalloc.stop()
+        after.dump(f"{prefix}.tracemalloc")
+        with open(f"{prefix}.allocations.txt", "w") as f:
+            for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+
+@contextmanager
+def profile_block(prefix: str, profiler: str = "sampling", memory: bool = False) -> Iterator[None]:
+    """Profile the block and write the results next to ``prefix``.
+
+    The ``sampling`` profiler writes ``.collapsed`` (for flamegraph.pl and
+    speedscope) and ``.speedscope.json``; ``cprofile`` writes a ``.prof``
+    pstats file. With ``memory``, ``.tracemalloc`` and ``.allocations.txt``
+    hold the allocations made in the block.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}; expected one of {PROFILERS}.")
+    with _allocations(prefix) if memory else nullcontext():
+        if profiler == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                profile.dump_stats(f"{prefix}.prof")
+        else:
+            sampler = StackSampler()
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                name = os.path.basename(prefix)
+                with open(f"{prefix}.collapsed", "w") as f:
+                    f.write(sampler.collapsed())
+                with open(f"{prefix}.speedscope.json", "w") as f:
+                    json.dump(sampler.speedscope(name), f)
+
+
+def profiled(node: str, fn: Callable) -> Callable:
+    """Wrap a graph node so it runs under the profiler when the configuration selects it.
+
+    Unselected nodes run unchanged; the configuration is read per call, so
+    profiling can be switched on for a single run through ``RunnableConfig``.
+    Every call's duration is observed as ``node_seconds``, which the run
+    deadline uses to estimate what still fits.
+    """
+    takes_config = len(inspect.signature(fn).parameters) > 1
+
+    # Not functools.wraps: LangGraph reads the wrapper's own signature to pass the config
+    def wrapper(state, config: RunnableConfig):
+        call = functools.partial(fn, state, config) if takes_config else functools.partial(fn, state)
+        configurable = Configuration.from_runnable_config(config)
+        start = time.perf_counter()
+        if not should_profile(node, configurable):
+            try:
+                return call()
+            finally:
+                metrics.observe("node_seconds", time.perf_counter() - start, node=node)
+        prefix = profile_path(config, configurable, node)
+        with profile_block(prefix, configurable.profiler, configurable.profile_memory):
+            result = call()
+        elapsed = time.perf_counter() - start
+        metrics.observe("node_seconds", elapsed, node=node)
+        print(f"Profiled {node} in {elapsed:.2f}s: {prefix}.*")
+        return result
+
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
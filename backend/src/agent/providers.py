@@ -0,0 +1,130 @@
+"""Shared, rate-limited clients for the embedding and text-splitting providers."""
+
+import os
+from functools import cache
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from agent.ratelimit import acquire, get_rate_limiter
+
+load_dotenv()
+
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embeddings client that takes a rate-limit token before every request."""
+
+    def __init__(self, client: Embeddings, provider: str = "embeddings"):
+        self.client = client
+        self.provider = provider
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed a batch of documents."""
+        acquire(self.provider)
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query."""
+        acquire(self.provider)
+        return self.client.embed_query(text)
+
+
+@cache
+def get_embeddings() -> Embeddings:
+    """Return the shared Gemini embeddings client, creating it on first use."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return RateLimitedEmbeddings(
+        GoogleGenerativeAIEmbeddings(
+            model=GEMINI_EMBEDDING_MODEL, api_key=os.getenv("GEMINI_API_KEY")
+        )
+    )
+
+
+@cache
+def get_query_embeddings() -> Embeddings:
+    """Return the embeddings client for retrieval queries.
+
+    ``embed_documents`` on it embeds a batch of queries in one request with
+    the ``retrieval_query`` task type that ``embed_query`` uses for one.
+    """
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return RateLimitedEmbeddings(
+        GoogleGenerativeAIEmbeddings(
+            model=GEMINI_EMBEDDING_MODEL,
+            api_key=os.getenv("GEMINI_API_KEY"),
+            task_type="retrieval_query",
+        )
+    )
+
+
+@cache
+def get_similarity_embeddings() -> Embeddings:
+    """Return the embeddings client used to compare short texts with each other.
+
+    It embeds with the ``semantic_similarity`` task type, which suits
+    query-to-query and topic-to-topic comparison better than the retrieval
+    task types used for document chunks.
+    """
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return RateLimitedEmbeddings(
+        GoogleGenerativeAIEmbeddings(
+            model=GEMINI_EMBEDDING_MODEL,
+            api_key=os.getenv("GEMINI_API_KEY"),
+            task_type="semantic_similarity",
+        )
+    )
+
+
+@cache
+def get_text_splitter():
+    """Return the shared text splitter used to chunk full-text documents."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    )
+
+
+def completion(**kwargs: Any) -> Any:
+    """Call ``litellm.completion`` under the Gemini rate limit.
+
+    litellm is imported on the first call.
+    """
+    from litellm import completion as litellm_completion
+
+    acquire("gemini")
+    return litellm_completion(**kwargs)
+
+
+def warmup() -> None:
+    """Eagerly initializes every lazy provider.
+
+    Call this from a worker startup hook to move the cold-start cost out of
+    the first request. Each step is best effort: a missing credential or an
+    unreachable database is reported, not raised.
+    """
+    from agent.database import get_engine
+
+    steps: dict[str, Callable[[], Any]] = {
+        "litellm": lambda: __import__("litellm"),
+        "pymupdf": lambda: __import__("fitz"),
+        "text_splitter": get_text_splitter,
+        "embeddings": get_embeddings,
+        "similarity_embeddings": get_similarity_embeddings,
+        "rate_limiter": get_rate_limiter,
+        "database": get_engine,
+    }
+    for name, step in steps.items():
+        try:
+            step()
+            print(f"Warmup: {name} ready.")
+        except Exception as e:
+            print(f"Warmup: {name} failed. Error: {e}")
@@ -0,0 +1,184 @@
+"""Token-bucket rate limiting of calls to external providers."""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import cache
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# provider -> (tokens per second, burst size)
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "gemini": (2.0, 10.0),
+    "embeddings": (5.0, 10.0),
+    "arxiv": (1 / 3, 1.0),  # arXiv asks for one request every three seconds
+    "pubmed": (3.0, 3.0),  # NCBI E-utilities limit without an API key
+    "semantic_scholar": (1.0, 1.0),
+    "unpaywall": (10.0, 10.0),
+    "zotero": (5.0, 5.0),
+}
+DEFAULT_MAX_WAIT = 30.0
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller could not get a token within its maximum wait."""
+
+
+class RateLimiter(ABC):
+    """Per-provider token buckets.
+
+    Each provider has a bucket refilled at ``rate`` tokens per second up to
+    ``burst`` tokens. Callers block until a token is available instead of
+    sending a request that the provider would reject with a 429.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ):
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self.max_wait = max_wait
+
+    @abstractmethod
+    def try_acquire(self, provider: str, tokens: float = 1.0) -> float:
+        """Take tokens from the provider's bucket if enough are available.
+
+        Returns:
+            0.0 if the tokens were taken, otherwise the seconds to wait before
+            enough tokens will have been refilled.
+        """
+
+    def acquire(self, provider: str, tokens: float = 1.0, max_wait: Optional[float] = None) -> float:
+        """Block until tokens are taken from the provider's bucket.
+
+        Providers without a configured limit are not throttled.
+
+        Returns:
+            The number of seconds spent waiting.
+
+        Raises:
+            RateLimitTimeout: If the tokens are not available within ``max_wait``.
+        """
+        if provider not in self.limits:
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire(provider, tokens)
+            waited = time.monotonic() - start
+            if wait <= 0:
+                return waited
+            if waited + wait > max_wait:
+                raise RateLimitTimeout(
+                    f"Rate limit for '{provider}' not available within {max_wait}s."
+                )
+            time.sleep(wait)
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Token buckets shared by the threads of a single process."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def try_acquire(self, provider: str, tokens: float = 1.0) -> float:
+        """Take tokens from the in-process bucket (see ``RateLimiter.try_acquire``)."""
+        rate, burst = self.limits[provider]
+        with self._lock:
+            now = time.monotonic()
+            available, updated = self._buckets.get(provider, (burst, now))
+            available = min(burst, available + (now - updated) * rate)
+            if available >= tokens:
+                self._buckets[provider] = (available - tokens, now)
+                return 0.0
+            self._buckets[provider] = (available, now)
+            return (tokens - available) / rate
+
+
+# Refill and take atomically on the Redis server, using its clock so that
+# workers on different hosts agree on the elapsed time.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+  tokens = tokens - requested
+else
+  wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Token buckets stored in Redis and shared by every worker."""
+
+    def __init__(self, client, *args, key_prefix: str = "ratelimit:", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = client
+        self._key_prefix = key_prefix
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def try_acquire(self, provider: str, tokens: float = 1.0) -> float:
+        """Take tokens from the shared bucket (see ``RateLimiter.try_acquire``)."""
+        rate, burst = self.limits[provider]
+        wait = self._script(keys=[self._key_prefix + provider], args=[rate, burst, tokens])
+        return float(wait)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse ``"gemini=2/10,arxiv=0.33/1"`` into ``{provider: (rate, burst)}``.
+
+    The burst defaults to ``max(1, rate)`` when omitted.
+    """
+    limits: Dict[str, Tuple[float, float]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        provider, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        limits[provider.strip()] = (float(rate), float(burst) if burst else max(1.0, float(rate)))
+    return limits
+
+
+@cache
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter.
+
+    Uses Redis when ``REDIS_URI`` is set (unless ``RATE_LIMIT_BACKEND=memory``)
+    and falls back to in-process buckets if Redis is not reachable. Limits from
+    ``RATE_LIMITS`` override the defaults per provider.
+    """
+    limits = {**DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv("RATE_LIMITS", ""))}
+    max_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT", DEFAULT_MAX_WAIT))
+    backend = os.getenv("RATE_LIMIT_BACKEND", "auto").lower()
+    redis_uri = os.getenv("REDIS_URI")
+    if backend != "memory" and redis_uri:
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_uri)
+            client.ping()
+            return RedisRateLimiter(client, limits, max_wait=max_wait)
+        except Exception as e:
+            print(f"Redis rate limiter unavailable, using in-process buckets. Error: {e}")
+    return InMemoryRateLimiter(limits, max_wait=max_wait)
+
+
+def acquire(provider: str, tokens: float = 1.0) -> float:
+    """Block until the shared limiter grants ``tokens`` for ``provider``."""
+    return get_rate_limiter().acquire(provider, tokens)
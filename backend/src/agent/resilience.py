@@ -0,0 +1,194 @@
+"""Timeouts, retries, hedging and circuit breakers for external calls."""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cache
+from typing import Any, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+
+from agent.metrics import metrics
+from agent.ratelimit import RateLimitTimeout
+
+T = TypeVar("T")
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+# Hedge after the p95 latency of the host once enough samples are known
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.05
+MAX_HEDGE_WORKERS = 32
+# Seconds to connect to a host and to wait for each read from it; a hung host
+# then fails the call, which counts against its circuit breaker
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_READ_TIMEOUT = 30.0
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+_BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one external host.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    are rejected immediately. Once ``reset_timeout`` seconds have passed a single
+    probe call is let through (half-open); its outcome closes or reopens the
+    circuit. The state is published as the ``circuit_breaker_state`` gauge
+    (0 closed, 1 half-open, 2 open).
+    """
+
+    def __init__(self, host: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._publish("closed")
+
+    @property
+    def state(self) -> str:
+        """Return ``closed``, ``open`` or ``half_open``."""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def _publish(self, state: str) -> None:
+        metrics.set_gauge("circuit_breaker_state", _BREAKER_STATE_VALUES[state], host=self.host)
+
+    def allow(self) -> bool:
+        """Return whether a call may be made now."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._publish(state)
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Close the circuit and reset the failure count."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+            self._publish("closed")
+
+    def release(self) -> None:
+        """End a call that says nothing about the host's health, freeing the probe slot."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit at the threshold or after a failed probe."""
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    metrics.inc("circuit_breaker_opened", host=self.host)
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._publish("open")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """Return the process-wide breaker for ``host``."""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def host_of(url: str) -> str:
+    """Return the host name a URL points to."""
+    return urlparse(url).netloc.lower() or url
+
+
+@cache
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """Return the shared thread pool running primary and hedged requests."""
+    return ThreadPoolExecutor(max_workers=MAX_HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+def hedge_delay(host: str) -> float:
+    """Return how long to wait for the primary request before hedging."""
+    p95 = metrics.quantile(
+        "external_call_seconds", HEDGE_QUANTILE, min_count=HEDGE_MIN_SAMPLES, host=host
+    )
+    return HEDGE_DEFAULT_DELAY if p95 is None else max(HEDGE_MIN_DELAY, p95)
+
+
+def _hedged(host: str, fn: Callable[..., T], args: Any, kwargs: Any) -> T:
+    executor = get_hedge_executor()
+    primary = executor.submit(fn, *args, **kwargs)
+    done, _ = wait([primary], timeout=hedge_delay(host))
+    if done:
+        return primary.result()
+
+    metrics.inc("hedges_sent", host=host)
+    hedge = executor.submit(fn, *args, **kwargs)
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    metrics.inc("hedge_wins", host=host)
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_resilience(host: str, fn: Callable[..., T], *args: Any, hedge: bool = False, **kwargs: Any) -> T:
+    """Call ``fn`` through the host's circuit breaker, optionally hedged.
+
+    With ``hedge=True`` a duplicate request is sent if the first has not
+    answered within the host's recent p95 latency, and the first successful
+    answer wins. Only use it for idempotent lookups.
+
+    Take rate-limit tokens before calling this, not inside ``fn``: the wait
+    would count as the host's latency and trigger hedges. A
+    ``RateLimitTimeout`` raised by ``fn`` is not counted as a host failure.
+
+    Raises:
+        CircuitOpenError: If the host's circuit is open.
+    """
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        metrics.inc("circuit_breaker_rejections", host=host)
+        raise CircuitOpenError(f"Circuit open for {host}; skipping call.")
+    start = time.monotonic()
+    try:
+        result = _hedged(host, fn, args, kwargs) if hedge else fn(*args, **kwargs)
+    except RateLimitTimeout:
+        breaker.release()
+        raise
+    except Exception:
+        breaker.record_failure()
+        metrics.inc("external_call_failures", host=host)
+        raise
+    breaker.record_success()
+    metrics.observe("external_call_seconds", time.monotonic() - start, host=host)
+    return result
@@ -0,0 +1,352 @@
+"""Federated literature search across sources, with deduplication of the hits."""
+
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from functools import cache
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from agent.minhash import (
+    NEAR_DUPLICATE_THRESHOLD,
+    cluster_near_duplicates,
+    minhash_signatures,
+)
+from agent.tools_and_schemas import Paper
+
+DOI_PATTERN = re.compile(r"10.\d{4,9}/[-._;()/:A-Z0-9]+", re.IGNORECASE)
+DEFAULT_SOURCE_TIMEOUT = 10.0
+# Calls one source may have in flight, including calls that timed out but still run
+MAX_SOURCE_WORKERS = 8
+
+# Tool output is a "\n\n"-joined list of records that each start with "Published"
+_RECORD_SPLIT = re.compile(r"\n\n(?=Published)")
+_ABSTRACT_KEYS = ("Summary", "Abstract")
+
+
+@dataclass
+class SourceStats:
+    """Outcome of one source across all queries of a federated search."""
+
+    results: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    # Queries not sent because the source's earlier calls still occupy its threads
+    skipped: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class FederatedSearchResult:
+    """Deduplicated papers plus per-source statistics."""
+
+    papers: List[Paper]
+    sources: Dict[str, SourceStats] = field(default_factory=dict)
+    duplicates: int = 0
+
+
+class SourcePool:
+    """Runs one source's calls on threads of its own and refuses calls while all are busy.
+
+    A timed-out call cannot be cancelled once it runs, so it keeps its thread
+    until the source answers. Giving each source its own threads confines a
+    hanging source to them, and refusing further calls, instead of queueing
+    them behind the hung ones, keeps later searches from waiting on it.
+    """
+
+    def __init__(self, name: str, workers: int = MAX_SOURCE_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"search-{name}")
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """Start ``fn(*args)`` on a free thread, or return None if every thread is busy."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Also runs when the call is cancelled before it starts
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        self._slots.release()
+
+
+@cache
+def get_source_pool(name: str) -> SourcePool:
+    """Return the process-wide thread pool of one search source."""
+    return SourcePool(name)
+
+
+def normalize_title(title: str) -> str:
+    """Lowercase a title and strip punctuation so variants compare equal."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title.lower()).split())
+
+
+def dedupe_key(paper: Paper) -> Tuple[str, str]:
+    """Return the cross-source identity of a paper: its DOI, else its title."""
+    if paper.doi:
+        return ("doi", paper.doi.lower().rstrip("."))
+    return ("title", normalize_title(paper.title))
+
+
+def text_dedupe_keys(text: str) -> Set[Tuple[str, str]]:
+    """Return the DOI and title keys of an abstract already rendered into the state."""
+    keys = {("title", normalize_title(text.split("\n")[0]))}
+    doi_match = DOI_PATTERN.search(text)
+    if doi_match:
+        keys.add(("doi", doi_match.group(0).lower().rstrip(".")))
+    return keys
+
+
+def _find_doi(*texts: Optional[str]) -> Optional[str]:
+    for text in texts:
+        if text:
+            doi_match = DOI_PATTERN.search(text)
+            if doi_match:
+                return doi_match.group(0).rstrip(".")
+    return None
+
+
+def _split_authors(authors: Any) -> List[str]:
+    if isinstance(authors, str):
+        return [a.strip() for a in authors.split(",") if a.strip()]
+    if isinstance(authors, (list, tuple)):
+        return [str(a) for a in authors]
+    return []
+
+
+def _paper_from_document(source: str, doc: Any) -> Optional[Paper]:
+    content = str(getattr(doc, "page_content", "") or "")
+    metadata = getattr(doc, "metadata", None)
+    if not isinstance(metadata, dict):
+        metadata = {}
+    title = str(metadata.get("Title") or metadata.get("title") or content.split("\n")[0]).strip()
+    if not title:
+        return None
+    doi = metadata.get("DOI") or metadata.get("doi") or _find_doi(content, metadata.get("entry_id"))
+    published = metadata.get("Published") or metadata.get("published")
+    return Paper(
+        title=title,
+        abstract=content,
+        doi=doi,
+        authors=_split_authors(metadata.get("Authors") or metadata.get("authors")),
+        published=str(published) if published else None,
+        sources=[source],
+    )
+
+
+def _paper_from_record(source: str, record: str) -> Optional[Paper]:
+    fields: Dict[str, str] = {}
+    abstract_lines: List[str] = []
+    lines = record.strip().split("\n")
+    for i, line in enumerate(lines):
+        key, sep, value = line.partition(":")
+        key = key.strip()
+        if sep and key in _ABSTRACT_KEYS:
+            # PubMed writes "Summary::" followed by the text on the next lines
+            abstract_lines = [value.lstrip(":").strip()] + lines[i + 1 :]
+            break
+        if sep:
+            fields[key] = value.strip()
+    title = fields.get("Title", "").strip()
+    if not title or title == "None":
+        return None
+    abstract = "\n".join(line for line in abstract_lines if line).strip()
+    published = fields.get("Published") or fields.get("Published year")
+    return Paper(
+        title=title,
+        abstract="" if abstract == "None" else abstract,
+        doi=_find_doi(fields.get("DOI"), abstract),
+        authors=_split_authors(fields.get("Authors", "")),
+        published=published if published and published != "None" else None,
+        sources=[source],
+    )
+
+
+def parse_results(source: str, raw: Any) -> List[Paper]:
+    """Normalize a tool response into papers.
+
+    Accepts both the formatted string the LangChain query tools return and a
+    ``{"documents": [...]}`` mapping of LangChain documents.
+    """
+    papers: List[Optional[Paper]] = []
+    if isinstance(raw, dict) and "documents" in raw:
+        papers = [_paper_from_document(source, doc) for doc in raw["documents"]]
+    elif isinstance(raw, str):
+        papers = [
+            _paper_from_record(source, record)
+            for record in _RECORD_SPLIT.split(raw.strip())
+            if record.startswith("Published")
+        ]
+    return [p for p in papers if p is not None]
+
+
+def merge_papers(
+    papers: Iterable[Paper], seen: Optional[Set[Tuple[str, str]]] = None
+) -> Tuple[List[Paper], int]:
+    """Deduplicate papers by DOI / normalized title.
+
+    Duplicates are merged into the first occurrence: their sources are added and
+    missing fields are filled in. Papers whose key is in ``seen`` are dropped.
+
+    Returns:
+        The unique papers in first-seen order and the number of duplicates removed.
+    """
+    seen = set(seen or ())
+    by_key: Dict[Tuple[str, str], Paper] = {}
+    # A paper with a DOI and one without may share a title
+    by_title: Dict[str, Paper] = {}
+    duplicates = 0
+    for paper in papers:
+        key = dedupe_key(paper)
+        title_key = normalize_title(paper.title)
+        if key in seen or ("title", title_key) in seen:
+            duplicates += 1
+            continue
+        existing = by_key.get(key) or by_title.get(title_key)
+        if existing is None:
+            merged = paper.model_copy(deep=True)
+            by_key[key] = merged
+            by_title[title_key] = merged
+            continue
+        duplicates += 1
+        existing.sources += [s for s in paper.sources if s not in existing.sources]
+        if not existing.doi and paper.doi:
+            existing.doi = paper.doi
+            by_key[dedupe_key(existing)] = existing
+        if len(paper.abstract) > len(existing.abstract):
+            existing.abstract = paper.abstract
+        existing.authors = existing.authors or paper.authors
+        existing.published = existing.published or paper.published
+    unique = list({id(p): p for p in by_key.values()}.values())
+    return unique, duplicates
+
+
+def signature_text(paper: Paper) -> str:
+    """Return the text a paper's MinHash signature is computed from.
+
+    Preprint and journal titles often differ, so the abstract alone is used
+    when there is one.
+    """
+    return paper.abstract or paper.title
+
+
+def _canonical_rank(paper: Paper) -> Tuple[bool, int]:
+    return (paper.doi is not None, len(paper.abstract))
+
+
+def collapse_near_duplicates(
+    papers: List[Paper],
+    prior_signatures: Optional[np.ndarray] = None,
+    threshold: float = NEAR_DUPLICATE_THRESHOLD,
+) -> Tuple[List[Paper], np.ndarray, int]:
+    """Keep one canonical paper per cluster of near-duplicate abstracts.
+
+    Catches what ``merge_papers`` cannot: a preprint and its journal version,
+    or the same abstract with small differences. New papers that are near
+    duplicates of an earlier abstract (``prior_signatures``) are dropped.
+    Otherwise the paper with a DOI and the longest abstract is kept, and the
+    sources of the whole cluster are merged into it.
+
+    Returns:
+        The kept papers in first-seen order, their MinHash signatures and the
+        number of clusters that had more than one member.
+    """
+    signatures = minhash_signatures([signature_text(p) for p in papers])
+    if prior_signatures is None or len(prior_signatures) == 0:
+        prior_signatures = np.zeros((0, signatures.shape[1]), dtype=np.uint32)
+    prior_count = len(prior_signatures)
+    clusters = cluster_near_duplicates(np.vstack([prior_signatures, signatures]), threshold)
+
+    keep: List[int] = []
+    duplicate_clusters = 0
+    for cluster in clusters:
+        new_members = [i - prior_count for i in cluster if i >= prior_count]
+        if not new_members:
+            continue
+        if len(cluster) > 1:
+            duplicate_clusters += 1
+        if len(new_members) < len(cluster):
+            continue
+        canonical = max(new_members, key=lambda i: (_canonical_rank(papers[i]), -i))
+        for i in new_members:
+            papers[canonical].sources += [s for s in papers[i].sources if s not in papers[canonical].sources]
+        keep.append(canonical)
+    keep.sort()
+    return [papers[i] for i in keep], signatures[keep], duplicate_clusters
+
+
+def federated_search(
+    queries: List[str],
+    sources: Mapping[str, Any],
+    timeouts: Union[float, Mapping[str, float]] = DEFAULT_SOURCE_TIMEOUT,
+    seen: Optional[Set[Tuple[str, str]]] = None,
+) -> FederatedSearchResult:
+    """Query every source for every query in parallel and merge the hits.
+
+    Each source gets its own timeout measured from the common start, so wall
+    clock time is bounded by the slowest *allowed* source rather than the sum
+    over sources. A source that times out or raises contributes nothing, and
+    while its timed-out calls still hold all of its threads (see
+    ``SourcePool``) it is skipped.
+
+    Args:
+        queries: The search queries.
+        sources: Maps a source name to a tool exposing ``invoke(query)``.
+        timeouts: A timeout in seconds for every source, or one per source name.
+        seen: Dedupe keys of papers already collected; matching hits are dropped.
+    """
+    start = time.monotonic()
+    stats = {name: SourceStats() for name in sources}
+    futures = []
+    for query in queries:
+        for name, tool in sources.items():
+            future = get_source_pool(name).submit(tool.invoke, query)
+            if future is None:
+                stats[name].skipped += 1
+                print(f"Search source '{name}' is busy with earlier calls; skipping query: '{query}'")
+                continue
+            futures.append((name, query, future))
+    finished_at: Dict[int, float] = {}
+    for i, (_, _, future) in enumerate(futures):
+        future.add_done_callback(lambda _, i=i: finished_at.setdefault(i, time.monotonic()))
+
+    papers: List[Paper] = []
+    for i, (name, query, future) in enumerate(futures):
+        timeout = timeouts.get(name, DEFAULT_SOURCE_TIMEOUT) if isinstance(timeouts, Mapping) else timeouts
+        remaining = max(0.0, start + timeout - time.monotonic())
+        try:
+            hits = parse_results(name, future.result(timeout=remaining))
+            stats[name].results += len(hits)
+            papers.extend(hits)
+        except FutureTimeoutError:
+            future.cancel()
+            stats[name].timeouts += 1
+            print(f"Search source '{name}' timed out after {timeout}s for query: '{query}'")
+        except Exception as e:
+            stats[name].errors += 1
+            print(f"Search source '{name}' failed for query: '{query}'. Error: {e}")
+        elapsed = finished_at.get(i, time.monotonic()) - start
+        stats[name].seconds = max(stats[name].seconds, elapsed)
+
+    unique, duplicates = merge_papers(papers, seen)
+    return FederatedSearchResult(papers=unique, sources=stats, duplicates=duplicates)
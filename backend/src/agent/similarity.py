@@ -0,0 +1,83 @@
+"""Vectorized cosine similarity over embedding matrices."""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def as_matrix(vectors: Sequence[Sequence[float]], dim: Optional[int] = None) -> np.ndarray:
+    """Stack vectors into a contiguous float32 matrix (``(0, dim)`` when empty)."""
+    if len(vectors) == 0:
+        return np.zeros((0, dim or 0), dtype=np.float32)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D array of vectors, got shape {matrix.shape}.")
+    return matrix
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale every row to unit length; zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def cosine_similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Return the ``(len(a), len(b))`` cosine similarities between two row sets."""
+    return normalize_rows(a) @ normalize_rows(b).T
+
+
+def select_novel(
+    new: Sequence[Sequence[float]],
+    prior: Sequence[Sequence[float]],
+    threshold: float,
+) -> Tuple[List[int], List[int]]:
+    """Split new vectors into novel and near-duplicate ones.
+
+    A vector is a near-duplicate when its cosine similarity to any prior vector,
+    or to an earlier novel vector of the same batch, exceeds ``threshold``. All
+    similarities are computed with one matrix product.
+
+    Returns:
+        The indices of the novel vectors and of the near-duplicates.
+    """
+    new_matrix = as_matrix(new)
+    if len(new_matrix) == 0:
+        return [], []
+    prior_matrix = as_matrix(prior, dim=new_matrix.shape[1])
+    similarities = cosine_similarity_matrix(new_matrix, np.vstack([prior_matrix, new_matrix]))
+    prior_count = len(prior_matrix)
+    duplicate_of_prior = (
+        similarities[:, :prior_count].max(axis=1) > threshold
+        if prior_count
+        else np.zeros(len(new_matrix), dtype=bool)
+    )
+
+    novel: List[int] = []
+    duplicates: List[int] = []
+    for i in range(len(new_matrix)):
+        batch_similarities = similarities[i, prior_count + np.asarray(novel, dtype=int)]
+        if duplicate_of_prior[i] or (batch_similarities > threshold).any():
+            duplicates.append(i)
+        else:
+            novel.append(i)
+    return novel, duplicates
+
+
+def novelty(
+    new: Sequence[Sequence[float]],
+    prior: Sequence[Sequence[float]],
+    threshold: float,
+) -> float:
+    """Return the fraction of new vectors whose max cosine similarity to ``prior`` is below ``threshold``.
+
+    No new vectors means nothing new was found (0.0); no prior vectors means
+    everything is new (1.0).
+    """
+    new_matrix = as_matrix(new)
+    if len(new_matrix) == 0:
+        return 0.0
+    prior_matrix = as_matrix(prior, dim=new_matrix.shape[1])
+    if len(prior_matrix) == 0:
+        return 1.0
+    max_similarity = cosine_similarity_matrix(new_matrix, prior_matrix).max(axis=1)
+    return float((max_similarity < threshold).mean())
@@ -0,0 +1,206 @@
+"""Coalescing of identical in-flight calls, within a process or across workers."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from functools import cache
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from dotenv import load_dotenv
+
+from agent.metrics import metrics
+
+load_dotenv()
+
+DEFAULT_LOCK_TTL = 120.0
+DEFAULT_WAIT_TIMEOUT = 120.0
+# Seconds a published result stays readable by the callers that waited for it
+RESULT_TTL = 30.0
+POLL_INTERVAL = 0.05
+
+# Deletes the lock only if this caller still holds it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesces identical calls that are in flight at the same time.
+
+    The first caller of ``(namespace, key)`` runs the function; callers that
+    arrive before it finishes wait for its result or exception instead of
+    repeating the work. Nothing is kept once the call completes, so unlike
+    ``SharedWorkCache`` this never serves stale results and needs no bounds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, Hashable], Future] = {}
+
+    def do(self, namespace: str, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Return ``fn(*args, **kwargs)``, sharing one call among concurrent identical callers."""
+        with self._lock:
+            future = self._calls.get((namespace, key))
+            owner = future is None
+            if owner:
+                future = Future()
+                self._calls[(namespace, key)] = future
+        if not owner:
+            metrics.inc("singleflight_coalesced", namespace=namespace)
+            return future.result()
+        try:
+            result = self._call(namespace, key, fn, *args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop((namespace, key), None)
+
+    def _call(self, namespace: str, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return fn(*args, **kwargs)
+
+
+class RedisSingleFlight(SingleFlight):
+    """Single-flight that also coalesces across workers through a Redis lock.
+
+    Within a process, callers coalesce as in ``SingleFlight``. The one caller
+    left then takes a Redis lock for the key; the worker that gets it runs the
+    function and publishes the JSON-encoded result under its lock token,
+    while other workers poll for it. A waiter reads the token of the lock it
+    waits on, so only callers that arrived while the call was in flight see
+    its result; a caller arriving after the lock is released makes a fresh
+    call, and the result key expires after ``RESULT_TTL`` seconds. The owner
+    releases the lock right after publishing, so waiters look for the result
+    before every lock attempt and again once they hold the lock. Results that
+    are not JSON-serializable are not shared. If the owner fails, its lock
+    expires or the wait exceeds ``wait_timeout``, a waiter runs the function
+    itself, so coalescing never turns into an outage. Redis errors fall back
+    to a direct call.
+    """
+
+    def __init__(
+        self,
+        client,
+        key_prefix: str = "singleflight:",
+        lock_ttl: float = DEFAULT_LOCK_TTL,
+        wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+    ):
+        super().__init__()
+        self._client = client
+        self._prefix = key_prefix
+        self._lock_ttl_ms = int(lock_ttl * 1000)
+        self._wait_timeout = wait_timeout
+        self._release = client.register_script(_RELEASE_SCRIPT)
+
+    def _keys(self, namespace: str, key: Hashable) -> Tuple[str, str]:
+        # The second is the prefix of the result keys, which end in the owner's lock token
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return f"{self._prefix}lock:{namespace}:{digest}", f"{self._prefix}result:{namespace}:{digest}"
+
+    def _unlock(self, lock_key: str, token: str) -> None:
+        try:
+            self._release(keys=[lock_key], args=[token])
+        except Exception as e:
+            print(f"Failed to release the single-flight lock {lock_key}. Error: {e}")
+
+    def _published(self, results: str, owner_token) -> Any:
+        # Returns the raw result published by the owner of ``owner_token``, or None
+        if owner_token is None:
+            return None
+        if isinstance(owner_token, bytes):
+            owner_token = owner_token.decode()
+        return self._client.get(f"{results}:{owner_token}")
+
+    def _call(self, namespace: str, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        lock_key, results = self._keys(namespace, key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self._wait_timeout
+        owner = False
+        # Token of the lock this caller found held, whose result it waits for
+        awaited = None
+        try:
+            while True:
+                result = self._published(results, awaited)
+                if result is not None:
+                    break
+                if self._client.set(lock_key, token, nx=True, px=self._lock_ttl_ms):
+                    owner = True
+                    # The awaited owner may have published and released between the read and the lock
+                    result = self._published(results, awaited)
+                    break
+                awaited = self._client.get(lock_key) or awaited
+                if time.monotonic() > deadline:
+                    print(f"Timed out waiting for another worker's {namespace} call; calling directly.")
+                    return fn(*args, **kwargs)
+                time.sleep(POLL_INTERVAL)
+            if result is not None:
+                if owner:
+                    self._unlock(lock_key, token)
+                value = json.loads(result)
+                metrics.inc("singleflight_coalesced_remote", namespace=namespace)
+                return value
+        except Exception as e:
+            if owner:
+                self._unlock(lock_key, token)
+            print(f"Redis single-flight unavailable, calling directly. Error: {e}")
+            return fn(*args, **kwargs)
+
+        try:
+            result = fn(*args, **kwargs)
+            try:
+                self._client.set(f"{results}:{token}", json.dumps(result), px=int(RESULT_TTL * 1000))
+            except Exception as e:
+                print(f"Failed to publish the {namespace} result to other workers. Error: {e}")
+            return result
+        finally:
+            self._unlock(lock_key, token)
+
+
+class CoalescedTool:
+    """Wraps a search tool so that identical in-flight queries share one call."""
+
+    def __init__(self, tool: Any, name: str):
+        self.tool = tool
+        self.name = name
+
+    def invoke(self, query: str) -> Any:
+        """Run the wrapped tool's ``invoke`` through the single-flight group."""
+        return get_single_flight().do(f"search:{self.name}", query, self.tool.invoke, query)
+
+
+@cache
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight group.
+
+    Calls are coalesced within the process. With ``SINGLE_FLIGHT_BACKEND=redis``
+    and ``REDIS_URI`` set they are also coalesced across workers; if Redis is
+    not reachable the group stays in-process.
+    """
+    backend = os.getenv("SINGLE_FLIGHT_BACKEND", "memory").lower()
+    redis_uri = os.getenv("REDIS_URI")
+    if backend == "redis" and redis_uri:
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_uri)
+            client.ping()
+            return RedisSingleFlight(client)
+        except Exception as e:
+            print(f"Redis single-flight unavailable, coalescing in-process only. Error: {e}")
+    return SingleFlight()
+
+
+def coalesced(namespace: str, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call ``fn`` through the process-wide single-flight group."""
+    return get_single_flight().do(namespace, key, fn, *args, **kwargs)
@@ -0,0 +1,327 @@
+"""Export and import of the document corpus as portable snapshot files."""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import struct
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Callable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, select
+
+from agent.database import (
+    EMBEDDING_DIMENSIONS,
+    QUANTIZED_INDEXES,
+    Document,
+    get_engine,
+    init_db,
+)
+
+SNAPSHOT_FORMAT = "agent-corpus"
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+DOCUMENTS = "documents.jsonl.gz"
+EMBEDDINGS = "embeddings.npy"
+BATCH_SIZE = 10000
+COLUMNS = ("id", "content", "embedding", "collection_id", "source_url")
+# Full-precision HNSW index, built when no vector quantization is configured
+ANN_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_documents_embedding_hnsw ON documents "
+    "USING hnsw (embedding vector_cosine_ops)"
+)
+# Index methods that are cheaper to build once than to maintain row by row
+DEFERRED_INDEX_METHODS = ("hnsw", "ivfflat", "gin")
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+
+
+@dataclass
+class ExportResult:
+    """What ``export_corpus`` wrote."""
+
+    rows: int
+    seconds: float
+
+
+@dataclass
+class ImportResult:
+    """What ``import_corpus`` added and how long loading and indexing took."""
+
+    rows: int
+    load_seconds: float
+    index_seconds: float
+
+
+def ann_index(quantization: Optional[str] = None) -> str:
+    """Return the statement creating the ANN index that vector search uses in ``quantization`` mode.
+
+    Raises:
+        ValueError: If ``quantization`` is not a known mode.
+    """
+    if not quantization:
+        return ANN_INDEX
+    if quantization not in QUANTIZED_INDEXES:
+        raise ValueError(f"Unknown vector quantization '{quantization}'. Expected one of {sorted(QUANTIZED_INDEXES)}.")
+    return QUANTIZED_INDEXES[quantization]
+
+
+def export_corpus(
+    path: str, collection_ids: Optional[Sequence[str]] = None, batch_size: int = BATCH_SIZE
+) -> ExportResult:
+    """Write the documents, optionally of some collections only, to a snapshot at ``path``.
+
+    A snapshot directory holds::
+
+        manifest.json        format version, row count, embedding dimensions
+        documents.jsonl.gz   id, collection_id, source_url and content per row
+        embeddings.npy       float32 (rows, dimensions); NaN rows have no embedding
+
+    Row ``i`` of the matrix belongs to line ``i`` of the documents file. Rows
+    are read through a server-side cursor in one repeatable-read transaction,
+    so the snapshot is consistent and memory use stays at one batch.
+    Embeddings go straight into a memory-mapped ``.npy`` file.
+
+    Returns:
+        The number of rows exported and the time it took.
+    """
+    os.makedirs(path, exist_ok=True)
+    filters = [Document.collection_id.in_(collection_ids)] if collection_ids else []
+    start = time.monotonic()
+    with get_engine().connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        count = conn.execute(select(func.count()).select_from(Document).where(*filters)).scalar()
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(path, EMBEDDINGS), mode="w+", dtype=np.float32, shape=(count, EMBEDDING_DIMENSIONS)
+        )
+        rows = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            # pgvector's binary form parses much faster than the text form
+            select(
+                Document.id,
+                Document.collection_id,
+                Document.source_url,
+                Document.content,
+                func.vector_send(Document.embedding).label("embedding"),
+            )
+            .where(*filters)
+            .order_by(Document.id)
+        )
+        exported = 0
+        with gzip.open(os.path.join(path, DOCUMENTS), "wt", encoding="utf-8") as documents:
+            for batch in rows.partitions():
+                for row in batch:
+                    documents.write(
+                        json.dumps(
+                            {
+                                "id": str(row.id),
+                                "collection_id": row.collection_id,
+                                "source_url": row.source_url,
+                                "content": row.content,
+                            }
+                        )
+                        + "\n"
+                    )
+                    if row.embedding is None:
+                        embeddings[exported] = np.nan
+                    else:
+                        embeddings[exported] = np.frombuffer(row.embedding, dtype=">f4", offset=4)
+                    exported += 1
+        embeddings.flush()
+        del embeddings
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(
+            {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "rows": exported,
+                "dimensions": EMBEDDING_DIMENSIONS,
+                "collections": sorted(collection_ids) if collection_ids else None,
+                "created_at": datetime.now(UTC).isoformat(),
+            },
+            f,
+            indent=2,
+        )
+    return ExportResult(exported, time.monotonic() - start)
+
+
+def read_manifest(path: str) -> dict:
+    """Return the snapshot's manifest after checking it matches this deployment.
+
+    Raises:
+        ValueError: If the snapshot has another format, version or embedding size.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} corpus snapshot.")
+    if manifest["dimensions"] != EMBEDDING_DIMENSIONS:
+        raise ValueError(
+            f"Snapshot embeddings have {manifest['dimensions']} dimensions; this deployment uses {EMBEDDING_DIMENSIONS}."
+        )
+    return manifest
+
+
+def _field(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return _NULL
+    return struct.pack(">i", len(value)) + value
+
+
+def encode_copy_rows(records: List[dict], embeddings: np.ndarray) -> bytes:
+    """Encode rows in PostgreSQL's binary ``COPY`` format, in ``COLUMNS`` order.
+
+    Vectors use pgvector's binary input: a 16-bit dimension count, 16 unused
+    bits and big-endian float4 values.
+    """
+    vector_header = struct.pack(">hh", embeddings.shape[1], 0)
+    values = embeddings.astype(">f4")
+    missing = np.isnan(embeddings).any(axis=1)
+    field_count = struct.pack(">h", len(COLUMNS))
+    out = io.BytesIO()
+    for record, vector, is_missing in zip(records, values, missing):
+        out.write(field_count)
+        out.write(_field(uuid.UUID(record["id"]).bytes))
+        out.write(_field(record["content"].encode("utf-8")))
+        out.write(_NULL if is_missing else _field(vector_header + vector.tobytes()))
+        for column in ("collection_id", "source_url"):
+            value = record.get(column)
+            out.write(_field(None if value is None else value.encode("utf-8")))
+    return out.getvalue()
+
+
+def _batches(path: str, embeddings: np.ndarray, batch_size: int) -> Iterator[bytes]:
+    with gzip.open(os.path.join(path, DOCUMENTS), "rt", encoding="utf-8") as documents:
+        records, offset = [], 0
+        for line in documents:
+            records.append(json.loads(line))
+            if len(records) == batch_size:
+                yield encode_copy_rows(records, embeddings[offset : offset + len(records)])
+                offset += len(records)
+                records = []
+        if records:
+            yield encode_copy_rows(records, embeddings[offset : offset + len(records)])
+
+
+def import_corpus(
+    path: str,
+    build_ann_index: bool = True,
+    batch_size: int = BATCH_SIZE,
+    maintenance_work_mem: str = "1GB",
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> ImportResult:
+    """Load a snapshot into the documents table.
+
+    Everything happens in one transaction. Secondary HNSW, IVFFlat and GIN
+    indexes on ``documents`` are dropped, the rows are streamed in with
+    binary ``COPY`` (through a staging table when ``documents`` already has
+    rows, so existing ids are kept), then the dropped indexes and, with
+    ``build_ann_index``, the ANN index matching ``VECTOR_QUANTIZATION`` are
+    built once. ``progress`` is called with the rows copied so far and the
+    total after every batch.
+
+    Returns:
+        The number of rows added and the time spent loading and indexing.
+    """
+    ann = ann_index(os.getenv("VECTOR_QUANTIZATION")) if build_ann_index else None
+    manifest = read_manifest(path)
+    embeddings = np.load(os.path.join(path, EMBEDDINGS), mmap_mode="r")
+    if len(embeddings) != manifest["rows"]:
+        raise ValueError(f"{EMBEDDINGS} has {len(embeddings)} rows; the manifest lists {manifest['rows']}.")
+    init_db()
+    start = time.monotonic()
+    connection = get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM documents)")
+        direct = not cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'documents'"
+        )
+        deferred = [
+            (name, definition)
+            for name, definition in cursor.fetchall()
+            if any(f"USING {method} " in definition for method in DEFERRED_INDEX_METHODS)
+        ]
+        for name, _ in deferred:
+            cursor.execute(f'DROP INDEX "{name}"')
+
+        target = "documents"
+        if not direct:
+            cursor.execute(
+                "CREATE TEMP TABLE documents_import ON COMMIT DROP AS "
+                f"SELECT {', '.join(COLUMNS)} FROM documents WITH NO DATA"
+            )
+            target = "documents_import"
+        copy = f"COPY {target} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+        for i, batch in enumerate(_batches(path, embeddings, batch_size)):
+            # The header and trailer frame each COPY statement
+            cursor.copy_expert(copy, io.BytesIO(_COPY_HEADER + batch + _COPY_TRAILER))
+            if progress is not None:
+                progress(min(manifest["rows"], (i + 1) * batch_size), manifest["rows"])
+        added = manifest["rows"]
+        if not direct:
+            cursor.execute(
+                f"INSERT INTO documents ({', '.join(COLUMNS)}) SELECT {', '.join(COLUMNS)} FROM documents_import "
+                "ON CONFLICT (id) DO NOTHING"
+            )
+            added = cursor.rowcount
+
+        load_seconds = time.monotonic() - start
+        cursor.execute("SELECT set_config('maintenance_work_mem', %s, true)", (maintenance_work_mem,))
+        for _, definition in deferred:
+            cursor.execute(definition)
+        if ann is not None:
+            cursor.execute(ann)
+        cursor.execute("ANALYZE documents")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return ImportResult(added, load_seconds, time.monotonic() - start - load_seconds)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Run the export or import command."""
+    parser = argparse.ArgumentParser(
+        description="Export the documents corpus to a snapshot directory, or import one.",
+        epilog="Example: python -m agent.snapshot export /tmp/corpus && python -m agent.snapshot import /tmp/corpus",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write the corpus to a snapshot directory.")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--collection", action="append", help="Only export this collection; repeatable.")
+    export_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    import_parser = commands.add_parser("import", help="Load a snapshot directory into the corpus.")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--no-ann-index", action="store_true", help="Skip building the ANN index.")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    import_parser.add_argument("--maintenance-work-mem", default="1GB", help="Memory for index builds.")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        exported = export_corpus(args.path, args.collection, args.batch_size)
+        print(f"Exported {exported.rows} documents to {args.path} in {exported.seconds:.1f}s")
+    else:
+        imported = import_corpus(
+            args.path,
+            not args.no_ann_index,
+            args.batch_size,
+            args.maintenance_work_mem,
+            progress=lambda copied, total: print(f"Copied {copied}/{total} documents"),
+        )
+        print(
+            f"Imported {imported.rows} documents from {args.path}: loaded in {imported.load_seconds:.1f}s, "
+            f"indexed in {imported.index_seconds:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
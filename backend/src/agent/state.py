@@ -1,4 +1,4 @@
-from typing import List, TypedDict, Any, Annotated
+from typing import List, Optional, TypedDict, Any, Annotated
 import operator
 from langchain_core.messages import BaseMessage
 
@@ -6,11 +6,47 @@ class AgentState(TypedDict):
     messages: List[BaseMessage]
     research_topic: str
     search_queries: List[str]
-    # The results of the search queries
+    # The results of the search queries, as ids into the abstracts table
+    abstract_ids: Annotated[List[str], operator.add]
+    # Abstracts passed inline, e.g. by callers or when the abstracts table is unreachable
     literature_abstracts: Annotated[List[Any], operator.add]
     # The full text of the literature
     literature_full_text: List[str]
     is_sufficient: bool
     knowledge_gap: str
     report: str
-    research_loop_count: int
\ No newline at end of file
+    research_loop_count: int
+    # Queries already sent to the search sources and their embeddings
+    executed_queries: List[str]
+    executed_query_embeddings: List[List[float]]
+    # Unique to this run, unlike the collection, which runs reusing a corpus share
+    run_id: str
+    # The corpus (documents.collection_id) this run reads and writes
+    collection_id: str
+    topic_embedding: List[float]
+    # Set when the corpus of an earlier run on a similar topic is reused
+    topic_cache_hit: bool
+    delta_search: bool
+    # Searches skipped because the query paraphrased an executed one
+    searches_saved: Annotated[int, operator.add]
+    # Clusters of near-duplicate abstracts collapsed to one record
+    near_duplicate_clusters: Annotated[int, operator.add]
+    # Fraction of the last search's abstracts unlike any collected before
+    novelty: float
+    # Set when a follow-up search found too little that is new to reflect on
+    novelty_exhausted: bool
+    reflection_calls_saved: Annotated[int, operator.add]
+    # Speculative full-text prefetches used (hits), not made (misses) and unused (wasted)
+    prefetch_stats: dict
+    # PDF URLs the resource management pipeline already downloaded and stored
+    pipelined_urls: List[str]
+    # Pages, chunks and peak RSS of each document ingested in streaming mode
+    ingestion_stats: Annotated[List[dict], operator.add]
+    # Unix time by which the report must be produced; None runs without a deadline
+    deadline: Optional[float]
+    # Set when the deadline leaves no time for another search loop
+    out_of_time: bool
+    # Work skipped or reduced to meet the deadline
+    degradations: Annotated[List[str], operator.add]
+    # Unix time the run was submitted, from which its deadline counts; unset counts from its start
+    submitted_at: Optional[float]
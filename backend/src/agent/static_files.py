@@ -0,0 +1,104 @@
+"""Serving of the frontend build with precompressed assets and cache headers."""
+
+import mimetypes
+import os
+import re
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# Preferred first; the build writes ``<file>.br`` and ``<file>.gz`` next to each asset
+ENCODINGS: List[Tuple[str, str]] = [("br", ".br"), ("gzip", ".gz")]
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Vite names bundled files like ``assets/index-BXk2a9_Q.js``
+HASHED_ASSET_PATTERN = re.compile(r"(^|[\\/])assets[\\/][^\\/]+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """Return the content codings a client accepts, ignoring those with ``q=0``."""
+    accepted = []
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.append(coding.strip().lower())
+    return accepted
+
+
+def cache_control(path: str) -> str:
+    """Return the Cache-Control policy for a file of the frontend build.
+
+    Content-hashed bundles never change under the same name, so browsers may
+    keep them for a year. Everything else, notably ``index.html`` which points
+    at the current bundles, is revalidated on every use.
+    """
+    if HASHED_ASSET_PATTERN.search(path):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves build-time ``.br``/``.gz`` variants.
+
+    When the client accepts an encoding whose variant exists next to the
+    requested file, that variant is sent with ``Content-Encoding`` and the
+    original file's media type. ETags come from the file actually sent, so
+    conditional requests get 304 per encoding. Every response carries the
+    ``cache_control`` policy.
+    """
+
+    def file_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        """Build the response for a regular file, preferring a precompressed variant."""
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": cache_control(str(full_path))}
+        media_type, _ = mimetypes.guess_type(str(full_path))
+
+        variant = self._find_variant(str(full_path), request_headers.get("accept-encoding", ""))
+        if variant is not None:
+            encoding, variant_path, variant_stat = variant
+            headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+            response = FileResponse(
+                variant_path,
+                status_code=status_code,
+                stat_result=variant_stat,
+                media_type=media_type,
+                headers=headers,
+            )
+        else:
+            if any(os.path.exists(str(full_path) + suffix) for _, suffix in ENCODINGS):
+                headers["Vary"] = "Accept-Encoding"
+            response = FileResponse(
+                full_path, status_code=status_code, stat_result=stat_result, media_type=media_type, headers=headers
+            )
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _find_variant(self, full_path: str, accept_encoding: str) -> Optional[Tuple[str, str, os.stat_result]]:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            return encoding, full_path + suffix, variant_stat
+        return None
@@ -1,13 +1,16 @@
 import os
-from typing import List
+from typing import ClassVar, List, Optional
 from pydantic import BaseModel, Field
 from langchain_community.tools import ArxivQueryRun, PubmedQueryRun
-# from langchain_community.tools.semanticscholar.tool import SemanticScholarQueryRun
+from langchain_community.tools.semanticscholar.tool import SemanticScholarQueryRun
 from langchain.tools import tool
 from unpywall import Unpywall
 from pyzotero import zotero
 from dotenv import load_dotenv
 
+from agent.ratelimit import acquire
+from agent.resilience import CircuitOpenError, call_with_resilience
+
 load_dotenv()
 
 # Unpaywall configuration
@@ -40,22 +43,105 @@ class ResearchResult(BaseModel):
         description="A list of sources used for the research."
     )
 
+class Paper(BaseModel):
+    """A search hit normalized across literature sources."""
+
+    title: str = Field(description="The title of the paper.")
+    abstract: str = Field(default="", description="The abstract or summary text.")
+    doi: Optional[str] = Field(default=None, description="The DOI, if known.")
+    authors: List[str] = Field(default_factory=list, description="The author names.")
+    published: Optional[str] = Field(default=None, description="The publication date or year.")
+    sources: List[str] = Field(
+        default_factory=list, description="The sources that returned this paper."
+    )
+
+    def to_text(self) -> str:
+        """Render the paper as the abstract text stored in the agent state."""
+        lines = [self.title, f"Source: {', '.join(self.sources)}"]
+        if self.published:
+            lines.append(f"Published: {self.published}")
+        if self.authors:
+            lines.append(f"Authors: {', '.join(self.authors)}")
+        if self.doi:
+            lines.append(f"DOI: {self.doi}")
+        if self.abstract:
+            lines.append(self.abstract)
+        return "\n".join(lines)
+
+class SearchSourceError(Exception):
+    """Raised when a search API reports an error in place of results."""
+
+
+class RateLimitedTool:
+    """Mixin for query tools that guards each search against a flaky API.
+
+    Every search takes a rate-limit token, goes through the circuit breaker of
+    the API host and is hedged, since searches are idempotent. Error strings
+    returned by the wrapped tool are raised as ``SearchSourceError`` so that
+    they count as failures.
+    """
+
+    rate_limit_provider: ClassVar[str] = ""
+    host: ClassVar[str] = ""
+    error_prefix: ClassVar[str] = ""
+
+    def _search(self, *args, **kwargs):
+        result = super()._run(*args, **kwargs)
+        if self.error_prefix and isinstance(result, str) and result.startswith(self.error_prefix):
+            raise SearchSourceError(result)
+        return result
+
+    def _run(self, *args, **kwargs):
+        # The token is taken outside the timed and hedged call, so waiting for it is not latency
+        acquire(self.rate_limit_provider)
+        return call_with_resilience(self.host, self._search, *args, hedge=True, **kwargs)
+
+
+class ArxivSearchTool(RateLimitedTool, ArxivQueryRun):
+    """arXiv search under the shared rate limiter."""
+
+    rate_limit_provider: ClassVar[str] = "arxiv"
+    host: ClassVar[str] = "export.arxiv.org"
+    error_prefix: ClassVar[str] = "Arxiv exception"
+
+
+class PubmedSearchTool(RateLimitedTool, PubmedQueryRun):
+    """PubMed search under the shared rate limiter."""
+
+    rate_limit_provider: ClassVar[str] = "pubmed"
+    host: ClassVar[str] = "eutils.ncbi.nlm.nih.gov"
+    error_prefix: ClassVar[str] = "PubMed exception"
+
+
+class SemanticScholarSearchTool(RateLimitedTool, SemanticScholarQueryRun):
+    """Semantic Scholar search under the shared rate limiter."""
+
+    rate_limit_provider: ClassVar[str] = "semantic_scholar"
+    host: ClassVar[str] = "api.semanticscholar.org"
+
+
 # Tools
-arxiv_tool = ArxivQueryRun()
-pubmed_tool = PubmedQueryRun()
-# semantic_scholar_tool = SemanticScholarQueryRun()
+arxiv_tool = ArxivSearchTool()
+pubmed_tool = PubmedSearchTool()
+semantic_scholar_tool = SemanticScholarSearchTool()
+
+# Prefixes of unpaywall_tool results that report a failed lookup instead of an answer
+UNPAYWALL_ERROR_PREFIXES = ("Skipped:", "An error occurred:")
 
 @tool
 def unpaywall_tool(doi: str) -> str:
     """Searches Unpywall for a given DOI to find open-access versions of a research paper."""
     try:
-        paper = Unpywall.doi(dois=[doi])
+        acquire("unpaywall")
+        paper = call_with_resilience("api.unpaywall.org", Unpywall.doi, dois=[doi], hedge=True)
         if not paper.empty and paper['is_oa'].iloc[0]:
             oa_status = paper['oa_status'].iloc[0]
             best_oa_url = paper['best_oa_location.url'].iloc[0]
             return f"Open access version found! Status: {oa_status}. URL: {best_oa_url}"
         else:
             return "No open access version found for this DOI."
+    except CircuitOpenError as e:
+        return f"Skipped: {e}"
     except Exception as e:
         return f"An error occurred: {e}"
 
@@ -63,6 +149,7 @@ def unpaywall_tool(doi: str) -> str:
 def zotero_tool(paper_info: dict) -> str:
     """Adds a paper to a Zotero library."""
     try:
+        acquire("zotero")
         zot = zotero.Zotero(os.getenv("ZOTERO_LIBRARY_ID"), os.getenv("ZOTERO_LIBRARY_TYPE"), os.getenv("ZOTERO_API_KEY"))
         # Create a new item
         template = zot.item_template('journalArticle')
@@ -0,0 +1,69 @@
+"""Reuse of recent runs on semantically similar topics."""
+
+from datetime import UTC, datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from agent.database import ResearchRun, SessionLocal
+from agent.metrics import metrics
+
+
+class CachedRun(NamedTuple):
+    """A completed run whose topic is close enough to reuse its corpus."""
+
+    collection_id: str
+    topic: str
+    similarity: float
+
+
+def find_cached_run(
+    topic_embedding: List[float], threshold: float, max_age_hours: float
+) -> Optional[CachedRun]:
+    """Return the most similar completed run, if it is above ``threshold``.
+
+    Only runs younger than ``max_age_hours`` are considered. Every lookup is
+    counted in the ``topic_cache_lookups`` metric (``result`` is ``hit`` or
+    ``miss``), the best similarity is observed in ``topic_cache_similarity`` and
+    the process hit rate is published as the ``topic_cache_hit_rate`` gauge.
+    """
+    cutoff = datetime.now(UTC) - timedelta(hours=max_age_hours)
+    db = SessionLocal()
+    try:
+        distance = ResearchRun.topic_embedding.cosine_distance(topic_embedding)
+        row = (
+            db.query(ResearchRun.collection_id, ResearchRun.topic, distance.label("distance"))
+            .filter(ResearchRun.created_at >= cutoff)
+            .order_by(distance)
+            .first()
+        )
+    finally:
+        db.close()
+
+    similarity = None if row is None else 1.0 - float(row.distance)
+    if similarity is not None:
+        metrics.observe("topic_cache_similarity", similarity)
+    hit = similarity is not None and similarity >= threshold
+    metrics.inc("topic_cache_lookups", result="hit" if hit else "miss")
+    metrics.set_gauge("topic_cache_hit_rate", hit_rate())
+    if not hit:
+        return None
+    return CachedRun(collection_id=row.collection_id, topic=row.topic, similarity=similarity)
+
+
+def record_run(topic: str, topic_embedding: List[float], collection_id: str) -> None:
+    """Store a completed run so that later, similar topics can reuse its corpus."""
+    db = SessionLocal()
+    try:
+        db.add(ResearchRun(topic=topic, topic_embedding=topic_embedding, collection_id=collection_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def hit_rate() -> Optional[float]:
+    """Return the fraction of topic lookups that were hits in this process."""
+    hits = metrics.counter("topic_cache_lookups", result="hit")
+    total = hits + metrics.counter("topic_cache_lookups", result="miss")
+    return hits / total if total else None
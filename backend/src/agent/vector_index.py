@@ -0,0 +1,403 @@
+"""In-memory vector indexes that answer retrieval without the database."""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import cache
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+from agent.database import EMBEDDING_DIMENSIONS, RRF_K, Document, get_engine
+from agent.metrics import metrics
+
+load_dotenv()
+
+DEFAULT_MAX_BYTES = 1024**3
+INITIAL_CAPACITY = 1024
+VECTORS = "vectors.npy"
+DOCUMENTS = "documents.jsonl.gz"
+LOAD_BATCH_SIZE = 10000
+# Seconds between checks of a loaded index against the collection's row count in Postgres
+DEFAULT_CHECK_INTERVAL = 10.0
+
+
+class VectorIndex:
+    """Exact cosine search over one collection's chunks, held in process memory.
+
+    Embeddings are L2-normalised into a contiguous float32 matrix so a query
+    is one matrix-vector product followed by ``argpartition`` for the top k.
+    The matrix grows by doubling; rows are written before the row count is
+    published, so searches running during an ``add`` see a consistent prefix.
+    """
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, capacity: int = INITIAL_CAPACITY):
+        self.dimensions = dimensions
+        self._matrix = np.empty((max(1, capacity), dimensions), dtype=np.float32)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.ids: List[str] = []
+        self.contents: List[str] = []
+        self.source_urls: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        """Return the number of indexed chunks."""
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the embedding matrix."""
+        return self._matrix.nbytes
+
+    def add(
+        self,
+        ids: Sequence[str],
+        contents: Sequence[str],
+        source_urls: Sequence[Optional[str]],
+        embeddings,
+    ) -> None:
+        """Append rows; ``embeddings`` is anything ``np.asarray`` turns into ``(n, dimensions)``."""
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimensions)
+        if not len(vectors):
+            return
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self._lock:
+            needed = self._count + len(vectors)
+            if needed > len(self._matrix) or not self._matrix.flags.writeable:
+                # Memory-mapped matrices are read-only, so the first add copies them
+                grown = np.empty((max(needed, 2 * len(self._matrix)), self.dimensions), dtype=np.float32)
+                grown[: self._count] = self._matrix[: self._count]
+                self._matrix = grown
+            self._matrix[self._count : needed] = vectors
+            self.ids.extend(str(i) for i in ids)
+            self.contents.extend(contents)
+            self.source_urls.extend(source_urls)
+            self._count = needed
+
+    def search(self, query_embedding, k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(row, cosine distance)`` pairs, nearest first."""
+        return self.search_many([query_embedding], k)[0]
+
+    def search_many(self, query_embeddings, k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Search for several queries with one matrix product; one result list per query."""
+        matrix, count = self._matrix, self._count
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimensions)
+        if count == 0 or k <= 0:
+            return [[] for _ in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        # (queries, rows), so each query's scores are contiguous
+        scores = queries @ matrix[:count].T
+        if k < count:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(count), (len(queries), count))
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        return [
+            [(int(row), float(1.0 - query_scores[row])) for row in rows]
+            for rows, query_scores in zip(top, scores)
+        ]
+
+    def save(self, path: str) -> None:
+        """Write the index to the directory ``path``, replacing any earlier copy."""
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            count = self._count
+            matrix = self._matrix[:count]
+            records = list(zip(self.ids[:count], self.contents[:count], self.source_urls[:count]))
+        documents = os.path.join(path, DOCUMENTS)
+        with gzip.open(documents + ".tmp", "wt", encoding="utf-8") as f:
+            for id_, content, source_url in records:
+                f.write(json.dumps({"id": id_, "content": content, "source_url": source_url}) + "\n")
+        with open(os.path.join(path, VECTORS + ".tmp"), "wb") as f:
+            np.save(f, matrix)
+        os.replace(documents + ".tmp", documents)
+        os.replace(os.path.join(path, VECTORS + ".tmp"), os.path.join(path, VECTORS))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["VectorIndex"]:
+        """Open an index saved with ``save``, memory-mapping its matrix.
+
+        Returns:
+            The index, or ``None`` if ``path`` holds no complete copy.
+        """
+        try:
+            matrix = np.load(os.path.join(path, VECTORS), mmap_mode="r")
+            with gzip.open(os.path.join(path, DOCUMENTS), "rt", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        except (OSError, ValueError, EOFError):
+            return None
+        if matrix.ndim != 2 or len(matrix) != len(records):
+            return None
+        index = cls(matrix.shape[1], capacity=1)
+        index._matrix = matrix
+        index.ids = [record["id"] for record in records]
+        index.contents = [record["content"] for record in records]
+        index.source_urls = [record["source_url"] for record in records]
+        index._count = len(records)
+        return index
+
+
+def _collection_filters(collection_id: Optional[str]) -> list:
+    filters = [Document.embedding.isnot(None)]
+    if collection_id is not None:
+        filters.append(Document.collection_id == collection_id)
+    return filters
+
+
+def collection_size(collection_id: Optional[str]) -> int:
+    """Return the number of embedded rows in a collection, or in all of them."""
+    with get_engine().connect() as conn:
+        return conn.execute(select(func.count()).select_from(Document).where(*_collection_filters(collection_id))).scalar_one()
+
+
+def load_collection(collection_id: Optional[str]) -> VectorIndex:
+    """Build an index from the embedded rows of ``documents`` in a collection, or all of them."""
+    filters = _collection_filters(collection_id)
+    index = VectorIndex()
+    with get_engine().connect() as conn:
+        rows = conn.execution_options(stream_results=True, yield_per=LOAD_BATCH_SIZE).execute(
+            # pgvector's binary form parses much faster than the text form
+            select(
+                Document.id,
+                Document.content,
+                Document.source_url,
+                func.vector_send(Document.embedding).label("embedding"),
+            ).where(*filters)
+        )
+        for batch in rows.partitions():
+            index.add(
+                [row.id for row in batch],
+                [row.content for row in batch],
+                [row.source_url for row in batch],
+                np.stack([np.frombuffer(row.embedding, dtype=">f4", offset=4) for row in batch]),
+            )
+    return index
+
+
+class VectorIndexCache:
+    """Per-collection ``VectorIndex``es kept in memory, least recently used first out.
+
+    A collection is loaded from ``directory`` when a saved copy exists and
+    from Postgres otherwise. Indexes are evicted once their matrices together
+    exceed ``max_bytes``. With a ``directory`` every index is also saved there
+    after loading and, once ``flush`` is called, after ``add``s, so a
+    restarted worker can answer from disk while Postgres is unavailable.
+
+    Other workers add rows to the same collections, so at most every
+    ``check_interval`` seconds ``get`` compares an index's row count with
+    Postgres and reloads it when they differ. When Postgres cannot be
+    reached, the index is used as it is.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        directory: Optional[str] = None,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._indexes: OrderedDict[Optional[str], VectorIndex] = OrderedDict()
+        # When each index last matched Postgres, and those changed since they were saved
+        self._checked: Dict[Optional[str], float] = {}
+        self._dirty: Set[Optional[str]] = set()
+
+    def _path(self, collection_id: Optional[str]) -> Optional[str]:
+        if not self.directory:
+            return None
+        name = "all" if collection_id is None else hashlib.sha256(collection_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def _save(self, collection_id: Optional[str], index: VectorIndex) -> None:
+        path = self._path(collection_id)
+        if path is None:
+            return
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Failed to save the vector index for {collection_id} to {path}. Error: {e}")
+
+    def _cached(self, collection_id: Optional[str]) -> Optional[VectorIndex]:
+        with self._lock:
+            index = self._indexes.get(collection_id)
+            if index is not None:
+                self._indexes.move_to_end(collection_id)
+                return index
+            path = self._path(collection_id)
+            index = VectorIndex.load(path) if path else None
+            if index is not None:
+                metrics.inc("vector_index_loads", source="disk")
+                # The saved copy may be behind Postgres, so the next get checks it
+                self._insert(collection_id, index, current=False)
+            return index
+
+    def _insert(self, collection_id: Optional[str], index: VectorIndex, current: bool = True) -> None:
+        if current:
+            self._checked[collection_id] = time.monotonic()
+        else:
+            self._checked.pop(collection_id, None)
+        self._indexes[collection_id] = index
+        self._indexes.move_to_end(collection_id)
+        total = sum(i.nbytes for i in self._indexes.values())
+        while total > self.max_bytes and len(self._indexes) > 1:
+            _, evicted = self._indexes.popitem(last=False)
+            total -= evicted.nbytes
+        metrics.set_gauge("vector_index_bytes", total)
+
+    def is_loaded(self, collection_id: Optional[str]) -> bool:
+        """Whether the collection is in memory, i.e. hot."""
+        with self._lock:
+            return collection_id in self._indexes
+
+    def _stale(self, collection_id: Optional[str], index: VectorIndex) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked.get(collection_id, float("-inf")) < self.check_interval:
+                return False
+            self._checked[collection_id] = now
+        try:
+            rows = collection_size(collection_id)
+        except Exception as e:
+            print(f"Failed to check the vector index for {collection_id} against Postgres. Error: {e}")
+            return False
+        if rows == len(index):
+            return False
+        metrics.inc("vector_index_stale")
+        print(f"Vector index for {collection_id} has {len(index)} rows, Postgres {rows}; reloading it.")
+        return True
+
+    def get(self, collection_id: Optional[str]) -> VectorIndex:
+        """Return the collection's index, loading it from disk or Postgres if needed."""
+        stale = self._cached(collection_id)
+        if stale is not None and not self._stale(collection_id, stale):
+            return stale
+        index = load_collection(collection_id)
+        metrics.inc("vector_index_loads", source="postgres")
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first
+            existing = self._indexes.get(collection_id)
+            if existing is not None and existing is not stale:
+                return existing
+            self._insert(collection_id, index)
+            self._dirty.discard(collection_id)
+        self._save(collection_id, index)
+        return index
+
+    def add(
+        self,
+        collection_id: Optional[str],
+        ids: Sequence[str],
+        contents: Sequence[str],
+        source_urls: Sequence[Optional[str]],
+        embeddings,
+    ) -> None:
+        """Add freshly committed rows to the collection's index if it is in memory or on disk.
+
+        A saved copy is loaded first so it does not fall behind. Collections
+        in neither place need nothing: they are read from Postgres, new rows
+        included, when first used. The saved copy is updated by the next
+        ``flush``.
+        """
+        if not len(ids):
+            return
+        targets = [None] if collection_id is None else [collection_id, None]
+        for target in targets:
+            index = self._cached(target)
+            if index is None:
+                continue
+            index.add(ids, contents, source_urls, embeddings)
+            if self.directory:
+                with self._lock:
+                    self._dirty.add(target)
+
+    def flush(self) -> None:
+        """Save the indexes changed by ``add`` since they were last saved.
+
+        Called once per ingesting node rather than per document, since every
+        save rewrites the whole index.
+        """
+        with self._lock:
+            dirty = [(target, self._indexes[target]) for target in self._dirty if target in self._indexes]
+            self._dirty.clear()
+        for target, index in dirty:
+            self._save(target, index)
+
+    def invalidate(self, collection_id: Optional[str]) -> None:
+        """Drop the collection's index from memory and disk so the next use reloads it."""
+        with self._lock:
+            for target in {collection_id, None}:
+                self._indexes.pop(target, None)
+                self._checked.pop(target, None)
+                self._dirty.discard(target)
+                path = self._path(target)
+                if path:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def _document(self, index: VectorIndex, row: int, collection_id: Optional[str]) -> Document:
+        return Document(
+            id=uuid.UUID(index.ids[row]),
+            content=index.contents[row],
+            collection_id=collection_id,
+            source_url=index.source_urls[row],
+        )
+
+    def query_documents(self, query_embedding: list, k: int = 5, collection_id: str = None) -> List[Document]:
+        """Answer ``database.query_documents`` from memory, with the same contract.
+
+        The returned ``Document``s are detached and carry no embedding.
+        """
+        index = self.get(collection_id)
+        metrics.inc("vector_index_queries")
+        return [self._document(index, row, collection_id) for row, _ in index.search(query_embedding, k)]
+
+    def multi_query_documents(
+        self,
+        query_embeddings: list,
+        k: int = 5,
+        collection_id: str = None,
+        candidates: int = None,
+        rrf_k: int = RRF_K,
+    ) -> List[Tuple[Document, float]]:
+        """Like ``database.multi_query_documents``, from memory and by vector ranking alone.
+
+        Each query's top ``candidates`` are fused with reciprocal rank fusion
+        and deduplicated by row.
+        """
+        index = self.get(collection_id)
+        metrics.inc("vector_index_queries", len(query_embeddings))
+        candidates = candidates or max(k * 4, 20)
+        scores = {}
+        for ranking in index.search_many(query_embeddings, candidates):
+            for rank, (row, _) in enumerate(ranking, start=1):
+                scores[row] = scores.get(row, 0.0) + 1.0 / (rrf_k + rank)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self._document(index, row, collection_id), score) for row, score in best]
+
+
+@cache
+def get_vector_index_cache() -> VectorIndexCache:
+    """Return the process-wide vector index cache.
+
+    ``VECTOR_INDEX_MAX_BYTES`` caps the memory its matrices use,
+    ``VECTOR_INDEX_DIR``, if set, is where indexes are persisted, and
+    ``VECTOR_INDEX_CHECK_SECONDS`` how often a loaded index is compared with
+    Postgres.
+    """
+    return VectorIndexCache(
+        int(os.getenv("VECTOR_INDEX_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        os.getenv("VECTOR_INDEX_DIR") or None,
+        float(os.getenv("VECTOR_INDEX_CHECK_SECONDS", DEFAULT_CHECK_INTERVAL)),
+    )
@@ -0,0 +1,143 @@
+"""Memoization of external work shared by concurrent research runs."""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.metrics import metrics
+from agent.singleflight import coalesced
+
+# Key under RunnableConfig["configurable"] that carries the cache into the nodes
+WORK_CACHE_KEY = "work_cache"
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+
+def approximate_size(value: Any) -> int:
+    """Return roughly how many bytes ``value`` and the containers and strings in it hold."""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approximate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class SharedWorkCache:
+    """Memoizes idempotent external work shared by concurrent research runs.
+
+    Runs of one batch often search the same queries, resolve the same DOIs and
+    ingest the same PDFs. The first caller of a key does the work; concurrent
+    callers wait for its result and later callers reuse it. Failures are
+    passed to the callers waiting at that moment but are not cached.
+
+    Finished results are kept least recently used first out once their
+    approximate size exceeds ``max_bytes``, so bulky namespaces such as PDF
+    text and chunk embeddings cannot grow without limit over a large batch.
+    Results larger than ``max_bytes`` are returned but not kept.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, Hashable], Future] = {}
+        # Sizes of the finished entries, the only ones evicted, least recently used first
+        self._sizes: OrderedDict[Tuple[str, Hashable], int] = OrderedDict()
+        self._bytes = 0
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+    def get_or_compute(self, namespace: str, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Return the cached result for ``(namespace, key)``, computing it with ``fn`` once."""
+        with self._lock:
+            future = self._entries.get((namespace, key))
+            owner = future is None
+            if owner:
+                future = Future()
+                self._entries[(namespace, key)] = future
+                self.misses[namespace] += 1
+            else:
+                if (namespace, key) in self._sizes:
+                    self._sizes.move_to_end((namespace, key))
+                self.hits[namespace] += 1
+        if not owner:
+            metrics.inc("shared_work_hits", namespace=namespace)
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop((namespace, key), None)
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        self._keep((namespace, key), approximate_size(result))
+        return result
+
+    def _keep(self, entry: Tuple[str, Hashable], size: int) -> None:
+        with self._lock:
+            if size > self.max_bytes:
+                self._entries.pop(entry, None)
+                return
+            self._sizes[entry] = size
+            self._bytes += size
+            for oldest in list(self._sizes):
+                if self._bytes <= self.max_bytes:
+                    break
+                if oldest == entry:
+                    continue
+                self._bytes -= self._sizes.pop(oldest)
+                self._entries.pop(oldest, None)
+                metrics.inc("shared_work_evictions", namespace=oldest[0])
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return hits and misses per namespace."""
+        with self._lock:
+            return {
+                namespace: {"hits": self.hits[namespace], "misses": self.misses[namespace]}
+                for namespace in sorted(set(self.hits) | set(self.misses))
+            }
+
+
+class CachedTool:
+    """Wraps a search tool so that identical queries share one call."""
+
+    def __init__(self, tool: Any, cache: SharedWorkCache, name: str):
+        self.tool = tool
+        self.cache = cache
+        self.name = name
+
+    def invoke(self, query: str) -> Any:
+        """Run the wrapped tool's ``invoke`` through the cache."""
+        return self.cache.get_or_compute(f"search:{self.name}", query, self.tool.invoke, query)
+
+
+def get_work_cache(config: Optional[RunnableConfig]) -> Optional[SharedWorkCache]:
+    """Return the shared cache passed in the run's config, if any."""
+    return ((config or {}).get("configurable") or {}).get(WORK_CACHE_KEY)
+
+
+def cached_call(
+    config: Optional[RunnableConfig], namespace: str, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Any:
+    """Call ``fn`` through the run's shared cache, if any.
+
+    Either way the call is coalesced with identical calls in flight in other
+    runs, so concurrent runs outside a batch also share the work.
+    """
+    cache = get_work_cache(config)
+    if cache is None:
+        return coalesced(namespace, key, fn, *args, **kwargs)
+    return cache.get_or_compute(namespace, key, coalesced, namespace, key, fn, *args, **kwargs)
+
+
+def texts_key(texts: Iterable[str]) -> str:
+    """Return a compact cache key for a list of texts."""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
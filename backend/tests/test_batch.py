@@ -0,0 +1,156 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agent.batch import BatchScheduler
+from agent.work_cache import WORK_CACHE_KEY, SharedWorkCache, cached_call
+
+
+def test_shared_work_cache_coalesces_concurrent_calls():
+    cache = SharedWorkCache()
+    calls = []
+
+    def slow_lookup(doi):
+        calls.append(doi)
+        time.sleep(0.05)
+        return f"result for {doi}"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("unpaywall", "10.1/x", slow_lookup, "10.1/x")))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["10.1/x"]
+    assert results == ["result for 10.1/x"] * 5
+    assert cache.stats() == {"unpaywall": {"hits": 4, "misses": 1}}
+
+
+def test_shared_work_cache_does_not_cache_failures():
+    cache = SharedWorkCache()
+    fn = MagicMock(side_effect=[RuntimeError("boom"), "ok"])
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("pdf_text", "http://a", fn)
+    assert cache.get_or_compute("pdf_text", "http://a", fn) == "ok"
+    assert fn.call_count == 2
+
+
+def test_shared_work_cache_evicts_least_recently_used_results():
+    cache = SharedWorkCache(max_bytes=3000)
+    fn = MagicMock(side_effect=lambda text: text)
+
+    cache.get_or_compute("pdf_text", "a", fn, "a" * 1000)
+    cache.get_or_compute("pdf_text", "b", fn, "b" * 1000)
+    cache.get_or_compute("pdf_text", "a", fn, "a" * 1000)
+    cache.get_or_compute("pdf_text", "c", fn, "c" * 1000)
+    # 'b' was the least recently used, so it was evicted to make room for 'c'
+    cache.get_or_compute("pdf_text", "a", fn, "a" * 1000)
+    cache.get_or_compute("pdf_text", "b", fn, "b" * 1000)
+    assert [call.args[0][0] for call in fn.call_args_list] == ["a", "b", "c", "b"]
+
+    # Too large to keep at all
+    cache.get_or_compute("pdf_text", "d", fn, "d" * 5000)
+    cache.get_or_compute("pdf_text", "d", fn, "d" * 5000)
+    assert fn.call_count == 6
+
+
+def test_cached_call_without_cache_calls_directly():
+    fn = MagicMock(return_value=1)
+    assert cached_call({}, "ns", "k", fn, 2) == 1
+    assert cached_call(None, "ns", "k", fn, 2) == 1
+    assert fn.call_count == 2
+
+
+def test_batch_scheduler_bounds_concurrency_and_shares_cache():
+    lock = threading.Lock()
+    active, peak, caches = [0], [0], []
+
+    def fake_run(topic, config, submitted_at=None):
+        caches.append(config["configurable"][WORK_CACHE_KEY])
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        if topic == "bad":
+            raise RuntimeError("run failed")
+        return {"report": f"report on {topic}", "collection_id": topic}
+
+    scheduler = BatchScheduler(max_concurrency=2, run_fn=fake_run)
+    status = scheduler.run(["a", "b", "bad", "c", " "])
+
+    assert peak[0] <= 2
+    assert len({id(c) for c in caches}) == 1
+    assert status["done"] is True
+    assert status["total"] == 4
+    assert status["completed"] == 3
+    assert status["failed"] == 1
+    assert status["runs_per_hour"] > 0
+    runs = {run["topic"]: run for run in status["runs"]}
+    assert runs["a"]["report"] == "report on a"
+    assert runs["bad"]["error"] == "run failed"
+
+
+def test_batch_scheduler_rejects_empty_batch():
+    with pytest.raises(ValueError):
+        BatchScheduler(run_fn=MagicMock()).submit(["", "  "])
+
+
+def test_finished_batches_drop_their_cache_and_expire():
+    def fake_run(topic, config, submitted_at=None):
+        return config["configurable"][WORK_CACHE_KEY].get_or_compute("ns", topic, dict)
+
+    scheduler = BatchScheduler(max_concurrency=1, run_fn=fake_run, ttl=0.05)
+    batch_id = scheduler.submit(["a", "a"])
+    status = scheduler.wait(batch_id, timeout=5)
+
+    assert status["shared_work"] == {"ns": {"hits": 1, "misses": 1}}
+    assert scheduler._batches[batch_id].cache is None
+    time.sleep(0.1)
+    assert scheduler.status(batch_id) is None
+
+
+@patch("agent.graph.unpaywall_tool")
+def test_failed_unpaywall_lookups_are_not_shared(mock_unpaywall_tool_instance):
+    from agent.graph import _resolve_pdf_url
+
+    mock_unpaywall_tool_instance.invoke.side_effect = [
+        "An error occurred: 503 Service Unavailable",
+        "Open access version found! Status: gold. URL: http://example.com/x.pdf",
+    ]
+    config = {"configurable": {WORK_CACHE_KEY: SharedWorkCache()}}
+
+    assert _resolve_pdf_url(config, "10.1/x") is None
+    assert _resolve_pdf_url(config, "10.1/x") == "http://example.com/x.pdf"
+    assert _resolve_pdf_url(config, "10.1/x") == "http://example.com/x.pdf"
+    assert mock_unpaywall_tool_instance.invoke.call_count == 2
+
+
+@patch("agent.batch.get_batch_scheduler")
+def test_batch_endpoints(mock_get_scheduler):
+    from agent.app import app
+
+    scheduler = BatchScheduler(max_concurrency=1, run_fn=lambda topic, config, submitted_at=None: {"report": topic.upper()})
+    mock_get_scheduler.return_value = scheduler
+    client = TestClient(app)
+
+    response = client.post("/batches", json={"topics": ["crispr", "mrna"]})
+    assert response.status_code == 202
+    batch_id = response.json()["batch_id"]
+    scheduler.wait(batch_id, timeout=5)
+
+    status = client.get(f"/batches/{batch_id}").json()
+    assert status["completed"] == 2
+    assert [run["report"] for run in status["runs"]] == ["CRISPR", "MRNA"]
+
+    assert client.get("/batches/unknown").status_code == 404
+    assert client.post("/batches", json={"topics": []}).status_code == 400
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+
+from agent.blob_store import BlobStore, sha256_hex
+
+
+def test_put_and_get_round_trip(tmp_path):
+    store = BlobStore(str(tmp_path))
+
+    content_hash = store.put("http://a/paper.pdf", b"%PDF-1", ["page one", "page two"])
+
+    assert content_hash == sha256_hex(b"%PDF-1")
+    assert store.get_pdf("http://a/paper.pdf") == b"%PDF-1"
+    assert store.get_pages("http://a/paper.pdf") == ["page one", "page two"]
+    assert store.get_pages("http://a/other.pdf") is None
+
+
+def test_page_text_is_written_and_read_incrementally(tmp_path):
+    store = BlobStore(str(tmp_path))
+    store.put("http://a/paper.pdf", b"%PDF-1", [])
+
+    writer = store.page_writer("http://a/paper.pdf")
+    writer.write(["page one"])
+    # Readers keep seeing the earlier text until the writer commits
+    assert store.get_pages("http://a/paper.pdf") == []
+    writer.write(["page two\nwith a newline"])
+    writer.commit()
+
+    pages = store.iter_pages("http://a/paper.pdf")
+    assert next(pages) == "page one"
+    assert list(pages) == ["page two\nwith a newline"]
+
+    writer = store.page_writer("http://a/paper.pdf")
+    writer.write(["partial"])
+    writer.discard()
+    assert store.get_pages("http://a/paper.pdf") == ["page one", "page two\nwith a newline"]
+    assert not [name for name in os.listdir(tmp_path / "text") if name.startswith(".tmp-")]
+
+
+def test_same_content_from_two_urls_is_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    store.put("http://a/paper.pdf", b"%PDF-1", ["text"])
+    store.put("http://mirror/paper.pdf", b"%PDF-1", ["text"])
+
+    assert len(os.listdir(tmp_path / "pdf")) == 1
+    assert store.content_hash("http://a/paper.pdf") == store.content_hash("http://mirror/paper.pdf")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = BlobStore(str(tmp_path), max_bytes=10**6)
+    for i, url in enumerate(["http://a/1.pdf", "http://a/2.pdf", "http://a/3.pdf"]):
+        content_hash = store.put(url, bytes([i]) * 1000, ["x" * 100])
+        for path in (store._pdf_path(content_hash), store._text_path(content_hash)):
+            os.utime(path, (1000 + i, 1000 + i))
+    # Reading the oldest entry makes it the most recently used
+    store.get_pages("http://a/1.pdf")
+
+    store.max_bytes = 2500
+    assert store.evict() == 1
+
+    assert store.get_pages("http://a/2.pdf") is None
+    assert store.get_pages("http://a/1.pdf") is not None
+    assert store.get_pages("http://a/3.pdf") is not None
+    assert store.size() <= 2500
+
+
+def test_eviction_removes_the_url_mappings_of_evicted_entries(tmp_path):
+    store = BlobStore(str(tmp_path), max_bytes=10**6)
+    old_hash = store.put("http://a/old.pdf", b"old" * 500, ["x"])
+    store.put("http://mirror/old.pdf", b"old" * 500, ["x"])
+    for path in (store._pdf_path(old_hash), store._text_path(old_hash)):
+        os.utime(path, (1000, 1000))
+    store.put("http://a/new.pdf", b"new" * 500, ["y"])
+
+    store.max_bytes = 2000
+    assert store.evict() == 1
+
+    assert os.listdir(tmp_path / "urls") == [os.path.basename(store._url_path("http://a/new.pdf"))]
+    assert store.content_hash("http://a/old.pdf") is None
+
+
+def test_mapping_to_a_missing_pdf_is_removed_on_read(tmp_path):
+    store = BlobStore(str(tmp_path))
+    content_hash = store.put("http://a/paper.pdf", b"%PDF-1", ["text"])
+    os.unlink(store._pdf_path(content_hash))
+
+    assert store.get_pdf_path("http://a/paper.pdf") is None
+    assert not os.path.exists(store._url_path("http://a/paper.pdf"))
+
+
+def test_store_is_shared_between_processes(tmp_path):
+    store = BlobStore(str(tmp_path))
+    code = (
+        "import sys; from agent.blob_store import BlobStore; "
+        "BlobStore(sys.argv[1]).put('http://a/p.pdf', b'%PDF', ['from another worker'])"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    subprocess.run([sys.executable, "-c", code, str(tmp_path)], check=True, env=env)
+
+    assert store.get_pages("http://a/p.pdf") == ["from another worker"]
@@ -1,7 +1,9 @@
 import pytest
 import os
+from unittest.mock import patch
 from sqlalchemy import create_engine, text
-from agent.database import get_db_connection, init_db, insert_documents, query_documents, Document, Base, SessionLocal
+from agent.database import get_db_connection, init_db, instrument_pool, insert_documents, query_documents, hybrid_query_documents, multi_query_documents, create_quantized_index, widen_hnsw_search, store_abstracts, load_abstracts, load_abstract_keys, Document, Base, SessionLocal
+from agent.metrics import metrics
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -79,3 +81,139 @@ def test_query_documents_multiple_results(db_session):
     # The order is not guaranteed, so we check if the contents are correct
     result_contents = {r.content for r in results}
     assert result_contents == {"Apple is a fruit.", "Orange is a fruit.", "Banana is a fruit."}
+
+def test_query_documents_by_collection(db_session):
+    insert_documents([{"text": "Run A document.", "embedding": [0.1]*1024}], collection_id="run-a")
+    insert_documents([{"text": "Run B document.", "embedding": [0.1]*1024, "source_url": "http://example.com/b.pdf"}], collection_id="run-b")
+
+    results = query_documents([0.1]*1024, k=5, collection_id="run-b")
+
+    assert [r.content for r in results] == ["Run B document."]
+    assert results[0].source_url == "http://example.com/b.pdf"
+
+def test_hybrid_query_finds_exact_terms(db_session):
+    # The vector ranking alone prefers the first two documents
+    insert_documents([
+        {"text": "General overview of genome editing tools.", "embedding": [0.1]*1024},
+        {"text": "Survey of gene regulation networks.", "embedding": [0.1]*1024},
+        {"text": "Knockout of BRCA1 increases sensitivity to PARP inhibitors.", "embedding": [-0.1]*1024},
+    ])
+
+    vector_only = query_documents([0.1]*1024, k=2)
+    assert all("BRCA1" not in r.content for r in vector_only)
+
+    results = hybrid_query_documents("BRCA1 knockout", [0.1]*1024, k=2)
+
+    assert len(results) == 2
+    assert any("BRCA1" in doc.content for doc, score in results)
+    assert all(score > 0 for doc, score in results)
+
+def test_hybrid_query_fuses_both_rankings(db_session):
+    insert_documents([
+        {"text": "PARP inhibitors in ovarian cancer.", "embedding": [0.1]*1024},
+        {"text": "Unrelated text about weather.", "embedding": [0.1]*1024},
+        {"text": "PARP inhibitors mechanism.", "embedding": [-0.1]*1024},
+    ], collection_id="fusion")
+
+    results = hybrid_query_documents("PARP inhibitors", [0.1]*1024, k=3, collection_id="fusion")
+
+    # Found by both rankings, so it is fused to the top
+    assert results[0][0].content == "PARP inhibitors in ovarian cancer."
+
+def _supports_quantization(session):
+    version = session.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(part) for part in version.split(".")[:2]) >= (0, 7)
+
+def test_query_documents_rejects_unknown_quantization(db_session):
+    with pytest.raises(ValueError):
+        query_documents([0.1]*1024, quantization="int4")
+
+@pytest.mark.parametrize("quantization", ["halfvec", "binary"])
+def test_quantized_query_reranks_exactly(db_session, quantization):
+    if not _supports_quantization(db_session):
+        pytest.skip("halfvec and binary_quantize need pgvector >= 0.7")
+    create_quantized_index(quantization)
+    insert_documents([
+        {"text": "far", "embedding": [-0.1]*1024},
+        {"text": "near", "embedding": [0.1]*512 + [0.05]*512},
+        {"text": "nearest", "embedding": [0.1]*1024},
+    ])
+
+    results = query_documents([0.1]*1024, k=2, quantization=quantization, candidates=3)
+
+    assert [r.content for r in results] == ["nearest", "near"]
+
+def test_store_and_load_abstracts(db_session):
+    ids = store_abstracts([
+        {"content": "Paper A\nSource: arxiv", "title_key": "paper a", "doi": "10.1/a"},
+        {"content": "Paper B\nSource: pubmed", "title_key": "paper b"},
+    ])
+    # Storing the same content again is a no-op with the same id
+    assert store_abstracts([{"content": "Paper B\nSource: pubmed"}]) == ids[1:]
+
+    assert load_abstracts(list(reversed(ids))) == ["Paper B\nSource: pubmed", "Paper A\nSource: arxiv"]
+    assert load_abstract_keys(ids) == {("title", "paper a"), ("doi", "10.1/a"), ("title", "paper b")}
+    assert load_abstracts([]) == []
+
+
+def test_instrument_pool_tracks_checkouts():
+    engine = create_engine(os.getenv("POSTGRES_URI"), pool_size=1, max_overflow=1)
+    instrument_pool(engine, 2)
+    exhausted = metrics.counter("db_pool_exhausted")
+    try:
+        with engine.connect():
+            assert metrics.gauge("db_pool_checked_out") == 1
+            with engine.connect():
+                assert metrics.gauge("db_pool_checked_out") == 2
+        assert metrics.gauge("db_pool_checked_out") == 0
+        assert metrics.gauge("db_pool_capacity") == 2
+        assert metrics.counter("db_pool_exhausted") == exhausted + 1
+    finally:
+        engine.dispose()
+
+def test_multi_query_fuses_and_dedupes_per_query_rankings(db_session):
+    def direction(*dims):
+        vector = [0.0] * 1024
+        for i in dims:
+            vector[i] = 1.0
+        return vector
+
+    insert_documents([
+        {"text": "attention heads in transformers", "embedding": direction(0)},
+        {"text": "protein structure prediction", "embedding": direction(1)},
+        {"text": "attention and protein folding", "embedding": direction(0, 1)},
+        {"text": "unrelated weather report", "embedding": direction(3)},
+    ], collection_id="multi")
+
+    results = multi_query_documents(
+        ["attention", "protein"], [direction(0), direction(1)], k=3, collection_id="multi"
+    )
+
+    contents = [doc.content for doc, _ in results]
+    assert len(contents) == len(set(contents)) == 3
+    # Ranked second by both queries, lexically and by vector, the shared document comes first
+    assert contents[0] == "attention and protein folding"
+    assert "unrelated weather report" not in contents
+    assert multi_query_documents([], [], k=3) == []
+
+
+def test_widen_hnsw_search_lasts_for_the_transaction(db_session):
+    widen_hnsw_search(db_session, 200)
+    assert db_session.execute(text("SELECT current_setting('hnsw.ef_search', true)")).scalar() == "200"
+    # Bounded by pgvector's limits
+    widen_hnsw_search(db_session, 5)
+    assert db_session.execute(text("SELECT current_setting('hnsw.ef_search', true)")).scalar() == "40"
+    widen_hnsw_search(db_session, 5000)
+    assert db_session.execute(text("SELECT current_setting('hnsw.ef_search', true)")).scalar() == "1000"
+    db_session.commit()
+    assert db_session.execute(text("SELECT current_setting('hnsw.ef_search', true)")).scalar() in (None, "", "40")
+
+def test_filtered_searches_widen_the_hnsw_scan(db_session):
+    insert_documents([{"text": "Run A document.", "embedding": [0.1]*1024}], collection_id="run-a")
+
+    with patch('agent.database.widen_hnsw_search', wraps=widen_hnsw_search) as mock_widen:
+        query_documents([0.1]*1024, k=5, collection_id="run-a")
+        multi_query_documents(["document"], [[0.1]*1024], k=5, collection_id="run-a", candidates=120)
+
+    assert mock_widen.call_args_list[0].args[1] == 5
+    assert mock_widen.call_args_list[1].args[1] == 120
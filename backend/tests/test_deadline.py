@@ -0,0 +1,61 @@
+import time
+
+from agent.configuration import Configuration
+from agent.deadline import (
+    DEFAULT_NODE_SECONDS,
+    MIN_HISTORY,
+    affords,
+    available,
+    deadline_from,
+    degrade,
+    expected_seconds,
+    pdf_budget,
+)
+from agent.metrics import metrics
+
+
+def test_without_a_deadline_nothing_degrades():
+    configurable = Configuration()
+
+    assert deadline_from(configurable) is None
+    assert available({}, configurable) is None
+    assert affords({"deadline": None}, configurable, "execute_searches")
+    assert pdf_budget({}, configurable) == (None, None)
+
+
+def test_deadline_counts_from_submission():
+    configurable = Configuration(run_deadline_seconds=60)
+
+    # A run that waited 50s in the queue has 10s left
+    assert deadline_from(configurable, time.time() - 50) - time.time() < 11
+    assert deadline_from(configurable) - time.time() > 59
+
+
+def test_estimates_switch_from_defaults_to_observed_durations():
+    metrics.reset()
+    assert expected_seconds("execute_searches", "reflection_and_refinement") == (
+        DEFAULT_NODE_SECONDS["execute_searches"] + DEFAULT_NODE_SECONDS["reflection_and_refinement"]
+    )
+    for _ in range(MIN_HISTORY):
+        metrics.observe("node_seconds", 2.0, node="execute_searches")
+
+    assert expected_seconds("execute_searches") == 2.0
+
+
+def test_budget_reserves_time_for_the_report():
+    metrics.reset()
+    configurable = Configuration(run_deadline_seconds=60, deadline_report_reserve_seconds=35, deadline_max_pages=5)
+    state = {"deadline": deadline_from(configurable)}
+
+    assert 24 < available(state, configurable) <= 25
+    assert affords(state, configurable, "execute_searches")
+    assert not affords(state, configurable, "execute_searches", "reflection_and_refinement")
+    assert pdf_budget(state, configurable) == (2, 5)
+    assert pdf_budget({"deadline": time.time() - 1}, configurable) == (0, 5)
+
+
+def test_degradations_are_counted():
+    before = metrics.counter("deadline_degradations", action="pdf_count")
+
+    assert degrade("pdf_count", "ingesting 2 of 5 PDFs") == "pdf_count: ingesting 2 of 5 PDFs"
+    assert metrics.counter("deadline_degradations", action="pdf_count") == before + 1
@@ -1,9 +1,17 @@
 import pytest
 from unittest.mock import patch, MagicMock
 import os
+import time
 from sqlalchemy import create_engine
-from agent.graph import graph
-from agent.database import init_db, Document, Base, SessionLocal
+from agent.graph import graph, automated_report_generation, automated_resource_management, execute_searches, rag_based_knowledge_synthesis
+from agent.metrics import metrics
+from agent.ratelimit import RateLimitTimeout
+from agent.resilience import HTTP_TIMEOUT
+from agent.database import init_db, load_abstracts, Abstract, Document, Base, ResearchRun, SessionLocal
+from agent.blob_store import BlobStore
+from agent.prefetch import Prefetcher
+from agent.vector_index import VectorIndexCache
+from agent.work_cache import SharedWorkCache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -27,9 +35,51 @@ def db_session():
     session = SessionLocal()
     yield session
     session.query(Document).delete()
+    session.query(ResearchRun).delete()
+    session.query(Abstract).delete()
     session.commit()
     session.close()
 
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path):
+    """Gives every test an empty blob store."""
+    store = BlobStore(str(tmp_path / "blobs"))
+    with patch('agent.graph.get_blob_store', return_value=store):
+        yield store
+
+@pytest.fixture(autouse=True)
+def vector_index_cache():
+    """Gives every test an empty in-process vector index."""
+    cache = VectorIndexCache()
+    with patch('agent.graph.get_vector_index_cache', return_value=cache):
+        yield cache
+
+@pytest.fixture(autouse=True)
+def mock_query_embeddings():
+    """Embeds retrieval queries without calling the embeddings API."""
+    with patch('agent.graph.get_query_embeddings') as mock_get:
+        mock_get.return_value.embed_documents.side_effect = lambda texts: [[0.1] * 1024 for _ in texts]
+        yield mock_get
+
+@pytest.fixture(autouse=True)
+def mock_secondary_sources():
+    """Keeps the federated search on the mocked arXiv tool only."""
+    with patch('agent.graph.pubmed_tool') as mock_pubmed, \
+         patch('agent.graph.semantic_scholar_tool') as mock_semantic_scholar:
+        mock_pubmed.invoke.return_value = {"documents": []}
+        mock_semantic_scholar.invoke.return_value = {"documents": []}
+        yield mock_pubmed, mock_semantic_scholar
+
+@pytest.fixture(autouse=True)
+def mock_similarity_embeddings():
+    """Gives every query its own direction so that no query counts as a paraphrase."""
+    directions = {}
+    with patch('agent.graph.get_similarity_embeddings') as mock_get:
+        mock_get.return_value.embed_documents.side_effect = lambda texts: [
+            [1.0 if i == directions.setdefault(t, len(directions)) else 0.0 for i in range(64)] for t in texts
+        ]
+        yield mock_get
+
 def test_graph_creation():
     """
     Tests that the graph is created successfully and is a compiled graph.
@@ -41,6 +91,7 @@ def test_graph_nodes():
     Tests that the graph has the expected nodes.
     """
     expected_nodes = [
+        "check_topic_cache",
         "generate_initial_queries",
         "execute_searches",
         "reflection_and_refinement",
@@ -56,8 +107,8 @@ def test_graph_nodes():
 @patch('agent.graph.unpaywall_tool')
 @patch('agent.graph.zotero_tool')
 @patch('requests.get')
-@patch('agent.graph.GoogleGenerativeAIEmbeddings.embed_documents')
-def test_full_agent_workflow_success(mock_embed_documents, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
+@patch('agent.graph.get_embeddings')
+def test_full_agent_workflow_success(mock_embeddings, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
     """
     Tests the full agent workflow for a successful run, mocking external services.
     """
@@ -72,7 +123,7 @@ def test_full_agent_workflow_success(mock_embed_documents, mock_requests_get, mo
     mock_zotero_tool_instance.invoke.return_value = "Successfully added paper to Zotero."
     mock_requests_get.return_value.raise_for_status.return_value = None
     mock_requests_get.return_value.content = b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Count 1/Kids[3 0 R]>>endobj\n3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj\n4 0 obj<</Length 55>>stream\nBT /F1 24 Tf 100 700 Td (Hello World!) Tj ET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000059 00000 n\n0000000111 00000 n\n0000000200 00000 n\ntrailer<</Size 5/Root 1 0 R>>startxref\n300\n%%EOF"
-    mock_embed_documents.return_value = [[0.1]*1024, [0.2]*1024] # Mock embeddings
+    mock_embeddings.return_value.embed_documents.return_value = [[0.1]*1024, [0.2]*1024] # Mock embeddings
 
     # Define the initial state
     initial_state = {"messages": [MagicMock(content="test topic")]}
@@ -85,13 +136,17 @@ def test_full_agent_workflow_success(mock_embed_documents, mock_requests_get, mo
     mock_arxiv_tool_instance.invoke.assert_called()
     mock_unpaywall_tool_instance.invoke.assert_called()
     mock_zotero_tool_instance.invoke.assert_called()
-    mock_requests_get.assert_called_with("http://example.com/paper.pdf")
-    mock_embed_documents.assert_called()
+    mock_requests_get.assert_called_with("http://example.com/paper.pdf", timeout=HTTP_TIMEOUT)
+    mock_embeddings.return_value.embed_documents.assert_called()
 
     # Verify documents are stored in the database
     docs_in_db = db_session.query(Document).all()
     assert len(docs_in_db) > 0
     assert final_state["report"] == "Final Report"
+    # The state references the abstracts; the reflection prompt resolved their text
+    assert len(final_state["abstract_ids"]) == 2
+    assert final_state["literature_abstracts"] == []
+    assert "abstract1" in str(mock_litellm_completion.call_args_list[1])
 
 @patch('litellm.llms.vertex_ai.gemini.vertex_and_google_ai_studio_gemini.VertexLLM.completion')
 @patch('agent.graph.arxiv_tool')
@@ -105,14 +160,18 @@ def test_reflection_loop(mock_arxiv_tool_instance, mock_litellm_completion, db_s
         MagicMock(choices=[MagicMock(message=MagicMock(content='{"is_sufficient": true, "knowledge_gap": "", "follow_up_queries": []}'))]), # reflection_and_refinement (sufficient)
         MagicMock(choices=[MagicMock(message=MagicMock(content='Final Report'))]), # automated_report_generation
     ]
-    mock_arxiv_tool_instance.invoke.return_value = {"documents": [MagicMock(page_content="abstract DOI: 10.1234/test.001")]}
+    # The follow-up search finds a new abstract, so the loop goes through reflection again
+    mock_arxiv_tool_instance.invoke.side_effect = [
+        {"documents": [MagicMock(page_content="abstract DOI: 10.1234/test.001")]},
+        {"documents": [MagicMock(page_content="another abstract DOI: 10.1234/test.002")]},
+    ]
 
     initial_state = {"messages": [MagicMock(content="test topic")]}
 
     with patch('agent.graph.unpaywall_tool') as mock_unpaywall_tool_instance, \
          patch('agent.graph.zotero_tool') as mock_zotero_tool_instance, \
          patch('requests.get'), \
-         patch('agent.graph.GoogleGenerativeAIEmbeddings.embed_documents'):
+         patch('agent.graph.get_embeddings'):
         final_state = graph.invoke(initial_state)
 
     # generate_initial_queries (1) + reflection_and_refinement (2) + automated_report_generation (1) = 4
@@ -122,13 +181,40 @@ def test_reflection_loop(mock_arxiv_tool_instance, mock_litellm_completion, db_s
     assert final_state["report"] == "Final Report"
 
 
+@patch('litellm.llms.vertex_ai.gemini.vertex_and_google_ai_studio_gemini.VertexLLM.completion')
+@patch('agent.graph.arxiv_tool')
+def test_reflection_loop_stops_when_nothing_new_is_found(mock_arxiv_tool_instance, mock_litellm_completion, db_session):
+    """
+    A follow-up search that only returns known abstracts ends the loop without a second reflection.
+    """
+    mock_litellm_completion.side_effect = [
+        MagicMock(choices=[MagicMock(message=MagicMock(content='{"query": ["q1"], "rationale": "test"}'))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content='{"is_sufficient": false, "knowledge_gap": "more info", "follow_up_queries": ["q2"]}'))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content='Final Report'))]),
+    ]
+    mock_arxiv_tool_instance.invoke.return_value = {"documents": [MagicMock(page_content="abstract DOI: 10.1234/test.001")]}
+
+    with patch('agent.graph.unpaywall_tool'), \
+         patch('agent.graph.zotero_tool'), \
+         patch('requests.get'), \
+         patch('agent.graph.get_embeddings'):
+        final_state = graph.invoke({"messages": [MagicMock(content="test topic")]})
+
+    assert mock_arxiv_tool_instance.invoke.call_count == 2
+    assert mock_litellm_completion.call_count == 3
+    assert final_state["novelty_exhausted"] is True
+    assert final_state["novelty"] == 0.0
+    assert final_state["reflection_calls_saved"] == 1
+    assert final_state["report"] == "Final Report"
+
+
 @patch('litellm.llms.vertex_ai.gemini.vertex_and_google_ai_studio_gemini.VertexLLM.completion')
 @patch('agent.graph.arxiv_tool')
 @patch('agent.graph.unpaywall_tool')
 @patch('agent.graph.zotero_tool')
 @patch('requests.get')
-@patch('agent.graph.GoogleGenerativeAIEmbeddings.embed_documents')
-def test_full_agent_workflow_no_unpaywall_pdf(mock_embed_documents, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
+@patch('agent.graph.get_embeddings')
+def test_full_agent_workflow_no_unpaywall_pdf(mock_embeddings, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
     """
     Tests the workflow when Unpaywall does not find an open-access PDF.
     The agent should continue the workflow without downloading or adding to Zotero.
@@ -144,10 +230,11 @@ def test_full_agent_workflow_no_unpaywall_pdf(mock_embed_documents, mock_request
     initial_state = {"messages": [MagicMock(content="test topic")]}
     final_state = graph.invoke(initial_state)
 
-    assert mock_unpaywall_tool_instance.invoke.call_count == 2
+    # The single abstract is stored once, so its DOI is resolved once
+    assert mock_unpaywall_tool_instance.invoke.call_count == 1
     mock_requests_get.assert_not_called() # Should not try to download
     mock_zotero_tool_instance.invoke.assert_not_called() # Should not try to add to Zotero
-    mock_embed_documents.assert_not_called() # Should not embed if download fails
+    mock_embeddings.return_value.embed_documents.assert_not_called() # Should not embed if download fails
     assert final_state["report"] == "Final Report"
 
 @patch('litellm.llms.vertex_ai.gemini.vertex_and_google_ai_studio_gemini.VertexLLM.completion')
@@ -155,8 +242,8 @@ def test_full_agent_workflow_no_unpaywall_pdf(mock_embed_documents, mock_request
 @patch('agent.graph.unpaywall_tool')
 @patch('agent.graph.zotero_tool')
 @patch('requests.get', side_effect=Exception("Download Error"))
-@patch('agent.graph.GoogleGenerativeAIEmbeddings.embed_documents')
-def test_full_agent_workflow_pdf_download_fails(mock_embed_documents, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
+@patch('agent.graph.get_embeddings')
+def test_full_agent_workflow_pdf_download_fails(mock_embeddings, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
     """
     Tests the workflow when downloading a PDF fails.
     The agent should handle the error and continue.
@@ -172,9 +259,9 @@ def test_full_agent_workflow_pdf_download_fails(mock_embed_documents, mock_reque
     initial_state = {"messages": [MagicMock(content="test topic")]}
     final_state = graph.invoke(initial_state)
 
-    assert mock_requests_get.call_count == 2
-    assert mock_zotero_tool_instance.invoke.call_count == 2 # Zotero is still called even if download fails
-    mock_embed_documents.assert_not_called() # Should not embed if download fails
+    assert mock_requests_get.call_count == 1
+    assert mock_zotero_tool_instance.invoke.call_count == 1 # Zotero is still called even if download fails
+    mock_embeddings.return_value.embed_documents.assert_not_called() # Should not embed if download fails
     assert final_state["report"] == "Final Report"
 
 @patch('litellm.llms.vertex_ai.gemini.vertex_and_google_ai_studio_gemini.VertexLLM.completion')
@@ -182,8 +269,8 @@ def test_full_agent_workflow_pdf_download_fails(mock_embed_documents, mock_reque
 @patch('agent.graph.unpaywall_tool')
 @patch('agent.graph.zotero_tool')
 @patch('requests.get')
-@patch('agent.graph.GoogleGenerativeAIEmbeddings.embed_documents')
-def test_full_agent_workflow_zotero_fails(mock_embed_documents, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
+@patch('agent.graph.get_embeddings')
+def test_full_agent_workflow_zotero_fails(mock_embeddings, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
     """
     Tests the workflow when the Zotero tool fails.
     The agent should log the error and continue to generate the report.
@@ -198,11 +285,498 @@ def test_full_agent_workflow_zotero_fails(mock_embed_documents, mock_requests_ge
     mock_zotero_tool_instance.invoke.return_value = "Failed to add paper to Zotero: some error"
     mock_requests_get.return_value.raise_for_status.return_value = None
     mock_requests_get.return_value.content = b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Count 1/Kids[3 0 R]>>endobj\n3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj\n4 0 obj<</Length 55>>stream\nBT /F1 24 Tf 100 700 Td (Hello World!) Tj ET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000059 00000 n\n0000000111 00000 n\n0000000200 00000 n\ntrailer<</Size 5/Root 1 0 R>>startxref\n300\n%%EOF"
-    mock_embed_documents.return_value = [[0.1]*1024]
+    mock_embeddings.return_value.embed_documents.return_value = [[0.1]*1024]
 
     initial_state = {"messages": [MagicMock(content="test topic")]}
     final_state = graph.invoke(initial_state)
 
+    assert mock_zotero_tool_instance.invoke.call_count == 1
+    assert final_state["report"] == "Final Report"
+
+
+
+@patch('agent.graph.arxiv_tool')
+def test_execute_searches_federates_and_dedupes(mock_arxiv_tool_instance, mock_secondary_sources):
+    """
+    Tests that every source is queried and that the same paper from two sources is kept once.
+    """
+    mock_pubmed, mock_semantic_scholar = mock_secondary_sources
+    mock_arxiv_tool_instance.invoke.return_value = "Published: 2024-01-01\nTitle: Shared Paper\nAuthors: A. Author\nSummary: arXiv version."
+    mock_pubmed.invoke.return_value = "Published: 2024-02-01\nTitle: Shared paper.\nCopyright Information: \nSummary::\nJournal version, doi 10.1234/shared.001"
+    mock_semantic_scholar.invoke.side_effect = Exception("API Error")
+
+    result = execute_searches({"search_queries": ["q1"], "literature_abstracts": []}, {})
+
+    mock_arxiv_tool_instance.invoke.assert_called_once_with("q1")
+    mock_pubmed.invoke.assert_called_once_with("q1")
+    mock_semantic_scholar.invoke.assert_called_once_with("q1")
+    # The state only references the stored abstracts
+    assert result["literature_abstracts"] == []
+    abstracts = load_abstracts(result["abstract_ids"])
+    assert len(abstracts) == 1
+    assert "Source: arxiv, pubmed" in abstracts[0]
+    assert "DOI: 10.1234/shared.001" in abstracts[0]
+
+    # A later loop returning the same paper adds nothing new
+    again = execute_searches({"search_queries": ["q2"], "abstract_ids": result["abstract_ids"]}, {})
+    assert again["abstract_ids"] == []
+
+    # Abstracts passed inline are deduplicated against too
+    inline = execute_searches({"search_queries": ["q3"], "literature_abstracts": abstracts}, {})
+    assert inline["abstract_ids"] == []
+
+
+@patch('agent.graph.arxiv_tool')
+def test_execute_searches_shares_work_within_a_batch(mock_arxiv_tool_instance):
+    """
+    Tests that runs sharing a work cache search an identical query only once.
+    """
+    mock_arxiv_tool_instance.invoke.return_value = "Published: 2024-01-01\nTitle: Shared Paper\nSummary: text."
+    config = {"configurable": {"work_cache": SharedWorkCache()}}
+
+    first = execute_searches({"search_queries": ["q1"], "literature_abstracts": []}, config)
+    second = execute_searches({"search_queries": ["q1"], "literature_abstracts": []}, config)
+
+    mock_arxiv_tool_instance.invoke.assert_called_once_with("q1")
+    assert first["abstract_ids"] == second["abstract_ids"]
+
+
+@patch('agent.graph.arxiv_tool')
+def test_execute_searches_collapses_near_duplicates(mock_arxiv_tool_instance, mock_secondary_sources):
+    """
+    Tests that a preprint and its journal version are kept once, also across loops.
+    """
+    mock_pubmed, _ = mock_secondary_sources
+    summary = (
+        "Deep learning predicts protein structures with high accuracy using attention networks trained on "
+        "sequence databases. We show that the predicted models reach experimental accuracy for most targets "
+        "and that confidence estimates identify the residues that are reliably placed"
+    )
+    mock_arxiv_tool_instance.invoke.return_value = f"Published: 2024-01-01\nTitle: Protein folding with attention\nSummary: {summary}."
+    mock_pubmed.invoke.return_value = f"Published: 2024-06-01\nTitle: Protein structure prediction with attention networks\nSummary::\n{summary} and evolutionary data. doi 10.1234/fold.001"
+
+    result = execute_searches({"search_queries": ["q1"]}, {})
+
+    assert result["near_duplicate_clusters"] == 1
+    abstracts = load_abstracts(result["abstract_ids"])
+    assert len(abstracts) == 1
+    assert "DOI: 10.1234/fold.001" in abstracts[0]
+    assert "Source: pubmed, arxiv" in abstracts[0]
+
+    mock_pubmed.invoke.return_value = {"documents": []}
+    again = execute_searches({"search_queries": ["q2"], "abstract_ids": result["abstract_ids"]}, {})
+    assert again["abstract_ids"] == []
+    assert again["near_duplicate_clusters"] == 1
+
+
+@patch('agent.graph.arxiv_tool')
+def test_execute_searches_skips_paraphrased_queries(mock_arxiv_tool_instance, mock_similarity_embeddings):
+    """
+    Tests that follow-up queries close to an executed query are not searched again.
+    """
+    mock_arxiv_tool_instance.invoke.return_value = {"documents": []}
+    mock_similarity_embeddings.return_value.embed_documents.side_effect = None
+    mock_similarity_embeddings.return_value.embed_documents.return_value = [[1.0, 0.01, 0.0], [0.0, 1.0, 0.0], [0.0, 0.99, 0.05]]
+
+    state = {
+        "search_queries": ["protein folding with AI", "CRISPR off-target effects", "off-target effects of CRISPR", "gene editing"],
+        "literature_abstracts": [],
+        "executed_queries": ["gene editing", "AI for protein folding"],
+        "executed_query_embeddings": [[0.0, 0.0, 1.0], [1.0, 0.0, 0.0]],
+    }
+    result = execute_searches(state, {})
+
+    # Only the unseen queries are embedded, in one batch
+    mock_similarity_embeddings.return_value.embed_documents.assert_called_once_with(
+        ["protein folding with AI", "CRISPR off-target effects", "off-target effects of CRISPR"]
+    )
+    searched = {c.args[0] for c in mock_arxiv_tool_instance.invoke.call_args_list}
+    assert searched == {"CRISPR off-target effects"}
+    assert result["searches_saved"] == 3
+    assert result["executed_queries"] == ["gene editing", "AI for protein folding", "CRISPR off-target effects"]
+    assert len(result["executed_query_embeddings"]) == 3
+
+
+@patch('litellm.llms.vertex_ai.gemini.vertex_and_google_ai_studio_gemini.VertexLLM.completion')
+@patch('agent.graph.arxiv_tool')
+@patch('agent.graph.unpaywall_tool')
+@patch('agent.graph.zotero_tool')
+@patch('requests.get')
+@patch('agent.graph.get_embeddings')
+def test_topic_cache_reuses_corpus(mock_embeddings, mock_requests_get, mock_zotero_tool_instance, mock_unpaywall_tool_instance, mock_arxiv_tool_instance, mock_litellm_completion, db_session):
+    """
+    Tests that a repeated topic skips research and reports from the earlier run's corpus.
+    """
+    mock_litellm_completion.side_effect = [
+        MagicMock(choices=[MagicMock(message=MagicMock(content='{"query": ["q1"], "rationale": "test"}'))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content='{"is_sufficient": true, "knowledge_gap": "", "follow_up_queries": []}'))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content='First Report'))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content='Cached Report'))]),
+    ]
+    mock_arxiv_tool_instance.invoke.return_value = {"documents": [MagicMock(page_content="abstract DOI: 10.1234/test.001")]}
+    mock_unpaywall_tool_instance.invoke.return_value = "Open access version found! Status: OA. URL: http://example.com/paper.pdf"
+    mock_requests_get.return_value.raise_for_status.return_value = None
+    mock_requests_get.return_value.content = b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Count 1/Kids[3 0 R]>>endobj\n3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj\n4 0 obj<</Length 55>>stream\nBT /F1 24 Tf 100 700 Td (Hello World!) Tj ET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000059 00000 n\n0000000111 00000 n\n0000000200 00000 n\ntrailer<</Size 5/Root 1 0 R>>startxref\n300\n%%EOF"
+    mock_embeddings.return_value.embed_documents.return_value = [[0.1]*1024]
+
+    first = graph.invoke({"messages": [MagicMock(content="cached topic")]})
+    second = graph.invoke({"messages": [MagicMock(content="cached topic")]})
+
+    assert first["topic_cache_hit"] is False
+    assert second["topic_cache_hit"] is True
+    assert second["collection_id"] == first["collection_id"]
+    assert second["report"] == "Cached Report"
+    assert mock_arxiv_tool_instance.invoke.call_count == 1
+    assert mock_requests_get.call_count == 1
+    # The cached corpus was used as the report context
+    report_prompt = mock_litellm_completion.call_args_list[-1]
+    assert "Hello World!" in str(report_prompt)
+
+
+@patch('agent.graph.record_run')
+@patch('agent.graph.completion')
+@patch('agent.graph.multi_query_documents')
+def test_only_complete_runs_enter_the_topic_cache(mock_multi_query, mock_completion, mock_record_run, mock_query_embeddings):
+    """
+    Tests that runs with an empty corpus or a degraded report are not offered for reuse.
+    """
+    mock_completion.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="Report"))])
+    state = {"research_topic": "topic", "collection_id": "run-1", "topic_embedding": [1.0, 0.0]}
+
+    mock_multi_query.return_value = []
+    automated_report_generation(state, {})
+    mock_multi_query.return_value = [(Document(content="chunk"), 0.03)]
+    automated_report_generation({**state, "degradations": ["pdf_count: deadline reached; skipped 2 PDFs"]}, {})
+    mock_completion.side_effect = RateLimitTimeout("no token")
+    automated_report_generation(state, {})
+    mock_record_run.assert_not_called()
+
+    mock_completion.side_effect = None
+    automated_report_generation(state, {})
+    mock_record_run.assert_called_once_with("topic", [1.0, 0.0], "run-1")
+
+
+@patch('requests.get')
+@patch('agent.graph.get_embeddings')
+def test_warm_pdf_skips_download_and_extraction(mock_embeddings, mock_requests_get, blob_store, db_session):
+    """
+    Tests that a PDF fetched by an earlier run is read from the blob store.
+    """
+    mock_requests_get.return_value.raise_for_status.return_value = None
+    mock_requests_get.return_value.content = b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Count 1/Kids[3 0 R]>>endobj\n3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj\n4 0 obj<</Length 55>>stream\nBT /F1 24 Tf 100 700 Td (Hello World!) Tj ET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000059 00000 n\n0000000111 00000 n\n0000000200 00000 n\ntrailer<</Size 5/Root 1 0 R>>startxref\n300\n%%EOF"
+    mock_embeddings.return_value.embed_documents.return_value = [[0.1]*1024]
+
+    rag_based_knowledge_synthesis({"collection_id": "run-1", "literature_full_text": ["http://example.com/paper.pdf"]}, {})
+    with patch('fitz.open') as mock_fitz_open:
+        rag_based_knowledge_synthesis({"collection_id": "run-2", "literature_full_text": ["http://example.com/paper.pdf"]}, {})
+
+    assert mock_requests_get.call_count == 1
+    mock_fitz_open.assert_not_called()
+    assert blob_store.get_pages("http://example.com/paper.pdf") == ["Hello World!\n"]
+    contents = {(d.collection_id, d.content) for d in db_session.query(Document).all()}
+    assert contents == {("run-1", "Hello World!"), ("run-2", "Hello World!")}
+
+
+@patch('requests.get')
+@patch('agent.graph.get_embeddings')
+def test_streaming_ingestion_under_a_memory_budget(mock_embeddings, mock_requests_get, blob_store, db_session):
+    """
+    Tests that a memory budget switches full-text ingestion to page windows.
+    """
+    import fitz
+
+    doc = fitz.open()
+    for number in range(3):
+        doc.new_page().insert_text((72, 72), f"Page {number} text")
+    content = doc.tobytes()
+    doc.close()
+    mock_requests_get.return_value.raise_for_status.return_value = None
+    mock_requests_get.return_value.iter_content.return_value = [content]
+    mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[0.1] * 1024 for _ in texts]
+    config = {"configurable": {"ingestion_memory_budget_mb": 512, "ingestion_page_window": 1}}
+
+    result = rag_based_knowledge_synthesis(
+        {"collection_id": "run-1", "literature_full_text": ["http://example.com/paper.pdf"]}, config
+    )
+
+    [stats] = result["ingestion_stats"]
+    assert (stats["url"], stats["pages"], stats["windows"]) == ("http://example.com/paper.pdf", 3, 3)
+    assert stats["peak_rss_mb"] > 0
+    [document] = db_session.query(Document).all()
+    assert document.content == "Page 0 text\nPage 1 text\nPage 2 text"
+    assert blob_store.get_pages("http://example.com/paper.pdf") == ["Page 0 text\n", "Page 1 text\n", "Page 2 text\n"]
+
+
+@patch('agent.graph.completion')
+@patch('agent.graph.multi_query_documents')
+def test_report_retrieves_for_every_query_at_once(mock_multi_query, mock_completion, mock_query_embeddings):
+    """
+    Tests that the topic, the knowledge gap and the executed queries are embedded and retrieved together.
+    """
+    mock_multi_query.return_value = [(Document(content="fused chunk"), 0.03)]
+    mock_completion.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="Report"))])
+    state = {
+        "research_topic": "topic",
+        "knowledge_gap": "gap",
+        "executed_queries": ["q1", "topic", "q2", "q3"],
+        "collection_id": "run-1",
+    }
+
+    automated_report_generation(state, {"configurable": {"retrieval_max_queries": 4}})
+
+    mock_query_embeddings.return_value.embed_documents.assert_called_once_with(["topic", "gap", "q1", "q2"])
+    mock_multi_query.assert_called_once()
+    assert mock_multi_query.call_args.args[0] == ["topic", "gap", "q1", "q2"]
+    assert len(mock_multi_query.call_args.args[1]) == 4
+    assert "fused chunk" in str(mock_completion.call_args)
+
+
+@patch('agent.graph.completion')
+@patch('agent.graph._download_pdf_text', side_effect=lambda url, max_pages=None: f"{url.split('/')[-1][:-4]} chunk")
+@patch('agent.graph.get_embeddings')
+def test_report_falls_back_to_the_in_memory_index(mock_embeddings, mock_download, mock_completion, mock_query_embeddings, db_session):
+    """
+    Tests that a report is answered from the index warmed after ingestion when Postgres fails afterwards.
+    """
+    def embed(texts):
+        return [[1.0] + [0.0] * 1023 if "relevant" in t else [0.0, 1.0] + [0.0] * 1022 for t in texts]
+
+    mock_embeddings.return_value.embed_documents.side_effect = embed
+    mock_query_embeddings.return_value.embed_documents.side_effect = lambda texts: [[1.0] + [0.0] * 1023 for _ in texts]
+    mock_completion.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content="Report"))])
+    # The default vector_index mode, 'fallback', and no index directory
+    rag_based_knowledge_synthesis(
+        {"collection_id": "run-1", "literature_full_text": ["http://example.com/relevant.pdf", "http://example.com/unrelated.pdf"]}, {}
+    )
+
+    with patch('agent.graph.multi_query_documents', side_effect=RuntimeError("connection refused")), \
+            patch('agent.graph.get_db_connection', side_effect=RuntimeError("connection refused")) as mock_get_db_connection, \
+            patch('agent.vector_index.get_engine', side_effect=RuntimeError("connection refused")):
+        result = automated_report_generation({"research_topic": "topic", "collection_id": "run-1"}, {"configurable": {"retrieval_top_k": 1}})
+
+    assert result["report"] == "Report"
+    mock_get_db_connection.assert_not_called()
+    prompt = str(mock_completion.call_args)
+    assert "relevant chunk" in prompt
+    assert "unrelated chunk" not in prompt
+
+
+@patch('agent.graph.completion')
+@patch('agent.graph.multi_query_documents', side_effect=RuntimeError("connection refused"))
+@patch('agent.graph.get_db_connection', side_effect=RuntimeError("connection refused"))
+@patch('agent.vector_index.get_engine', side_effect=RuntimeError("connection refused"))
+def test_report_survives_postgres_down_with_a_cold_index(mock_get_engine, mock_get_db_connection, mock_multi_query, mock_completion, mock_query_embeddings):
+    """
+    Tests that a report with nothing readable says so instead of failing the run.
+    """
+    mock_query_embeddings.return_value.embed_documents.side_effect = lambda texts: [[1.0] + [0.0] * 1023 for _ in texts]
+
+    result = automated_report_generation({"research_topic": "topic", "collection_id": "run-1"}, {})
+
+    assert "no stored excerpts could be read" in result["report"]
+    mock_completion.assert_not_called()
+
+
+@patch('agent.graph.zotero_tool')
+@patch('agent.graph.unpaywall_tool')
+@patch('requests.get')
+@patch('agent.graph.get_embeddings')
+def test_resource_management_pipelines_ingestion(mock_embeddings, mock_requests_get, mock_unpaywall_tool_instance, mock_zotero_tool_instance, blob_store, db_session):
+    """
+    Tests that PDFs are stored while resource management runs and not ingested again afterwards.
+    """
+    mock_unpaywall_tool_instance.invoke.side_effect = lambda doi: f"Open access version found! Status: OA. URL: http://example.com/{doi[-1]}.pdf"
+    mock_requests_get.return_value.raise_for_status.return_value = None
+    mock_requests_get.return_value.content = b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Count 1/Kids[3 0 R]>>endobj\n3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj\n4 0 obj<</Length 55>>stream\nBT /F1 24 Tf 100 700 Td (Hello World!) Tj ET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000059 00000 n\n0000000111 00000 n\n0000000200 00000 n\ntrailer<</Size 5/Root 1 0 R>>startxref\n300\n%%EOF"
+    mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[0.1] * 1024 for _ in texts]
+    state = {"collection_id": "run-1", "literature_abstracts": ["Paper A DOI: 10.1234/a", "Paper B DOI: 10.1234/b"]}
+
+    update = automated_resource_management(state, {})
+    assert sorted(update["pipelined_urls"]) == ["http://example.com/a.pdf", "http://example.com/b.pdf"]
+    assert {d.source_url for d in db_session.query(Document).all()} == {"http://example.com/a.pdf", "http://example.com/b.pdf"}
     assert mock_zotero_tool_instance.invoke.call_count == 2
+
+    rag_based_knowledge_synthesis({**state, **update}, {})
+    assert mock_requests_get.call_count == 2
+    assert db_session.query(Document).count() == 2
+
+
+@patch('agent.graph._download_pdf_text', return_value="full text")
+@patch('agent.graph.zotero_tool')
+@patch('agent.graph.unpaywall_tool')
+@patch('agent.graph.arxiv_tool')
+def test_prefetch_of_relevant_papers_is_used_by_resource_management(mock_arxiv_tool_instance, mock_unpaywall_tool_instance, mock_zotero_tool_instance, mock_download, mock_secondary_sources, mock_similarity_embeddings, db_session):
+    """
+    Tests that the papers closest to the topic are fetched during the loop and their resolution reused.
+    """
+    mock_pubmed, _ = mock_secondary_sources
+    mock_arxiv_tool_instance.invoke.return_value = "Published: 2024-01-01\nTitle: Off Topic\nSummary: about weather. doi 10.1234/weather"
+    mock_pubmed.invoke.return_value = "Published: 2024-01-01\nTitle: On Topic\nSummary: about proteins. doi 10.1234/protein"
+    mock_similarity_embeddings.return_value.embed_documents.side_effect = lambda texts: [
+        [1.0, 0.0] if "protein" in t else [0.0, 1.0] for t in texts
+    ]
+    mock_unpaywall_tool_instance.invoke.side_effect = lambda doi: f"Open access version found! Status: OA. URL: http://example.com/{doi.split('/')[1]}.pdf"
+    prefetcher = Prefetcher()
+    config = {"configurable": {"prefetch_top_k": 1, "ingestion_pipeline": False}}
+    state = {"search_queries": ["q1"], "collection_id": "run-1", "topic_embedding": [1.0, 0.0]}
+
+    with patch('agent.graph.get_prefetcher', return_value=prefetcher):
+        result = execute_searches(state, config)
+        update = automated_resource_management({**state, **result}, config)
+    prefetcher.shutdown()
+
+    mock_download.assert_called_once_with("http://example.com/protein.pdf")
+    assert update["prefetch_stats"] == {"hits": 1, "misses": 1, "wasted": 0}
+    # Each DOI was resolved once, the prefetched one in the background
+    assert mock_unpaywall_tool_instance.invoke.call_count == 2
+    assert sorted(update["literature_full_text"]) == ["http://example.com/protein.pdf", "http://example.com/weather.pdf"]
+
+
+@patch('agent.graph.PREFETCH_WAIT_SECONDS', 0.01)
+@patch('agent.graph._resolve_pdf_url', return_value="http://example.com/direct.pdf")
+def test_slow_or_queued_prefetches_fall_back_to_resolving_directly(mock_resolve):
+    """
+    Tests that resource management never blocks on a prefetch that has not started or is slow.
+    """
+    from concurrent.futures import Future
+
+    from agent.graph import _prefetched_url
+
+    queued, running = Future(), Future()
+    running.set_running_or_notify_cancel()
+
+    assert _prefetched_url({}, "10.1/a", queued) == ("http://example.com/direct.pdf", False)
+    assert queued.cancelled()
+    assert _prefetched_url({}, "10.1/b", running) == ("http://example.com/direct.pdf", False)
+    done = Future()
+    done.set_running_or_notify_cancel()
+    done.set_result("http://example.com/prefetched.pdf")
+    assert _prefetched_url({}, "10.1/c", done) == ("http://example.com/prefetched.pdf", True)
+    assert mock_resolve.call_count == 2
+
+
+@patch('agent.graph.completion')
+@patch('agent.graph.get_embeddings')
+@patch('agent.graph._download_pdf_text', return_value="full text")
+@patch('agent.graph.zotero_tool')
+@patch('agent.graph.unpaywall_tool')
+@patch('agent.graph.arxiv_tool')
+def test_deadline_degrades_the_run_and_still_reports(mock_arxiv_tool_instance, mock_unpaywall_tool_instance, mock_zotero_tool_instance, mock_download, mock_embeddings, mock_completion, db_session):
+    """
+    Tests that a short deadline cuts queries, loops and PDFs, records what was skipped and still produces the report.
+    """
+    metrics.reset()
+    mock_completion.side_effect = [
+        MagicMock(choices=[MagicMock(message=MagicMock(content='{"query": ["q1", "q2", "q3"], "rationale": "test"}'))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content='Final Report'))]),
+    ]
+    mock_arxiv_tool_instance.invoke.return_value = {"documents": [
+        MagicMock(page_content=f"abstract {i} DOI: 10.1234/test.00{i}") for i in range(3)
+    ]}
+    mock_unpaywall_tool_instance.invoke.side_effect = lambda doi: f"Open access version found! Status: OA. URL: http://example.com/{doi[-1]}.pdf"
+    mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[0.1] * 1024 for _ in texts]
+    # 25 seconds of work before the 35 reserved for the report
+    config = {"configurable": {"run_deadline_seconds": 60, "deadline_report_reserve_seconds": 35}}
+
+    final_state = graph.invoke({"messages": [MagicMock(content="test topic")]}, config)
+
     assert final_state["report"] == "Final Report"
+    assert final_state["executed_queries"] == ["q1"]
+    assert mock_arxiv_tool_instance.invoke.call_count == 1
+    # Reflection was skipped: one call for the queries, one for the report
+    assert mock_completion.call_count == 2
+    assert final_state["out_of_time"] is True
+    assert len(final_state["literature_full_text"]) == 2
+    assert mock_download.call_count == 2
+    actions = [record.split(":")[0] for record in final_state["degradations"]]
+    assert actions == ["initial_queries", "research_loops", "pdf_pages", "pdf_count"]
+
+
+def test_page_cap_extracts_only_the_first_pages(blob_store):
+    """
+    Tests that a page-capped download extracts only the pages it needs and does not store incomplete text.
+    """
+    import fitz
+
+    from agent.graph import _download_pdf_text
+
+    doc = fitz.open()
+    for number in range(3):
+        doc.new_page().insert_text((72, 72), f"page {number}")
+    content = doc.tobytes()
+    doc.close()
+    with patch('requests.get') as mock_requests_get:
+        mock_requests_get.return_value.content = content
+        text = _download_pdf_text("http://example.com/a.pdf", max_pages=1)
+
+    assert "page 0" in text and "page 1" not in text
+    assert blob_store.get_pages("http://example.com/a.pdf") is None
+
+
+@patch('agent.graph.pdf_budget', return_value=(5, None))
+@patch('agent.graph._download_pdf_text', return_value="full text")
+@patch('agent.graph.zotero_tool')
+@patch('agent.graph.unpaywall_tool')
+def test_resource_management_stops_when_the_deadline_is_reached(mock_unpaywall_tool_instance, mock_zotero_tool_instance, mock_download, mock_pdf_budget, db_session):
+    """
+    Tests that no more DOIs are resolved and no more PDFs fetched once only the report's time is left.
+    """
+    def resolve(doi):
+        time.sleep(0.3)
+        return f"Open access version found! Status: OA. URL: http://example.com/{doi[-1]}.pdf"
+
+    mock_unpaywall_tool_instance.invoke.side_effect = resolve
+    # The time left for anything but the report runs out while the first DOI is resolved
+    state = {
+        "collection_id": "run-1",
+        "deadline": time.time() + 30.1,
+        "literature_abstracts": [f"Paper {c} DOI: 10.1234/{c}" for c in "abc"],
+    }
+
+    start = time.monotonic()
+    update = automated_resource_management(state, {})
+
+    assert time.monotonic() - start < 2
+    assert mock_unpaywall_tool_instance.invoke.call_count == 1
+    mock_download.assert_not_called()
+    # The fetch stage may or may not reach the first PDF before the pipeline is abandoned
+    assert update["degradations"][0] == "pdf_count: deadline reached; skipped 2 remaining papers"
+    assert update["degradations"][-1] == "pdf_count: deadline reached; stopped waiting for the PDFs still being ingested"
+
+
+@patch('agent.graph.completion', side_effect=TimeoutError("Request timed out"))
+@patch('agent.graph.multi_query_documents')
+def test_report_falls_back_to_excerpts_at_the_deadline(mock_multi_query, mock_completion):
+    """
+    Tests that a report due in seconds uses the faster model and lists excerpts if it still times out.
+    """
+    metrics.reset()
+    mock_multi_query.return_value = [(Document(content="relevant chunk"), 0.03)]
+    state = {"research_topic": "topic", "collection_id": "run-1", "deadline": time.time() + 5}
+
+    result = automated_report_generation(state, {"configurable": {"retrieval_top_k": 20}})
+
+    assert mock_completion.call_args.kwargs["model"] == "gemini/gemini-1.5-flash-8b"
+    assert 0 < mock_completion.call_args.kwargs["timeout"] <= 5
+    assert mock_multi_query.call_args.kwargs["k"] == 10
+    assert "relevant chunk" in result["report"]
+    assert [record.split(":")[0] for record in result["degradations"]] == ["answer_model", "report"]
+
+
+@patch('agent.graph.completion', side_effect=RateLimitTimeout("Rate limit for 'gemini' not available within 30s."))
+@patch('agent.graph.unpaywall_tool')
+@patch('agent.graph.arxiv_tool')
+def test_rate_limited_model_calls_degrade_instead_of_failing(mock_arxiv_tool_instance, mock_unpaywall_tool_instance, mock_completion, db_session):
+    """
+    Tests that a run whose Gemini calls cannot get a rate-limit token still searches and reports.
+    """
+    mock_arxiv_tool_instance.invoke.return_value = {"documents": [MagicMock(page_content="abstract DOI: 10.1234/test.001")]}
+    mock_unpaywall_tool_instance.invoke.return_value = "No open access version found."
+
+    final_state = graph.invoke({"messages": [MagicMock(content="test topic")]})
 
+    mock_arxiv_tool_instance.invoke.assert_called_once_with("test topic")
+    # Query generation, one reflection and the report
+    assert mock_completion.call_count == 3
+    assert final_state["research_loop_count"] == 1
+    assert final_state["report"].startswith("# test topic")
@@ -0,0 +1,133 @@
+from unittest.mock import MagicMock, patch
+
+import fitz
+import pytest
+
+from agent.blob_store import BlobStore
+from agent.ingestion import (
+    MB,
+    IngestionStats,
+    MemoryBudget,
+    ingest_pdf_streaming,
+    page_windows,
+)
+from agent.providers import get_text_splitter
+from agent.resilience import HTTP_TIMEOUT
+
+URL = "http://example.com/long.pdf"
+
+
+def make_pdf(pages: int) -> bytes:
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(72, 72, 540, 720), f"Page {number} " + "lorem ipsum dolor sit amet " * 40)
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+@pytest.fixture
+def embeddings():
+    embeddings = MagicMock()
+    embeddings.embed_documents.side_effect = lambda texts: [[0.1] * 4 for _ in texts]
+    return embeddings
+
+
+def streamed_response(content: bytes):
+    response = MagicMock()
+    response.raise_for_status.return_value = None
+    response.iter_content.side_effect = lambda size: (content[i : i + size] for i in range(0, len(content), size))
+    return response
+
+
+@patch('requests.get')
+def test_streams_page_windows_into_the_database(mock_requests_get, store, embeddings):
+    content = make_pdf(5)
+    mock_requests_get.return_value = streamed_response(content)
+    db = MagicMock()
+
+    stats = ingest_pdf_streaming(db, URL, "run-1", embeddings, get_text_splitter(), store, MemoryBudget(1024, page_window=2))
+
+    assert mock_requests_get.call_args.kwargs["stream"] is True
+    assert mock_requests_get.call_args.kwargs["timeout"] == HTTP_TIMEOUT
+    assert (stats.pages, stats.windows) == (5, 3)
+    assert embeddings.embed_documents.call_count == 3
+    rows = [row for call in db.execute.call_args_list for row in call.args[1]]
+    assert len(rows) == stats.chunks
+    assert {row["source_url"] for row in rows} == {URL}
+    # Every page made it into a chunk, including those carried across windows
+    text = " ".join(row["content"] for row in rows)
+    assert all(f"Page {number}" in text for number in range(5))
+    db.commit.assert_called_once()
+    assert store.get_pdf(URL) == content
+    assert len(store.get_pages(URL)) == 5
+    assert stats.peak_rss_mb > 0
+
+
+@patch('requests.get')
+def test_reuses_stored_text(mock_requests_get, store, embeddings):
+    store.put(URL, b"%PDF-stored", ["first page. ", "second page."])
+
+    stats = ingest_pdf_streaming(MagicMock(), URL, "run-1", embeddings, get_text_splitter(), store, MemoryBudget(1024))
+
+    mock_requests_get.assert_not_called()
+    assert (stats.pages, stats.chunks) == (2, 1)
+
+
+def test_stored_text_is_read_back_a_window_at_a_time(store):
+    store.put(URL, b"%PDF-stored", [f"page {number}. " for number in range(5)])
+    stats = IngestionStats(url=URL)
+
+    windows = list(page_windows(URL, store, MemoryBudget(1024, page_window=2), stats, max_pages=4))
+
+    assert windows == [("page 0. page 1. ", False), ("page 2. page 3. ", True)]
+    assert stats.pages == 4
+
+
+@patch('requests.get')
+def test_failure_rolls_back_the_document(mock_requests_get, store, embeddings):
+    mock_requests_get.return_value = streamed_response(make_pdf(4))
+    embeddings.embed_documents.side_effect = [[[0.1] * 4] * 50, RuntimeError("quota")]
+    db = MagicMock()
+
+    with pytest.raises(RuntimeError):
+        ingest_pdf_streaming(db, URL, "run-1", embeddings, get_text_splitter(), store, MemoryBudget(1024, page_window=2))
+
+    db.rollback.assert_called_once()
+    db.commit.assert_not_called()
+    # The pages read before the failure are not stored as the document's text
+    assert store.get_pages(URL) is None
+
+
+def test_budget_halves_the_window_when_exceeded():
+    with patch('agent.ingestion.current_rss', side_effect=[100 * MB, 150 * MB, 300 * MB, 400 * MB, 500 * MB]):
+        budget = MemoryBudget(100, page_window=4)
+        stats = IngestionStats(url=URL)
+        budget.check(stats)
+        assert budget.page_window == 4
+        budget.check(stats)
+        assert budget.page_window == 2
+        budget.check(stats)
+        budget.check(stats)
+        assert budget.page_window == 1
+    assert stats.peak_rss_mb == 500
+
+
+@patch('requests.get')
+def test_max_pages_reads_only_the_first_pages(mock_requests_get, store, embeddings):
+    mock_requests_get.return_value = streamed_response(make_pdf(5))
+    db = MagicMock()
+
+    stats = ingest_pdf_streaming(db, URL, "run-1", embeddings, get_text_splitter(), store, MemoryBudget(1024, page_window=2), max_pages=3)
+
+    assert (stats.pages, stats.windows) == (3, 2)
+    text = " ".join(row["content"] for call in db.execute.call_args_list for row in call.args[1])
+    assert "Page 2" in text and "Page 3" not in text
+    # A truncated text is not stored, so a later run without a deadline reads the whole PDF
+    assert store.get_pages(URL) is None
@@ -141,8 +141,8 @@ def test_automated_report_generation_integration(db_session):
 
 def test_rag_based_knowledge_synthesis_integration(db_session):
     """Tests the rag_based_knowledge_synthesis node with actual embedding generation."""
-    with patch('agent.graph.embeddings') as mock_embeddings:
-        mock_embeddings.embed_documents.return_value = [[0.1]*1024]
+    with patch('agent.graph.get_embeddings') as mock_embeddings:
+        mock_embeddings.return_value.embed_documents.return_value = [[0.1]*1024]
         # Mock requests.get to simulate PDF download
         with patch('requests.get') as mock_requests_get:
             mock_response = MagicMock()
@@ -173,14 +173,14 @@ def test_rag_based_knowledge_synthesis_integration(db_session):
 
 def test_full_graph_integration_flow(db_session):
     """Tests the full graph flow with actual LLM and embedding calls."""
-    with patch('agent.graph.completion') as mock_litellm_completion,         patch('agent.graph.embeddings') as mock_embeddings,         patch('requests.get') as mock_requests_get,         patch('agent.graph.arxiv_tool') as mock_arxiv,         patch('agent.graph.unpaywall_tool') as mock_unpaywall,         patch('agent.graph.zotero_tool') as mock_zotero:
+    with patch('agent.graph.completion') as mock_litellm_completion,         patch('agent.graph.get_embeddings') as mock_embeddings,         patch('requests.get') as mock_requests_get,         patch('agent.graph.arxiv_tool') as mock_arxiv,         patch('agent.graph.unpaywall_tool') as mock_unpaywall,         patch('agent.graph.zotero_tool') as mock_zotero:
 
         mock_litellm_completion.side_effect = [
             MagicMock(choices=[MagicMock(message=MagicMock(content='{"query": ["q1", "q2"], "rationale": "test"}'))]),
             MagicMock(choices=[MagicMock(message=MagicMock(content='{"is_sufficient": true, "knowledge_gap": "", "follow_up_queries": []}'))]),
             MagicMock(choices=[MagicMock(message=MagicMock(content='Final Report'))]),
         ]
-        mock_embeddings.embed_documents.return_value = [[0.1]*1024]
+        mock_embeddings.return_value.embed_documents.return_value = [[0.1]*1024]
 
         mock_arxiv.invoke.return_value = {"documents": [MagicMock(page_content="mock abstract content with doi 10.1234/5678", metadata={"title": "Mock Paper"})]}
         mock_unpaywall.invoke.return_value = "Open access version found! Status: OA. URL: http://example.com/mock_paper.pdf"
@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agent.jobqueue import (
+    LEASE_EXPIRED_ERROR,
+    PRIORITY_INTERACTIVE,
+    InMemoryJobQueue,
+    Job,
+    JobDispatcher,
+    QueueFullError,
+    RedisJobQueue,
+    get_job_queue,
+)
+from agent.metrics import metrics
+
+
+def make_job(job_id, tenant="t", priority=0):
+    return Job(id=job_id, tenant=tenant, priority=priority, payload={"topic": job_id})
+
+
+def test_claims_by_priority_then_submission_order():
+    queue = InMemoryJobQueue(tenant_concurrency=10)
+    for job in (make_job("low1"), make_job("high1", priority=10), make_job("low2"), make_job("high2", priority=10)):
+        queue.enqueue(job)
+
+    assert [queue.claim().id for _ in range(4)] == ["high1", "high2", "low1", "low2"]
+    assert queue.claim() is None
+
+
+def test_rejects_beyond_max_depth():
+    queue = InMemoryJobQueue(max_depth=2)
+    queue.enqueue(make_job("a"))
+    queue.enqueue(make_job("b"))
+    with pytest.raises(QueueFullError):
+        queue.enqueue(make_job("c"))
+    assert queue.depth() == 2
+
+
+def test_tenant_cap_lets_other_tenants_through():
+    queue = InMemoryJobQueue(tenant_concurrency=1)
+    for job in (make_job("a1", "a"), make_job("a2", "a"), make_job("b1", "b")):
+        queue.enqueue(job)
+
+    first = queue.claim()
+    assert first.id == "a1"
+    # a2 waits for a1, so b1 goes first
+    assert queue.claim().id == "b1"
+    assert queue.claim() is None
+    queue.finish(first)
+    assert queue.claim().id == "a2"
+
+
+def test_dispatcher_runs_jobs_and_records_wait():
+    metrics.reset()
+    done = threading.Event()
+
+    def run(payload):
+        if payload["topic"] == "bad":
+            raise RuntimeError("boom")
+        if payload["topic"] == "last":
+            done.set()
+        return {"report": payload["topic"].upper()}
+
+    queue = InMemoryJobQueue(tenant_concurrency=1)
+    dispatcher = JobDispatcher(queue, run, workers=2, poll_interval=0.01)
+    try:
+        ok = dispatcher.submit({"topic": "ok"})
+        bad = dispatcher.submit({"topic": "bad"})
+        dispatcher.submit({"topic": "last"})
+        assert done.wait(5)
+        deadline = time.monotonic() + 5
+        while queue.get(ok.id).status != "completed" or queue.get(bad.id).status != "failed":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        dispatcher.stop()
+
+    assert queue.get(ok.id).result == {"report": "OK"}
+    assert queue.get(bad.id).error == "boom"
+    assert metrics.quantile("job_queue_wait_seconds", 0.5, priority=10) is not None
+    assert metrics.counter("jobs_finished", status="failed") == 1
+
+
+def test_dispatcher_counts_rejections():
+    metrics.reset()
+    dispatcher = JobDispatcher(InMemoryJobQueue(max_depth=0), MagicMock(), workers=0)
+    with pytest.raises(QueueFullError):
+        dispatcher.submit({"topic": "x"})
+    assert metrics.counter("jobs_rejected", reason="queue_full") == 1
+
+
+def test_global_cap_limits_running_jobs_across_tenants():
+    queue = InMemoryJobQueue(tenant_concurrency=2, max_running=2)
+    for job in (make_job("a1", "a"), make_job("b1", "b"), make_job("c1", "c")):
+        queue.enqueue(job)
+
+    first, second = queue.claim(), queue.claim()
+    assert (first.id, second.id) == ("a1", "b1")
+    assert queue.claim() is None
+    queue.finish(first)
+    assert queue.claim().id == "c1"
+
+
+def test_expired_lease_requeues_the_job_and_frees_its_slot():
+    metrics.reset()
+    queue = InMemoryJobQueue(tenant_concurrency=1, lease_seconds=0.05)
+    queue.enqueue(make_job("a"))
+
+    crashed = queue.claim()
+    assert queue.claim() is None
+    time.sleep(0.1)
+    retried = queue.claim()
+    assert retried.id == "a" and retried.attempts == 2
+    assert metrics.counter("jobs_requeued") == 1
+
+    # The crashed worker's late outcome is dropped
+    crashed.status = "completed"
+    assert queue.finish(crashed) is False
+    assert queue.get("a").status == "running"
+    assert queue.heartbeat(retried) is True
+    retried.status = "completed"
+    assert queue.finish(retried) is True
+    assert queue.get("a").status == "completed"
+
+
+def test_expired_lease_fails_the_job_after_its_last_attempt():
+    queue = InMemoryJobQueue(lease_seconds=0.01)
+    queue.enqueue(Job(id="once", tenant="t", priority=0, payload={}, max_attempts=1))
+
+    queue.claim()
+    time.sleep(0.05)
+    assert queue.claim() is None
+    assert queue.get("once").status == "failed"
+    assert queue.get("once").error == LEASE_EXPIRED_ERROR
+
+
+def test_finished_jobs_are_evicted():
+    queue = InMemoryJobQueue(tenant_concurrency=10, max_finished=1)
+    for job_id in ("a", "b"):
+        queue.enqueue(make_job(job_id))
+        job = queue.claim()
+        job.status = "completed"
+        queue.finish(job)
+
+    assert queue.get("a") is None
+    assert queue.get("b").status == "completed"
+
+
+def test_interrupted_job_gives_its_slot_back():
+    queue = InMemoryJobQueue(tenant_concurrency=1)
+    queue.enqueue(make_job("a"))
+    dispatcher = JobDispatcher(queue, MagicMock(side_effect=KeyboardInterrupt), workers=0, poll_interval=0.01)
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            dispatcher._execute(queue.claim())
+        assert queue.get("a").status == "failed"
+        assert queue.get("a").error == "Interrupted: KeyboardInterrupt"
+        queue.enqueue(make_job("b"))
+        assert queue.claim().id == "b"
+    finally:
+        dispatcher.stop()
+
+
+def test_dispatcher_passes_the_submission_time():
+    run_fn = MagicMock(return_value={})
+    dispatcher = JobDispatcher(InMemoryJobQueue(), run_fn, workers=1, poll_interval=0.01)
+    try:
+        job = dispatcher.submit({"topic": "t"})
+        deadline = time.monotonic() + 5
+        while dispatcher.queue.get(job.id).status != "completed" and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        dispatcher.stop()
+    assert run_fn.call_args.args[0] == {"submitted_at": job.enqueued_at, "topic": "t", "job_id": job.id}
+
+
+def test_redis_queue_uses_server_scripts():
+    client = MagicMock()
+    enqueue_script, claim_script = MagicMock(return_value=1), MagicMock(return_value=[b"j1", b"t", 1])
+    renew_script, finish_script = MagicMock(return_value=1), MagicMock(return_value=1)
+    client.register_script.side_effect = [enqueue_script, claim_script, renew_script, finish_script]
+    queue = RedisJobQueue(client, 5, 1)
+
+    queue.enqueue(make_job("j1", priority=3))
+    assert enqueue_script.call_args.kwargs["args"][:3] == [5, 3, "j1"]
+
+    client.hmget.return_value = [json.dumps(make_job("j1").to_dict()), b"running", b"1"]
+    job = queue.claim()
+    assert job.id == "j1" and job.status == "running" and job.attempts == 1
+    assert claim_script.call_args.kwargs["args"][0] == 1
+
+    assert queue.heartbeat(job) is True
+    assert renew_script.call_args.kwargs["args"][0] == "j1:1"
+    job.status = "completed"
+    assert queue.finish(job) is True
+    assert finish_script.call_args.kwargs["args"][:2] == ["j1:1", "t"]
+
+    enqueue_script.return_value = 0
+    with pytest.raises(QueueFullError):
+        queue.enqueue(make_job("j2"))
+
+
+def test_redis_claim_releases_jobs_whose_hash_expired():
+    client = MagicMock()
+    finish_script = MagicMock(return_value=1)
+    client.register_script.side_effect = [MagicMock(), MagicMock(return_value=[b"j1", b"t", 1]), MagicMock(), finish_script]
+    client.hmget.return_value = [None, None, None]
+    queue = RedisJobQueue(client)
+
+    assert queue.claim() is None
+    assert finish_script.call_args.kwargs["args"][:3] == ["j1:1", "t", ""]
+
+
+def test_get_job_queue_falls_back_to_memory_without_redis(monkeypatch):
+    monkeypatch.setenv("REDIS_URI", "redis://127.0.0.1:1")
+    get_job_queue.cache_clear()
+    try:
+        assert isinstance(get_job_queue(), InMemoryJobQueue)
+    finally:
+        get_job_queue.cache_clear()
+
+
+@patch("agent.jobqueue.get_job_queue")
+@patch("agent.jobqueue.get_job_dispatcher")
+def test_job_endpoints(mock_get_dispatcher, mock_get_queue):
+    from agent.app import app
+
+    queue = InMemoryJobQueue(max_depth=1)
+    mock_get_queue.return_value = queue
+    mock_get_dispatcher.return_value = JobDispatcher(queue, MagicMock(), workers=0)
+    client = TestClient(app)
+
+    response = client.post("/jobs", json={"topic": "crispr", "tenant": "lab", "priority": 99})
+    assert response.status_code == 202
+    job = client.get(f"/jobs/{response.json()['job_id']}").json()
+    assert job["status"] == "queued" and job["tenant"] == "lab"
+    assert job["priority"] == PRIORITY_INTERACTIVE
+
+    rejected = client.post("/jobs", json={"topic": "mrna"})
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "30"
+    assert client.get("/jobs/unknown").status_code == 404
@@ -0,0 +1,64 @@
+import numpy as np
+
+from agent.minhash import (
+    cluster_near_duplicates,
+    estimated_jaccard,
+    lsh_candidate_pairs,
+    minhash_signatures,
+    shingle_hashes,
+)
+from agent.search import collapse_near_duplicates
+from agent.tools_and_schemas import Paper
+
+ABSTRACT = (
+    "Deep learning predicts protein structures with high accuracy using attention "
+    "networks trained on sequence databases and evolutionary information"
+)
+
+
+def test_shingles_ignore_case_and_punctuation():
+    assert set(shingle_hashes("Protein folding, with AI!")) == set(shingle_hashes("protein folding with ai"))
+    assert len(shingle_hashes("")) == 1
+
+
+def test_signatures_estimate_jaccard():
+    signatures = minhash_signatures([ABSTRACT, ABSTRACT.upper(), "Coral reefs under ocean warming and acidification"])
+    assert signatures.shape == (3, 128)
+    assert signatures.dtype == np.uint32
+    similarities = estimated_jaccard(signatures, np.array([[0, 1], [0, 2]]))
+    assert similarities[0] == 1.0
+    assert similarities[1] < 0.2
+
+
+def test_lsh_and_clustering_group_near_duplicates():
+    texts = [
+        ABSTRACT,
+        "Coral reefs under ocean warming and acidification in tropical regions",
+        ABSTRACT.replace("high accuracy", "very high accuracy"),
+        ABSTRACT + " and multiple sequence alignments",
+    ]
+    signatures = minhash_signatures(texts)
+
+    assert [0, 2] in lsh_candidate_pairs(signatures).tolist()
+    assert cluster_near_duplicates(signatures, threshold=0.6) == [[0, 2, 3], [1]]
+    assert cluster_near_duplicates(np.zeros((0, 128), dtype=np.uint32)) == []
+
+
+def test_collapse_keeps_canonical_record_per_cluster():
+    papers = [
+        Paper(title="Protein folding", abstract=ABSTRACT, sources=["arxiv"]),
+        Paper(title="Coral reefs", abstract="Ocean warming bleaches coral reefs", sources=["arxiv"]),
+        Paper(title="Protein folding.", abstract=ABSTRACT + " in the journal version", doi="10.1/x", sources=["pubmed"]),
+    ]
+
+    kept, signatures, clusters = collapse_near_duplicates(papers)
+
+    assert [p.title for p in kept] == ["Coral reefs", "Protein folding."]
+    assert kept[1].sources == ["pubmed", "arxiv"]
+    assert signatures.shape == (2, 128)
+    assert clusters == 1
+
+    # A later loop finding the preprint again adds nothing
+    again, _, clusters = collapse_near_duplicates([Paper(title="Protein folding", abstract=ABSTRACT, sources=["semantic_scholar"])], signatures)
+    assert again == []
+    assert clusters == 1
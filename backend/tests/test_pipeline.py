@@ -0,0 +1,103 @@
+import threading
+import time
+
+from agent.pipeline import Pipeline
+
+
+def test_items_flow_through_every_stage():
+    stages = [
+        ("double", lambda x: x * 2, 3),
+        ("drop_tens", lambda x: None if x % 10 == 0 else x, 1),
+        ("label", lambda x: f"item {x}", 2),
+    ]
+    with Pipeline(stages, queue_size=2) as pipeline:
+        for i in range(10):
+            pipeline.put(i)
+
+    assert sorted(pipeline.results) == sorted(f"item {i * 2}" for i in range(10) if (i * 2) % 10)
+    assert [s.items for s in pipeline.stats] == [10, 10, 8]
+
+
+def test_a_failing_item_does_not_stop_the_others():
+    def fetch(x):
+        if x == 2:
+            raise RuntimeError("404")
+        return x
+
+    with Pipeline([("fetch", fetch, 2), ("store", lambda x: x, 1)]) as pipeline:
+        for i in range(5):
+            pipeline.put(i)
+
+    assert sorted(pipeline.results) == [0, 1, 3, 4]
+    assert pipeline.stats[0].failures == 1
+
+
+def test_stages_overlap():
+    def slow(x):
+        time.sleep(0.05)
+        return x
+
+    start = time.monotonic()
+    with Pipeline([("fetch", slow, 1), ("embed", slow, 1), ("store", slow, 1)]) as pipeline:
+        for i in range(8):
+            pipeline.put(i)
+    elapsed = time.monotonic() - start
+
+    # Run one after another the stages would take 8 * 3 * 0.05 = 1.2s
+    assert elapsed < 0.8
+    assert pipeline.results == list(range(8))
+
+
+def test_bounded_queues_hold_back_the_producer():
+    release = threading.Event()
+
+    def store(x):
+        release.wait(5)
+        return x
+
+    pipeline = Pipeline([("store", store, 1)], queue_size=2)
+    pipeline.start()
+    fed = []
+
+    def produce():
+        for i in range(6):
+            pipeline.put(i)
+            fed.append(i)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    time.sleep(0.1)
+    # One item in the worker and two queued; the producer waits on the fourth
+    assert len(fed) == 3
+    release.set()
+    producer.join()
+    pipeline.close()
+    assert pipeline.results == list(range(6))
+
+
+def test_close_with_a_timeout_abandons_a_hung_stage():
+    release = threading.Event()
+
+    def fetch(x):
+        release.wait(5)
+        return x
+
+    pipeline = Pipeline([("fetch", fetch, 1), ("store", lambda x: x, 1)], queue_size=4)
+    pipeline.start()
+    for i in range(3):
+        pipeline.put(i)
+
+    start = time.monotonic()
+    results = pipeline.close(timeout=0.2)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 1
+    assert results == []
+    assert pipeline.abandoned
+    release.set()
+    for thread in pipeline._threads:
+        thread.join(1)
+    # The call in flight finishes; the items still queued are dropped
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+    assert pipeline.stats[0].items == 1
+    assert pipeline.stats[0].dropped == 2
@@ -0,0 +1,59 @@
+import threading
+from unittest.mock import MagicMock
+
+from agent.metrics import metrics
+from agent.prefetch import Prefetcher
+
+
+def test_resolves_then_downloads_in_the_background():
+    downloaded = threading.Event()
+    download = MagicMock(side_effect=lambda url: downloaded.set())
+    prefetcher = Prefetcher(workers=2)
+
+    assert prefetcher.schedule("run-1", "10.1/A", lambda doi: f"http://x/{doi}.pdf", download, limit=5)
+    jobs = prefetcher.take("run-1")
+
+    assert jobs["10.1/a"].result(5) == "http://x/10.1/A.pdf"
+    assert downloaded.wait(5)
+    download.assert_called_once_with("http://x/10.1/A.pdf")
+    assert prefetcher.take("run-1") == {}
+
+
+def test_caps_jobs_per_run_and_ignores_repeats():
+    prefetcher = Prefetcher(workers=1)
+    resolve = MagicMock(return_value=None)
+
+    scheduled = [prefetcher.schedule("run-1", doi, resolve, MagicMock(), limit=2) for doi in ("a", "A", "b", "c")]
+
+    assert scheduled == [True, False, True, False]
+    assert set(prefetcher.take("run-1")) == {"a", "b"}
+
+
+def test_unused_and_evicted_jobs_count_as_wasted():
+    release = threading.Event()
+    prefetcher = Prefetcher(workers=1, max_runs=1)
+    before = metrics.counter("prefetch_wasted")
+
+    prefetcher.schedule("run-1", "a", lambda doi: release.wait(5) and None, MagicMock(), limit=5)
+    prefetcher.schedule("run-1", "b", lambda doi: None, MagicMock(), limit=5)
+    # A second run pushes the first out; its queued job is cancelled
+    prefetcher.schedule("run-2", "c", lambda doi: None, MagicMock(), limit=5)
+    release.set()
+
+    assert prefetcher.take("run-1") == {}
+    assert prefetcher.discard(prefetcher.take("run-2")) == 1
+    assert metrics.counter("prefetch_wasted") == before + 3
+
+
+def test_slow_downloads_do_not_delay_later_resolutions():
+    release = threading.Event()
+    prefetcher = Prefetcher(workers=1, download_workers=1)
+
+    prefetcher.schedule("run-1", "a", lambda doi: "http://x/a.pdf", lambda url: release.wait(5), limit=5)
+    prefetcher.schedule("run-1", "b", lambda doi: "http://x/b.pdf", lambda url: release.wait(5), limit=5)
+    # Both downloads are queued or blocked; another run's resolution still goes through
+    prefetcher.schedule("run-2", "c", lambda doi: "http://x/c.pdf", MagicMock(), limit=5)
+
+    assert prefetcher.take("run-2")["c"].result(1) == "http://x/c.pdf"
+    release.set()
+    prefetcher.shutdown()
@@ -0,0 +1,61 @@
+import json
+import pstats
+import time
+
+import pytest
+
+from agent.profiling import profile_block, profiled
+
+
+def slow_node(state):
+    time.sleep(0.05)
+    return {"value": state["value"] + 1}
+
+
+def configured_node(state, config):
+    return {"value": config["configurable"]["thread_id"]}
+
+
+def test_sampling_profile_writes_collapsed_and_speedscope(tmp_path):
+    prefix = str(tmp_path / "node")
+
+    with profile_block(prefix):
+        slow_node({"value": 1})
+
+    collapsed = (tmp_path / "node.collapsed").read_text()
+    assert collapsed.startswith("slow_node (test_profiling.py:")
+    speedscope = json.loads((tmp_path / "node.speedscope.json").read_text())
+    profile = speedscope["profiles"][0]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert sum(profile["weights"]) == pytest.approx(0.05, abs=0.03)
+    assert {frame["name"] for frame in speedscope["shared"]["frames"]} >= {"slow_node"}
+
+
+def test_cprofile_and_memory_snapshots(tmp_path):
+    prefix = str(tmp_path / "node")
+
+    with profile_block(prefix, profiler="cprofile", memory=True):
+        data = [bytes(1024) for _ in range(100)]
+
+    assert pstats.Stats(f"{prefix}.prof").total_calls > 0
+    assert (tmp_path / "node.tracemalloc").exists()
+    assert "test_profiling.py" in (tmp_path / "node.allocations.txt").read_text()
+    assert len(data) == 100
+
+
+def test_unknown_profiler_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        with profile_block(str(tmp_path / "node"), profiler="perf"):
+            pass
+
+
+def test_profiled_node_only_profiles_selected_nodes(tmp_path):
+    config = {"configurable": {"thread_id": "t1", "profile_nodes": "configured_node", "profile_dir": str(tmp_path)}}
+
+    assert profiled("slow_node", slow_node)({"value": 1}, config) == {"value": 2}
+    assert not tmp_path.joinpath("t1").exists()
+
+    assert profiled("configured_node", configured_node)({}, config) == {"value": "t1"}
+    written = sorted(p.name.split("-", 1)[1] for p in tmp_path.joinpath("t1").iterdir())
+    assert written == ["configured_node.collapsed", "configured_node.speedscope.json"]
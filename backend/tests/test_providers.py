@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from agent import providers
+
+HEAVY_MODULES = ["litellm", "fitz", "langchain_google_genai"]
+
+
+def _import_in_fresh_interpreter(module):
+    env = {k: v for k, v in os.environ.items() if k not in ("POSTGRES_URI", "GOOGLE_API_KEY", "GEMINI_API_KEY")}
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, cwd="/")
+
+
+@pytest.mark.parametrize("module", ["agent.database", "agent.graph"])
+def test_import_is_lazy(module):
+    """Importing the modules must not need credentials nor load heavy clients."""
+    result = _import_in_fresh_interpreter(module)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_get_engine_requires_postgres_uri():
+    from agent.database import get_engine
+
+    get_engine.cache_clear()
+    try:
+        with patch.dict(os.environ, {"POSTGRES_URI": ""}):
+            with pytest.raises(RuntimeError, match="POSTGRES_URI"):
+                get_engine()
+    finally:
+        get_engine.cache_clear()
+
+
+def test_providers_are_cached():
+    assert providers.get_text_splitter() is providers.get_text_splitter()
+
+
+@patch('agent.database.get_engine', side_effect=RuntimeError("no database"))
+@patch('agent.providers.get_embeddings')
+def test_warmup_is_best_effort(mock_get_embeddings, mock_get_engine):
+    providers.warmup()
+    mock_get_embeddings.assert_called_once()
+    mock_get_engine.assert_called_once()
@@ -0,0 +1,67 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from agent.ratelimit import (
+    InMemoryRateLimiter,
+    RateLimitTimeout,
+    RedisRateLimiter,
+    get_rate_limiter,
+    parse_rate_limits,
+)
+from agent.tools_and_schemas import arxiv_tool
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("gemini=2/10, arxiv=0.5") == {"gemini": (2.0, 10.0), "arxiv": (0.5, 1.0)}
+    assert parse_rate_limits("") == {}
+
+
+def test_in_memory_bucket_allows_burst_then_waits():
+    limiter = InMemoryRateLimiter({"api": (20.0, 2.0)})
+    assert limiter.try_acquire("api") == 0.0
+    assert limiter.try_acquire("api") == 0.0
+    assert limiter.try_acquire("api") == pytest.approx(0.05, abs=0.01)
+
+    start = time.monotonic()
+    limiter.acquire("api")
+    assert time.monotonic() - start >= 0.03
+
+
+def test_acquire_times_out_instead_of_waiting_forever():
+    limiter = InMemoryRateLimiter({"api": (0.1, 1.0)}, max_wait=0.05)
+    limiter.acquire("api")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("api")
+
+
+def test_unknown_provider_is_not_throttled():
+    limiter = InMemoryRateLimiter({})
+    assert limiter.acquire("other") == 0.0
+
+
+def test_redis_limiter_uses_server_script():
+    client = MagicMock()
+    client.register_script.return_value = MagicMock(return_value=b"0.25")
+    limiter = RedisRateLimiter(client, {"api": (4.0, 1.0)})
+
+    assert limiter.try_acquire("api") == 0.25
+    client.register_script.return_value.assert_called_once_with(keys=["ratelimit:api"], args=[4.0, 1.0, 1.0])
+
+
+def test_get_rate_limiter_falls_back_to_memory_without_redis():
+    get_rate_limiter.cache_clear()
+    try:
+        with patch.dict("os.environ", {"REDIS_URI": "redis://127.0.0.1:1", "RATE_LIMIT_BACKEND": "auto"}):
+            assert isinstance(get_rate_limiter(), InMemoryRateLimiter)
+    finally:
+        get_rate_limiter.cache_clear()
+
+
+@patch('agent.tools_and_schemas.acquire')
+@patch('langchain_community.tools.arxiv.tool.ArxivQueryRun._run', return_value="No good Arxiv Result was found")
+def test_search_tools_take_a_token(mock_run, mock_acquire):
+    arxiv_tool.invoke("test query")
+    mock_acquire.assert_called_once_with("arxiv")
+    mock_run.assert_called_once()
@@ -0,0 +1,112 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from agent.metrics import MetricsRegistry, metrics, quantile
+from agent.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    call_with_resilience,
+    get_breaker,
+    host_of,
+)
+
+
+def test_quantile_nearest_rank():
+    assert quantile(range(1, 101), 0.95) == 95
+    assert quantile([], 0.5) is None
+
+
+def test_metrics_snapshot():
+    registry = MetricsRegistry()
+    registry.inc("calls", host="a")
+    registry.set_gauge("state", 2, host="a")
+    for v in range(10):
+        registry.observe("latency", v)
+    snapshot = registry.snapshot()
+    assert snapshot["counters"] == {'calls{host="a"}': 1.0}
+    assert snapshot["gauges"] == {'state{host="a"}': 2}
+    assert snapshot["histograms"]["latency"]["count"] == 10
+    assert snapshot["histograms"]["latency"]["p95"] == 9
+
+
+def test_breaker_opens_after_threshold_and_recovers():
+    breaker = CircuitBreaker("breaker.test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert metrics.gauge("circuit_breaker_state", host="breaker.test") == 2
+
+    time.sleep(0.06)
+    assert breaker.allow()  # the single half-open probe
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert metrics.gauge("circuit_breaker_state", host="breaker.test") == 0
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("probe.test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_open_circuit_skips_call():
+    breaker = get_breaker("skip.test")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    fn = MagicMock()
+    with pytest.raises(CircuitOpenError):
+        call_with_resilience("skip.test", fn)
+    fn.assert_not_called()
+    assert metrics.counter("circuit_breaker_rejections", host="skip.test") == 1
+
+
+@patch('agent.resilience.hedge_delay', return_value=0.05)
+def test_hedged_request_wins_over_slow_primary(mock_hedge_delay):
+    calls = []
+    lock = threading.Lock()
+
+    def lookup(doi):
+        with lock:
+            calls.append(doi)
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.01)
+        return "slow" if first else "fast"
+
+    start = time.monotonic()
+    assert call_with_resilience("hedge.test", lookup, "10.1/x", hedge=True) == "fast"
+    assert time.monotonic() - start < 0.5
+    assert calls == ["10.1/x", "10.1/x"]
+    assert metrics.counter("hedges_sent", host="hedge.test") == 1
+    assert metrics.counter("hedge_wins", host="hedge.test") == 1
+
+
+def test_fast_primary_is_not_hedged():
+    fn = MagicMock(return_value="ok")
+    assert call_with_resilience("fast.test", fn, 1, hedge=True) == "ok"
+    fn.assert_called_once_with(1)
+    assert metrics.counter("hedges_sent", host="fast.test") == 0
+
+
+def test_host_of():
+    assert host_of("https://Example.com/paper.pdf") == "example.com"
+
+
+def test_rate_limit_timeout_is_not_a_host_failure():
+    from agent.ratelimit import RateLimitTimeout
+
+    breaker = get_breaker("ratelimited.test")
+    fn = MagicMock(side_effect=RateLimitTimeout("no token"))
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(RateLimitTimeout):
+            call_with_resilience("ratelimited.test", fn)
+    assert breaker.state == "closed"
+    assert metrics.counter("external_call_failures", host="ratelimited.test") == 0
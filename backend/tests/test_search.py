@@ -0,0 +1,113 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from agent.search import (
+    MAX_SOURCE_WORKERS,
+    SourcePool,
+    federated_search,
+    merge_papers,
+    normalize_title,
+    parse_results,
+)
+from agent.tools_and_schemas import Paper
+
+ARXIV_OUTPUT = (
+    "Published: 2023-05-01\nTitle: Attention Is All You Need\nAuthors: A. Vaswani, N. Shazeer\nSummary: Transformers.\n\n"
+    "Published: 2023-06-01\nTitle: Second Paper\nAuthors: B. Author\nSummary: Another summary."
+)
+
+
+def test_parse_results_from_tool_string():
+    papers = parse_results("arxiv", ARXIV_OUTPUT)
+    assert [p.title for p in papers] == ["Attention Is All You Need", "Second Paper"]
+    assert papers[0].authors == ["A. Vaswani", "N. Shazeer"]
+    assert papers[0].abstract == "Transformers."
+    assert papers[0].sources == ["arxiv"]
+
+
+def test_parse_results_no_results_string():
+    assert parse_results("arxiv", "No good Arxiv Result was found") == []
+
+
+def test_parse_results_from_documents():
+    doc = MagicMock(page_content="Body text doi 10.1234/abc.1", metadata={"Title": "Doc Title"})
+    papers = parse_results("pubmed", {"documents": [doc]})
+    assert papers[0].title == "Doc Title"
+    assert papers[0].doi == "10.1234/abc.1"
+
+
+def test_merge_papers_by_doi_and_title():
+    papers = [
+        Paper(title="Deep Learning", doi="10.1/X", sources=["arxiv"]),
+        Paper(title="Deep learning!", abstract="longer abstract", sources=["pubmed"]),
+        Paper(title="Other", doi="10.1/x", sources=["semantic_scholar"]),
+    ]
+    unique, duplicates = merge_papers(papers)
+    assert len(unique) == 1
+    assert duplicates == 2
+    assert unique[0].sources == ["arxiv", "pubmed", "semantic_scholar"]
+    assert unique[0].abstract == "longer abstract"
+
+
+def test_merge_papers_skips_seen():
+    unique, duplicates = merge_papers([Paper(title="Deep Learning")], seen={("title", normalize_title("deep learning"))})
+    assert unique == []
+    assert duplicates == 1
+
+
+def test_federated_search_slow_source_times_out():
+    fast = MagicMock()
+    fast.invoke.return_value = ARXIV_OUTPUT
+    slow = MagicMock()
+    slow.invoke.side_effect = lambda q: time.sleep(2) or ARXIV_OUTPUT
+
+    start = time.monotonic()
+    result = federated_search(["q1", "q2"], {"fast": fast, "slow": slow}, timeouts={"fast": 1.0, "slow": 0.2})
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 1.0
+    assert result.sources["slow"].timeouts == 2
+    assert result.sources["fast"].results == 4
+    assert len(result.papers) == 2
+    assert result.duplicates == 2
+
+
+def test_hung_source_is_skipped_instead_of_queueing_later_searches():
+    release = threading.Event()
+    hung = MagicMock()
+    hung.invoke.side_effect = lambda q: release.wait(5) and ARXIV_OUTPUT
+    fast = MagicMock()
+    fast.invoke.return_value = ARXIV_OUTPUT
+    queries = [f"q{i}" for i in range(MAX_SOURCE_WORKERS)]
+    try:
+        first = federated_search(queries, {"hung": hung, "fast": fast}, timeouts=0.1)
+        start = time.monotonic()
+        second = federated_search(["q"], {"hung": hung, "fast": fast}, timeouts=1.0)
+        elapsed = time.monotonic() - start
+    finally:
+        release.set()
+
+    assert first.sources["hung"].timeouts == MAX_SOURCE_WORKERS
+    # Every thread of the hung source is still taken, so it is not called again
+    assert second.sources["hung"].skipped == 1
+    assert hung.invoke.call_count == MAX_SOURCE_WORKERS
+    assert second.sources["fast"].results == 2
+    assert elapsed < 0.5
+
+
+def test_cancelled_call_releases_its_slot():
+    pool = SourcePool("test", workers=1)
+    release = threading.Event()
+    # Take the only thread without a slot, so the next call waits in the queue
+    pool._executor.submit(release.wait, 5)
+    try:
+        queued = pool.submit(lambda: "queued")
+        assert pool.submit(lambda: "refused") is None
+
+        assert queued.cancel()
+        retried = pool.submit(lambda: "retried")
+        assert retried is not None
+    finally:
+        release.set()
+    assert retried.result(timeout=5) == "retried"
@@ -0,0 +1,34 @@
+import numpy as np
+
+from agent.similarity import as_matrix, cosine_similarity_matrix, novelty, select_novel
+
+
+def test_cosine_similarity_matrix():
+    a = np.array([[1.0, 0.0], [0.0, 2.0]])
+    b = np.array([[3.0, 0.0], [0.0, 0.0]])
+    np.testing.assert_allclose(cosine_similarity_matrix(a, b), [[1.0, 0.0], [0.0, 0.0]])
+
+
+def test_select_novel_against_prior_and_within_batch():
+    prior = [[1.0, 0.0, 0.0]]
+    new = [[0.99, 0.1, 0.0], [0.0, 1.0, 0.0], [0.0, 0.98, 0.1], [0.0, 0.0, 1.0]]
+    novel, duplicates = select_novel(new, prior, threshold=0.9)
+    assert novel == [1, 3]
+    assert duplicates == [0, 2]
+
+
+def test_select_novel_without_prior():
+    novel, duplicates = select_novel([[1.0, 0.0]], [], threshold=0.9)
+    assert novel == [0]
+    assert duplicates == []
+
+
+def test_novelty():
+    prior = [[1.0, 0.0, 0.0]]
+    assert novelty([[0.99, 0.1, 0.0], [0.0, 1.0, 0.0]], prior, threshold=0.9) == 0.5
+    assert novelty([], prior, threshold=0.9) == 0.0
+    assert novelty([[0.0, 1.0, 0.0]], [], threshold=0.9) == 1.0
+
+
+def test_as_matrix_empty():
+    assert as_matrix([], dim=4).shape == (0, 4)
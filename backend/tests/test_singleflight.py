@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent.metrics import metrics
+from agent.singleflight import RedisSingleFlight, SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch(doi):
+        calls.append(doi)
+        release.wait(5)
+        return f"url for {doi}"
+
+    before = metrics.counter("singleflight_coalesced", namespace="unpaywall")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(group.do, "unpaywall", "10.1/x", fetch, "10.1/x") for _ in range(4)]
+        while metrics.counter("singleflight_coalesced", namespace="unpaywall") < before + 3:
+            time.sleep(0.01)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert calls == ["10.1/x"]
+    assert results == ["url for 10.1/x"] * 4
+
+
+def test_failures_reach_waiters_and_are_not_kept():
+    group = SingleFlight()
+    fn = MagicMock(side_effect=[RuntimeError("boom"), "ok"])
+
+    with pytest.raises(RuntimeError):
+        group.do("search:arxiv", "q", fn)
+
+    assert group.do("search:arxiv", "q", fn) == "ok"
+    assert fn.call_count == 2
+
+
+def test_completed_calls_are_not_cached():
+    group = SingleFlight()
+    fn = MagicMock(return_value="result")
+
+    group.do("embeddings", "k", fn)
+    group.do("embeddings", "k", fn)
+
+    assert fn.call_count == 2
+
+
+def test_redis_owner_runs_and_publishes_the_result():
+    client = MagicMock()
+    client.set.return_value = True
+    client.get.return_value = None
+    group = RedisSingleFlight(client)
+
+    assert group.do("pdf_text", "http://a/b.pdf", lambda: "text") == "text"
+
+    result_call = client.set.call_args_list[-1]
+    assert result_call.args[0].startswith("singleflight:result:pdf_text:")
+    assert json.loads(result_call.args[1]) == "text"
+    client.register_script.return_value.assert_called_once()
+
+
+def test_redis_waiter_takes_another_workers_result():
+    client = MagicMock()
+    client.set.return_value = False
+    client.get.return_value = json.dumps(["hit"]).encode()
+    fn = MagicMock()
+    group = RedisSingleFlight(client)
+
+    assert group.do("search:arxiv", "q", fn) == ["hit"]
+    fn.assert_not_called()
+
+
+def test_redis_waiter_falls_back_to_a_direct_call():
+    client = MagicMock()
+    client.set.return_value = False
+    client.get.return_value = None
+    group = RedisSingleFlight(client, wait_timeout=0)
+    assert group.do("unpaywall", "10.1/x", lambda: "direct") == "direct"
+
+    client.set.side_effect = ConnectionError("redis down")
+    assert group.do("unpaywall", "10.1/x", lambda: "direct") == "direct"
+
+
+class FakeRedis:
+    """Just enough of a Redis client for single-flight locks, shared like a server."""
+
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def register_script(self, script):
+        def release(keys, args):
+            if self.values.get(keys[0]) == args[0]:
+                del self.values[keys[0]]
+        return release
+
+
+def test_redis_waiter_reads_a_result_published_between_polls():
+    server = FakeRedis()
+    group = RedisSingleFlight(server)
+    lock_key, results = group._keys("unpaywall", "10.1/x")
+    server.set(lock_key, "another-worker")
+    fn = MagicMock(return_value="direct")
+    outcomes = []
+
+    thread = threading.Thread(target=lambda: outcomes.append(group.do("unpaywall", "10.1/x", fn)))
+    thread.start()
+    time.sleep(0.02)
+    # The other worker publishes and releases its lock within one poll interval
+    server.set(f"{results}:another-worker", json.dumps("http://a/x.pdf"))
+    del server.values[lock_key]
+    thread.join(5)
+
+    assert outcomes == ["http://a/x.pdf"]
+    fn.assert_not_called()
+
+
+def test_redis_caller_after_the_owner_finished_calls_again():
+    server = FakeRedis()
+    first, second = RedisSingleFlight(server), RedisSingleFlight(server)
+    fn = MagicMock(side_effect=["old", "new"])
+
+    assert first.do("unpaywall", "10.1/x", fn) == "old"
+    # The published result only serves callers that waited for it
+    assert second.do("unpaywall", "10.1/x", fn) == "new"
+    assert fn.call_count == 2
@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from agent.database import Base, Document, SessionLocal, hybrid_query_documents, init_db
+from agent.snapshot import ANN_INDEX, MANIFEST, ann_index, export_corpus, import_corpus
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_database():
+    init_db()
+    yield
+    Base.metadata.drop_all(bind=create_engine(os.getenv("POSTGRES_URI")))
+
+
+@pytest.fixture
+def db_session():
+    session = SessionLocal()
+    yield session
+    session.query(Document).delete()
+    session.commit()
+    session.close()
+
+
+def unit(i):
+    vector = np.zeros(1024, dtype=np.float32)
+    vector[i] = 1.0
+    vector[i + 1] = 0.5
+    return vector.tolist()
+
+
+def test_export_and_import_round_trip(db_session, tmp_path):
+    db_session.add_all([
+        Document(content="sparse attention for long documents", embedding=unit(0), collection_id="a", source_url="http://a/1"),
+        Document(content="protein folding with diffusion", embedding=unit(2), collection_id="a"),
+        Document(content="not embedded yet", embedding=None, collection_id="a"),
+        Document(content="another corpus", embedding=unit(4), collection_id="b"),
+    ])
+    db_session.commit()
+    before = {d.id: (d.content, d.source_url, None if d.embedding is None else list(d.embedding))
+              for d in db_session.query(Document).filter(Document.collection_id == "a")}
+
+    assert export_corpus(str(tmp_path), ["a"], batch_size=2).rows == 3
+    db_session.query(Document).delete()
+    db_session.commit()
+    copied = []
+    assert import_corpus(str(tmp_path), batch_size=2, progress=lambda done, total: copied.append((done, total))).rows == 3
+    assert copied == [(2, 3), (3, 3)]
+
+    db_session.expire_all()
+    after = {d.id: (d.content, d.source_url, None if d.embedding is None else list(d.embedding))
+             for d in db_session.query(Document)}
+    assert after == before
+    indexes = {row[0] for row in db_session.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'documents'"))}
+    assert {"ix_documents_embedding_hnsw", "ix_documents_content_tsv"} <= indexes
+    [(document, _)] = hybrid_query_documents("sparse attention", unit(0), k=1, collection_id="a")
+    assert document.source_url == "http://a/1"
+
+
+def test_import_keeps_existing_rows(db_session, tmp_path):
+    db_session.add(Document(content="kept", embedding=unit(0), collection_id="a"))
+    db_session.commit()
+    export_corpus(str(tmp_path))
+
+    assert import_corpus(str(tmp_path), build_ann_index=False).rows == 0
+    assert db_session.query(Document).count() == 1
+
+
+def test_import_rejects_other_dimensions(tmp_path):
+    (tmp_path / MANIFEST).write_text(json.dumps({"format": "agent-corpus", "version": 1, "rows": 0, "dimensions": 768}))
+
+    with pytest.raises(ValueError):
+        import_corpus(str(tmp_path))
+
+
+def test_ann_index_matches_the_quantization():
+    assert ann_index(None) == ANN_INDEX
+    assert "halfvec_cosine_ops" in ann_index("halfvec")
+    assert "bit_hamming_ops" in ann_index("binary")
+    with pytest.raises(ValueError):
+        ann_index("int8")
+
+
+def test_snapshot_functions_print_nothing(db_session, tmp_path, capsys):
+    db_session.add(Document(content="quiet", embedding=unit(0), collection_id="a"))
+    db_session.commit()
+
+    export_corpus(str(tmp_path))
+    import_corpus(str(tmp_path), build_ann_index=False)
+
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,82 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from agent.static_files import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    PrecompressedStaticFiles,
+    accepted_encodings,
+    cache_control,
+)
+
+BUNDLE = "assets/index-BXk2a9_Q.js"
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "assets").mkdir()
+    bundle = b"console.log('hello');" * 100
+    (tmp_path / BUNDLE).write_bytes(bundle)
+    (tmp_path / f"{BUNDLE}.gz").write_bytes(gzip.compress(bundle))
+    (tmp_path / f"{BUNDLE}.br").write_bytes(b"fake brotli payload")
+    (tmp_path / "index.html").write_text("<html></html>")
+    app = Starlette(routes=[Mount("/app", PrecompressedStaticFiles(directory=tmp_path, html=True))])
+    return TestClient(app)
+
+
+def test_accepted_encodings_skips_refused_codings():
+    assert accepted_encodings("gzip, deflate, br;q=0") == ["gzip", "deflate"]
+    assert accepted_encodings("br;q=0.5, gzip;q=1.0") == ["br", "gzip"]
+    assert accepted_encodings("") == []
+
+
+def test_cache_control_policy():
+    assert cache_control(f"/srv/dist/{BUNDLE}") == IMMUTABLE_CACHE_CONTROL
+    assert cache_control("/srv/dist/index.html") == REVALIDATE_CACHE_CONTROL
+    assert cache_control("/srv/dist/favicon.svg") == REVALIDATE_CACHE_CONTROL
+
+
+def test_serves_brotli_when_accepted(client):
+    response = client.get(f"/app/{BUNDLE}", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["content-length"] == str(len(b"fake brotli payload"))
+    assert response.headers["content-type"].startswith("text/javascript")
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_serves_gzip_and_identity(client):
+    gzipped = client.get(f"/app/{BUNDLE}", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.content == b"console.log('hello');" * 100
+
+    plain = client.get(f"/app/{BUNDLE}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert plain.headers["etag"] != gzipped.headers["etag"]
+
+
+def test_etag_revalidation_per_encoding(client):
+    first = client.get(f"/app/{BUNDLE}", headers={"Accept-Encoding": "gzip"})
+
+    cached = client.get(
+        f"/app/{BUNDLE}", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]}
+    )
+
+    assert cached.status_code == 304
+    assert cached.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_index_is_revalidated(client):
+    response = client.get("/app/", headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    assert "content-encoding" not in response.headers
+    assert client.get("/app/", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
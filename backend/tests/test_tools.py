@@ -1,6 +1,8 @@
+import time
 import pytest
 from unittest.mock import patch, MagicMock
 import pandas as pd
+from agent.metrics import metrics
 from agent.tools_and_schemas import arxiv_tool, pubmed_tool, unpaywall_tool, zotero_tool
 
 @patch('agent.tools_and_schemas.arxiv_tool._run')
@@ -252,3 +254,20 @@ def test_pubmed_search_api_error(mock_pubmed_run):
     with pytest.raises(Exception, match="API Error"):
         pubmed_tool.invoke(query)
     mock_pubmed_run.assert_called_once_with(query)
+
+
+@patch('agent.resilience.hedge_delay', return_value=0.05)
+@patch('agent.tools_and_schemas.ArxivQueryRun._run', return_value="Published: 2024-01-01")
+@patch('agent.tools_and_schemas.acquire', side_effect=lambda provider: time.sleep(0.2))
+def test_rate_limit_wait_is_not_hedged(mock_acquire, mock_arxiv_query_run, mock_hedge_delay):
+    """
+    Tests that waiting for a rate-limit token happens before the hedged call, so it neither hedges nor counts as latency.
+    """
+    before = metrics.counter("hedges_sent", host="export.arxiv.org")
+
+    for query in ["q1", "q2", "q3"]:
+        arxiv_tool.invoke(query)
+
+    assert mock_acquire.call_count == 3
+    assert mock_arxiv_query_run.call_count == 3
+    assert metrics.counter("hedges_sent", host="export.arxiv.org") == before
@@ -0,0 +1,142 @@
+import os
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+
+from agent.database import Base, Document, SessionLocal, init_db
+from agent.vector_index import VectorIndex, VectorIndexCache
+
+
+# Only the tests that read Postgres request it; the rest are pure NumPy
+@pytest.fixture(scope="module")
+def setup_database():
+    init_db()
+    yield
+    Base.metadata.drop_all(bind=create_engine(os.getenv("POSTGRES_URI")))
+
+
+@pytest.fixture
+def db_session(setup_database):
+    session = SessionLocal()
+    yield session
+    session.query(Document).delete()
+    session.commit()
+    session.close()
+
+
+def unit(i, dimensions=1024):
+    vector = np.zeros(dimensions, dtype=np.float32)
+    vector[i] = 1.0
+    vector[i + 1] = 0.5
+    return vector.tolist()
+
+
+def test_search_matches_brute_force_cosine():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(3000, 16)).astype(np.float32)
+    index = VectorIndex(dimensions=16, capacity=8)
+    for start in range(0, len(vectors), 1000):
+        batch = vectors[start : start + 1000]
+        index.add([str(i) for i in range(start, start + len(batch))], ["x"] * len(batch), [None] * len(batch), batch)
+    query = rng.normal(size=16)
+
+    results = index.search(query, k=10)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+    assert [row for row, _ in results] == expected.tolist()
+    distances = [distance for _, distance in results]
+    assert distances == sorted(distances)
+    assert index.search(query, k=5000)[0] == results[0]
+
+
+def test_saved_index_is_memory_mapped_and_still_grows(tmp_path):
+    index = VectorIndex(dimensions=4)
+    index.add(["a", "b"], ["first", "second"], ["http://x", None], [[1, 0, 0, 0], [0, 1, 0, 0]])
+    index.save(str(tmp_path))
+
+    loaded = VectorIndex.load(str(tmp_path))
+    assert isinstance(loaded._matrix, np.memmap)
+    assert loaded.search([0, 1, 0, 0], k=1) == [(1, 0.0)]
+    loaded.add(["c"], ["third"], [None], [[0, 0, 1, 0]])
+    assert [loaded.ids[row] for row, _ in loaded.search([0, 0, 1, 0], k=1)] == ["c"]
+    assert VectorIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_cache_loads_from_postgres_and_tracks_ingest(db_session, tmp_path):
+    db_session.add_all([
+        Document(content="sparse attention", embedding=unit(0), collection_id="a", source_url="http://a/1"),
+        Document(content="protein folding", embedding=unit(2), collection_id="a"),
+        Document(content="not embedded yet", embedding=None, collection_id="a"),
+        Document(content="another corpus", embedding=unit(4), collection_id="b"),
+    ])
+    db_session.commit()
+    cache = VectorIndexCache(directory=str(tmp_path))
+
+    [document] = cache.query_documents(unit(2), k=1, collection_id="a")
+    assert (document.content, document.collection_id) == ("protein folding", "a")
+    assert len(cache.get("a")) == 2
+
+    db_session.add(Document(content="new chunk", embedding=unit(6), collection_id="a", source_url="http://a/2"))
+    db_session.commit()
+    cache.add("a", [uuid.uuid4()], ["new chunk"], ["http://a/2"], [unit(6)])
+    assert [d.content for d in cache.query_documents(unit(6), k=1, collection_id="a")] == ["new chunk"]
+    # Collections that are not loaded are left to the next load from Postgres
+    cache.add("b", [uuid.uuid4()], ["ignored"], [None], [unit(8)])
+    assert not cache.is_loaded("b")
+    # Adds reach the saved copy on flush, not one save per document
+    assert len(VectorIndex.load(cache._path("a"))) == 2
+    cache.flush()
+    assert len(VectorIndex.load(cache._path("a"))) == 3
+
+    # A fresh process answers from the saved copy while Postgres is unavailable
+    restarted = VectorIndexCache(directory=str(tmp_path))
+    with patch("agent.vector_index.get_engine", side_effect=ConnectionError("postgres down")):
+        assert [d.content for d in restarted.query_documents(unit(6), k=1, collection_id="a")] == ["new chunk"]
+
+
+def test_cache_reloads_an_index_another_worker_let_fall_behind(db_session):
+    db_session.add(Document(content="first", embedding=unit(0), collection_id="a"))
+    db_session.commit()
+    cache = VectorIndexCache(check_interval=0)
+    assert len(cache.get("a")) == 1
+
+    # Another worker ingests into the reused collection
+    db_session.add(Document(content="second", embedding=unit(2), collection_id="a"))
+    db_session.commit()
+
+    assert [d.content for d in cache.query_documents(unit(2), k=1, collection_id="a")] == ["second"]
+    assert len(cache.get("a")) == 2
+
+
+def test_cache_evicts_least_recently_used_collections():
+    # Each empty index holds a 1024 x 1024 float32 matrix, 4 MiB
+    cache = VectorIndexCache(max_bytes=8 * 1024 * 1024)
+    cache._insert("a", VectorIndex())
+    cache._insert("b", VectorIndex())
+    cache.get("a")
+    cache._insert("c", VectorIndex())
+
+    assert cache.is_loaded("a")
+    assert not cache.is_loaded("b")
+    assert cache.is_loaded("c")
+
+
+def test_multi_query_fuses_rankings_from_one_matrix_product():
+    cache = VectorIndexCache()
+    index = VectorIndex(dimensions=4)
+    index.add(
+        [str(uuid.UUID(int=i)) for i in range(3)],
+        ["first", "second", "both"],
+        [None] * 3,
+        [[1, 0, 0, 0], [0, 1, 0, 0], [1, 1, 0, 0]],
+    )
+    cache._insert("a", index)
+
+    assert index.search_many([[1, 0, 0, 0], [0, 1, 0, 0]], k=1) == [index.search([1, 0, 0, 0], k=1), index.search([0, 1, 0, 0], k=1)]
+    results = cache.multi_query_documents([[1, 0, 0, 0], [0, 1, 0, 0], [1, 1, 0, 0]], k=3, collection_id="a")
+    assert [document.content for document, _ in results][0] == "both"
+    assert len(results) == 3
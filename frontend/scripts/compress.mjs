@@ -0,0 +1,43 @@
+// Writes .br and .gz variants next to every compressible file in dist/ so the
+// backend can serve them without compressing on each request.
+import { readdir, readFile, stat, writeFile } from "node:fs/promises";
+import path from "node:path";
+import { fileURLToPath } from "node:url";
+import { brotliCompressSync, constants, gzipSync } from "node:zlib";
+
+const distDir = path.resolve(path.dirname(fileURLToPath(import.meta.url)), "../dist");
+const compressible = /\.(html|js|mjs|css|json|svg|txt|map|xml|wasm)$/;
+// Tiny files gain nothing from compression
+const minBytes = 1024;
+
+async function* walk(dir) {
+  for (const entry of await readdir(dir, { withFileTypes: true })) {
+    const entryPath = path.join(dir, entry.name);
+    if (entry.isDirectory()) yield* walk(entryPath);
+    else yield entryPath;
+  }
+}
+
+let original = 0;
+let brotli = 0;
+let gzip = 0;
+for await (const file of walk(distDir)) {
+  if (!compressible.test(file) || (await stat(file)).size < minBytes) continue;
+  const content = await readFile(file);
+  const br = brotliCompressSync(content, {
+    params: {
+      [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+      [constants.BROTLI_PARAM_SIZE_HINT]: content.length,
+    },
+  });
+  const gz = gzipSync(content, { level: 9 });
+  // Only keep a variant that is actually smaller
+  if (br.length < content.length) await writeFile(`${file}.br`, br);
+  if (gz.length < content.length) await writeFile(`${file}.gz`, gz);
+  original += content.length;
+  brotli += Math.min(br.length, content.length);
+  gzip += Math.min(gz.length, content.length);
+}
+
+const kb = (bytes) => `${(bytes / 1024).toFixed(1)} kB`;
+console.log(`Precompressed ${kb(original)} -> brotli ${kb(brotli)}, gzip ${kb(gzip)}`);